@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+    Benchmarks of the hot paths, runnable without hardware.
+    Frames come either from memory or from the PMS5003 emulator on a
+    pseudo-terminal. Results can be written as JSON to compare releases.
+"""
+
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+
+import plantower
+from plantower.emulator import PMS5003Emulator, RandomWalk, encode_frame
+from dust_sensor_utils_mono import DustSensorUtilsMono
+
+FRAME_POOL_SIZE = 1024
+NOWCAST_WINDOW_SIZES = (60, 600, 3600, 36000)
+
+
+class FrameSource:
+    """
+        Stands in for Plantower and returns readings from pre-built frames
+    """
+    def __init__(self, frames):
+        self._frames = frames
+        self._index = 0
+
+    def read(self, perform_flush=True):
+        frame = self._frames[self._index % len(self._frames)]
+        self._index += 1
+        return plantower.PlantowerReading(frame)
+
+    def stream(self, batch=False):
+        while True:
+            reading = self.read()
+            yield [reading] if batch else reading
+
+
+def make_frames(count=FRAME_POOL_SIZE):
+    values = RandomWalk(seed=0)
+    return [encode_frame(values()) for _ in range(count)]
+
+
+def timed_loop(func, duration):
+    # Calls func repeatedly for about duration seconds, returns calls per second
+    count = 0
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        for _ in range(100):
+            func()
+        count += 100
+        now = time.perf_counter()
+        if now >= end:
+            return count / (now - start)
+
+
+def bench_reading(frames, duration):
+    it = iter(range(sys.maxsize))
+    def build():
+        plantower.PlantowerReading(frames[next(it) % len(frames)])
+    def build_and_format():
+        str(plantower.PlantowerReading(frames[next(it) % len(frames)]))
+    return {
+        "readings_per_sec": timed_loop(build, duration),
+        "formatted_readings_per_sec": timed_loop(build_and_format, duration),
+    }
+
+
+def bench_parser(frames, duration):
+    data = b"".join(frames)
+    parser = plantower.PlantowerFrameParser()
+    def parse():
+        parser.feed(data)
+        for _ in parser.frames():
+            pass
+    return {"frames_per_sec": timed_loop(parse, duration) * len(frames)}
+
+
+def bench_verify(pt, frames, duration):
+    it = iter(range(sys.maxsize))
+    def verify():
+        pt._verify(frames[next(it) % len(frames)])
+    return {"verifies_per_sec": timed_loop(verify, duration)}
+
+
+def bench_serial_read(pt, duration):
+    return {"frames_per_sec": timed_loop(lambda: pt.read(False), duration)}
+
+
+def bench_serial_stream(pt, duration):
+    stream = pt.stream()
+    results = {"frames_per_sec": timed_loop(lambda: next(stream), duration)}
+    results["max_backlog"] = pt.stream_stats.max_backlog
+    return results
+
+
+def bench_read_sample(frames, duration):
+    utils = DustSensorUtilsMono(FrameSource(frames), background_updates=False)
+    return {"samples_per_sec": timed_loop(utils.read_sample, duration)}
+
+
+def bench_nowcast(duration):
+    results = {}
+    utils = DustSensorUtilsMono(FrameSource(make_frames(1)), background_updates=False)
+    base = datetime.now(timezone.utc)
+    values = RandomWalk(seed=1)
+    for size in NOWCAST_WINDOW_SIZES:
+        # Start well after the previous run so its samples leave the window
+        base += timedelta(seconds=2 * utils.MEASUREMENT_WINDOW_LENGTH_SEC)
+        step = timedelta(seconds=utils.MEASUREMENT_WINDOW_LENGTH_SEC / size)
+        for i in range(size):
+            utils._add_pm25_reading(base + i * step, values()[1])
+        calls_per_sec = timed_loop(utils._calculate_nowcast_aqi, duration / len(NOWCAST_WINDOW_SIZES))
+        results[str(size)] = {"latency_us": 1e6 / calls_per_sec}
+    return results
+
+
+def bench_memory(frames):
+    tracemalloc.start()
+    utils = DustSensorUtilsMono(FrameSource(frames), background_updates=False)
+    before, _ = tracemalloc.get_traced_memory()
+    for _ in range(utils.MAX_QUEUE_LENGTH):
+        utils.read_sample()
+    after_samples, _ = tracemalloc.get_traced_memory()
+    now = datetime.now(timezone.utc)
+    for i in range(utils.MAX_AQI_QUEUE_LENGTH):
+        utils._add_pm25_reading(now + timedelta(seconds=i), i % 50)
+        utils.update_aqi()
+    after_aqi, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "bytes_per_sample": (after_samples - before) / utils.MAX_QUEUE_LENGTH,
+        "bytes_per_aqi_point": (after_aqi - after_samples) / utils.MAX_AQI_QUEUE_LENGTH,
+        "store_bytes_per_sample": utils._samples.nbytes / utils._samples.capacity,
+        "store_bytes_per_aqi_point": utils._aqi_series.nbytes / utils._aqi_series.capacity,
+    }
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the plantower hot paths")
+    parser.add_argument(
+        "--duration", type=float, default=1.0,
+        help="Seconds spent on each measurement")
+    parser.add_argument(
+        "--json", metavar="FILE",
+        help="Write the results as JSON to FILE, - for stdout")
+    parser.add_argument(
+        "--no-serial", action="store_true",
+        help="Skip the benchmarks that need a pseudo-terminal")
+    args = parser.parse_args()
+
+    frames = make_frames()
+    results = {
+        "reading": bench_reading(frames, args.duration),
+        "parser": bench_parser(frames, args.duration),
+        "read_sample": bench_read_sample(frames, args.duration),
+        "nowcast": bench_nowcast(args.duration),
+        "memory": bench_memory(frames),
+    }
+    if not args.no_serial:
+        with PMS5003Emulator(rate=None) as emulator:
+            pt = plantower.Plantower(emulator.port)
+            results["verify"] = bench_verify(pt, frames, args.duration)
+            results["serial_read"] = bench_serial_read(pt, args.duration)
+            results["serial_stream"] = bench_serial_stream(pt, args.duration)
+            pt.serial.close()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        for group, values in results.items():
+            for name, value in values.items():
+                if isinstance(value, dict):
+                    for key, number in value.items():
+                        print(f"{group}.{name}.{key}: {number:.2f}")
+                else:
+                    print(f"{group}.{name}: {value:.2f}")
+
+
+if __name__ == "__main__":
+    main()
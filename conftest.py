@@ -0,0 +1,6 @@
+"""
+    test.py, test_passive.py and test_passive_sleep.py are scripts driving a
+    real sensor, not unit tests, and wait for one as soon as they are imported
+"""
+
+collect_ignore = ["test.py", "test_passive.py", "test_passive_sleep.py"]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+    Reads one plantower sensor and publishes its series and AQI in shared
+    memory, for dust_sensor_mono.py --shared-memory. Does not import matplotlib,
+    so it stays small and starts quickly.
+"""
+
+from argparse import ArgumentParser
+import signal
+import sys
+from dust_sensor_utils_mono import DustSensorUtilsMono
+from shared_view import DEFAULT_SHARED_MEMORY_NAME
+from plantower.metrics import Metrics
+from plantower.broker import BrokerSubscriber, DEFAULT_SOCKET_PATH
+
+
+def main():
+    parser = ArgumentParser(description="Publish the data of one plantower sensor in shared memory")
+    parser.add_argument(
+        "--shared-memory", default=DEFAULT_SHARED_MEMORY_NAME, metavar="NAME",
+        help="Name of the shared memory block")
+    parser.add_argument(
+        "--metrics-port", type=int,
+        help="Serve sensor and AQI metrics in the Prometheus text format on this local port")
+    parser.add_argument(
+        "--sensor-id",
+        help="USB identity of the sensor to use when several are plugged in, "
+             "as listed by python -m plantower.discovery")
+    parser.add_argument(
+        "--broker", nargs="?", const=DEFAULT_SOCKET_PATH, metavar="SOCKET",
+        help="Read from a broker started with python -m plantower.broker "
+             "instead of opening the serial port, from the --sensor-id sensor "
+             "or else the first one the broker sends")
+    args = parser.parse_args()
+
+    # Terminated by the plotting process, the block is removed on the way out
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    metrics = None
+    if args.metrics_port:
+        metrics = Metrics()
+        metrics.serve(args.metrics_port)
+    sensor = None
+    if args.broker:
+        sensor = BrokerSubscriber(args.broker, args.sensor_id, bind_first=True)
+    aq_utils = DustSensorUtilsMono(
+        sensor, metrics=metrics, sensor_id=args.sensor_id, shared_memory_name=args.shared_memory)
+
+    print(f"Publishing to shared memory {args.shared_memory}")
+    try:
+        while True:
+            aq_utils.read_sample()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        aq_utils.shared_view.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+    Recomputes the AQI history and statistics of recordings, one per sensor,
+    using every core
+"""
+
+from argparse import ArgumentParser
+import os
+import time
+from plantower.analysis import analyse, DEFAULT_CHUNK_SEC
+
+
+def main():
+    parser = ArgumentParser(description="Compute the AQI history and statistics of plantower recordings")
+    parser.add_argument("recordings", nargs="+", help="Files written by plantower.recorder.FrameRecorder")
+    parser.add_argument(
+        "--workers", type=int,
+        help="Number of worker processes, all cores by default")
+    parser.add_argument(
+        "--chunk-hours", type=float, default=DEFAULT_CHUNK_SEC / 3600,
+        help="Length of the chunks processed by each worker")
+    parser.add_argument("--csv-dir", help="Write the AQI history of every recording to a CSV file in this directory")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    analyses = analyse(args.recordings, chunk_sec=args.chunk_hours * 3600, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    for path, analysis in analyses.items():
+        aqi = analysis.fields["aqi"]
+        pm25 = analysis.fields["pm25_cf1"]
+        print(f"{path}: {pm25.count} samples, {analysis.bad_frames} bad frames | "
+              f"PM2.5 mean {pm25.mean:.2f} max {pm25.max:.0f} | AQI mean {aqi.mean:.2f} max {aqi.max:.1f}")
+        if args.csv_dir:
+            name = os.path.splitext(os.path.basename(path))[0] + "_aqi.csv"
+            with open(os.path.join(args.csv_dir, name), "w") as csv:
+                csv.write("timestamp,aqi\n")
+                for row in analysis.aqi:
+                    if row["aqi"] == row["aqi"]:  # Not NaN
+                        csv.write(f"{row['timestamp']},{row['aqi']}\n")
+    print(f"Analysed {len(analyses)} recordings in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
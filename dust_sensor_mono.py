@@ -3,22 +3,24 @@
     Basic test script to demonstrate active mode of the plantower
 """
 
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+import threading as th
+import time
+from types import SimpleNamespace
+import numpy as np
 from dust_sensor_utils_mono import DustSensorUtilsMono
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from statistics import mean
+from plot_renderer import BlitRenderer, decimate_minmax
+from plantower.metrics import Metrics
+from plantower.broker import BrokerSubscriber, DEFAULT_SOCKET_PATH
+from shared_view import LiveViewReader, DEFAULT_SHARED_MEMORY_NAME, remove_stale
 
 
-aq_utils = DustSensorUtilsMono()
-
-# Set up the plot
-matplotlib.use('TkAgg')
-plt.ion()  # Turn on interactive mode for real-time updates
-
-fig_aqi, ax_aqi = plt.subplots(figsize=(12, 6))
-
-line_aqi, = ax_aqi.plot([], [], 'b-', linewidth=2, label='AQI')
 # Define AQI thresholds and colors
 thresholds = {
         'Good': (0, 50, '#00E400'),
@@ -28,47 +30,6 @@ thresholds = {
         'Very Unhealthy': (201, 300, '#8F3F97'),
         'Hazardous': (301, 500, '#7E0023')
     }
-    
-# Fill threshold regions
-yaxis_ticks = [0]
-for label, (low, high, color) in thresholds.items():
-    ax_aqi.axhspan(low, high, alpha=0.2, color=color, label=label)
-    # Calculate middle position for text
-    yaxis_ticks.append(high)
-    # add text label
-    y_pos = (low + high) / 2
-    ax_aqi.text(0.02, y_pos, label, verticalalignment='center', 
-                fontweight='bold', fontsize=8, color='black',
-                transform=ax_aqi.get_yaxis_transform(),
-                bbox=dict(facecolor='white', edgecolor='none', alpha=0.7, pad=2))
-    
-# Customize the plot
-ax_aqi.set_ylabel('Air Quality Index (AQI)')
-ax_aqi.set_xlabel('Time')
-ax_aqi.grid(True, linestyle='--', alpha=0.7)
-ax_aqi.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-
-# Set y-axis limits to cover all AQI ranges
-ax_aqi.set_yticks(yaxis_ticks)
-ax_aqi.set_ylim(0, 500)
-
-# plot for PM and number of particles
-fig, (ax, ax_bottom) = plt.subplots(2, 1, figsize=(10, 8))
-
-# Particulate Matter
-line_pm1_cf1, = ax.plot([], [], label='PM1.0 (CF=1)', marker='o', color='blue')
-line_pm2_5_cf1, = ax.plot([], [], label='PM2.5 (CF=1)', marker='o', color='green')
-line_pm10_cf1, = ax.plot([], [], label='PM10 (CF=1)', marker='o', color='red')
-
-line_pm1_std, = ax.plot([], [], label='PM1.0 (ATM)', marker='s', color='blue')
-line_pm2_5_std, = ax.plot([], [], label='PM2.5 (ATM)', marker='s', color='green')
-line_pm10_std, = ax.plot([], [], label='PM10 (ATM)', marker='s', color='red')
-
-ax.set_xlabel('Time')
-ax.set_ylabel('Concentration (μg/m³)')
-ax.set_title('Real-Time Time Series of PM Concentrations ' + aq_utils.aqi)
-ax.legend(loc='lower left')
-ax.grid(True)
 
 # Particle Count
 PARTICLE_CONFIG = {
@@ -79,56 +40,106 @@ PARTICLE_CONFIG = {
     ">5.0um": "orange",
     ">10um": "brown"
 }
-line_pc = {}
-for size, color in PARTICLE_CONFIG.items():
-    line_pc[size], = ax_bottom.plot([], [],  label=size, marker='.', color=color)
-
-ax_bottom.set_xlabel('Time')
-ax_bottom.set_ylabel('Number of Particles (in 0.1L)')
-ax_bottom.set_title(f'Particle Count Distribution | {aq_utils.elapsed_time} | Samples {aq_utils.sample_count}')
-ax_bottom.legend(loc='lower left')
-ax_bottom.grid(True)
-
-# Format the x-axis for time
-ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-ax_bottom.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-plt.tight_layout()
-
-#actually do the reading
-print("Start reading data")
-try:
+
+DEFAULT_RENDER_FPS = 2
+ACQUISITION_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dust_sensor_acquire.py")
+ATTACH_TIMEOUT_SEC = 30 # How long the acquisition process has to create the shared memory
+
+
+def create_aqi_figure():
+    fig_aqi, ax_aqi = plt.subplots(figsize=(12, 6))
+
+    line_aqi, = ax_aqi.plot([], [], 'b-', linewidth=2, label='AQI')
+
+    # Fill threshold regions
+    yaxis_ticks = [0]
+    for label, (low, high, color) in thresholds.items():
+        ax_aqi.axhspan(low, high, alpha=0.2, color=color, label=label)
+        # Calculate middle position for text
+        yaxis_ticks.append(high)
+        # add text label
+        y_pos = (low + high) / 2
+        ax_aqi.text(0.02, y_pos, label, verticalalignment='center',
+                    fontweight='bold', fontsize=8, color='black',
+                    transform=ax_aqi.get_yaxis_transform(),
+                    bbox=dict(facecolor='white', edgecolor='none', alpha=0.7, pad=2))
+
+    # Customize the plot
+    ax_aqi.set_ylabel('Air Quality Index (AQI)')
+    ax_aqi.set_xlabel('Time')
+    ax_aqi.grid(True, linestyle='--', alpha=0.7)
+    ax_aqi.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+
+    # Set y-axis limits to cover all AQI ranges
+    ax_aqi.set_yticks(yaxis_ticks)
+    ax_aqi.set_ylim(0, 500)
+    return fig_aqi, ax_aqi, line_aqi
+
+
+def create_pm_figure(aq_utils):
+    # plot for PM and number of particles
+    fig, (ax, ax_bottom) = plt.subplots(2, 1, figsize=(10, 8))
+
+    # Particulate Matter
+    lines_pm = {}
+    lines_pm['pm1_cf1'], = ax.plot([], [], label='PM1.0 (CF=1)', marker='o', color='blue')
+    lines_pm['pm2_5_cf1'], = ax.plot([], [], label='PM2.5 (CF=1)', marker='o', color='green')
+    lines_pm['pm10_cf1'], = ax.plot([], [], label='PM10 (CF=1)', marker='o', color='red')
+
+    lines_pm['pm1_std'], = ax.plot([], [], label='PM1.0 (ATM)', marker='s', color='blue')
+    lines_pm['pm2_5_std'], = ax.plot([], [], label='PM2.5 (ATM)', marker='s', color='green')
+    lines_pm['pm10_std'], = ax.plot([], [], label='PM10 (ATM)', marker='s', color='red')
+
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Concentration (μg/m³)')
+    ax.set_title('Real-Time Time Series of PM Concentrations ' + aq_utils.aqi)
+    ax.legend(loc='lower left')
+    ax.grid(True)
+
+    line_pc = {}
+    for size, color in PARTICLE_CONFIG.items():
+        line_pc[size], = ax_bottom.plot([], [],  label=size, marker='.', color=color)
+
+    ax_bottom.set_xlabel('Time')
+    ax_bottom.set_ylabel('Number of Particles (in 0.1L)')
+    ax_bottom.set_title(f'Particle Count Distribution | {aq_utils.elapsed_time} | Samples {aq_utils.sample_count}')
+    ax_bottom.legend(loc='lower left')
+    ax_bottom.grid(True)
+
+    # Format the x-axis for time
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+    ax_bottom.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+    plt.tight_layout()
+    return fig, ax, ax_bottom, lines_pm, line_pc
+
+
+def set_titles(aq_utils, ax, ax_bottom, ax_aqi):
+    ax.set_title('Real-Time Time Series of PM Concentrations | ' + aq_utils.aqi)
+    ax_bottom.set_title(f'Particle Count Distribution | {aq_utils.elapsed_time} | Samples {aq_utils.sample_count}')
+    ax_aqi.set_title(f'{aq_utils.aqi} | {aq_utils.elapsed_time} | Samples {aq_utils.sample_count}')
+
+
+def run_redraw_every_sample(aq_utils, fig_aqi, ax_aqi, line_aqi, fig, ax, ax_bottom, lines_pm, line_pc):
+    # Draws everything after each sample, drawing runs at the sensor rate
+    plt.ion()  # Turn on interactive mode for real-time updates
     while True:
         aq_utils.read_sample()
 
         # Update the plot data
-        line_pm1_cf1.set_xdata(aq_utils.plot_timestamps)
-        line_pm1_cf1.set_ydata(aq_utils.pm1_cf1)
-        line_pm2_5_cf1.set_xdata(aq_utils.plot_timestamps)
-        line_pm2_5_cf1.set_ydata(aq_utils.pm2_5_cf1)
-        line_pm10_cf1.set_xdata(aq_utils.plot_timestamps)
-        line_pm10_cf1.set_ydata(aq_utils.pm10_cf1)
-
-        line_pm1_std.set_xdata(aq_utils.plot_timestamps)
-        line_pm1_std.set_ydata(aq_utils.pm1_std)
-        line_pm2_5_std.set_xdata(aq_utils.plot_timestamps)
-        line_pm2_5_std.set_ydata(aq_utils.pm2_5_std)
-        line_pm10_std.set_xdata(aq_utils.plot_timestamps)
-        line_pm10_std.set_ydata(aq_utils.pm10_std)
-
-        ax.set_title('Real-Time Time Series of PM Concentrations | ' + aq_utils.aqi)
-
-        # Adjust plot limits dynamically
-        ax.relim()
-        ax.autoscale_view()
+        for name, line in lines_pm.items():
+            line.set_xdata(aq_utils.plot_timestamps)
+            line.set_ydata(getattr(aq_utils, name))
 
         # Plot particle counts for different size ranges
         for size in aq_utils.PARTICLE_SIZES:
             line_pc[size].set_xdata(aq_utils.plot_timestamps)
             line_pc[size].set_ydata(aq_utils.particle_counts[size])
 
-        ax_bottom.set_title(f'Particle Count Distribution | {aq_utils.elapsed_time} | Samples {aq_utils.sample_count}')
+        set_titles(aq_utils, ax, ax_bottom, ax_aqi)
 
-        # Redraw the plot
+        # Adjust plot limits dynamically and redraw the plot
+        ax.relim()
+        ax.autoscale_view()
         ax_bottom.relim()
         ax_bottom.autoscale_view()
         fig.canvas.draw()
@@ -138,7 +149,6 @@ try:
         with aq_utils.lock:
             line_aqi.set_xdata(aq_utils.aqi_timestamps)
             line_aqi.set_ydata(aq_utils.plot_aqi)
-        ax_aqi.set_title(f'{aq_utils.aqi} | {aq_utils.elapsed_time} | Samples {aq_utils.sample_count}')
 
         # Redraw the plot
         ax_aqi.relim()
@@ -146,5 +156,198 @@ try:
         fig_aqi.canvas.draw()
         fig_aqi.canvas.flush_events()
 
-except KeyboardInterrupt:
-    print("Real-time plotting stopped.")
\ No newline at end of file
+
+def run_blit(aq_utils, fps, fig_aqi, ax_aqi, line_aqi, fig, ax, ax_bottom, lines_pm, line_pc):
+    # Acquisition runs in its own thread and never waits for drawing, which
+    # happens on a timer with only the lines and titles redrawn
+    def acquire():
+        while True:
+            aq_utils.read_sample()
+
+    th.Thread(target=acquire, daemon=True).start()
+
+    renderer = BlitRenderer(fig, list(lines_pm.values()) + list(line_pc.values()) + [ax.title, ax_bottom.title])
+    renderer_aqi = BlitRenderer(fig_aqi, [line_aqi, ax_aqi.title])
+
+    def draw_frame():
+        # Copy the views under the lock, the acquisition thread keeps writing
+        with aq_utils.lock:
+            timestamps = mdates.date2num(aq_utils.plot_timestamps)
+            pm = {name: getattr(aq_utils, name).copy() for name in lines_pm}
+            counts = {size: series.copy() for size, series in aq_utils.particle_counts.items()}
+            aqi_timestamps = mdates.date2num(aq_utils.aqi_timestamps)
+            aqi = aq_utils.plot_aqi.copy()
+
+        for name, line in lines_pm.items():
+            line.set_data(timestamps, pm[name])
+        for size, line in line_pc.items():
+            line.set_data(timestamps, counts[size])
+        # Long AQI histories are reduced to about one point per pixel
+        aqi_timestamps, aqi = decimate_minmax(aqi_timestamps, aqi, ax_aqi.get_window_extent().width)
+        line_aqi.set_data(aqi_timestamps, aqi)
+        set_titles(aq_utils, ax, ax_bottom, ax_aqi)
+
+        full = renderer.update_limits(ax, timestamps, np.concatenate(list(pm.values())))
+        full = renderer.update_limits(ax_bottom, timestamps, np.concatenate(list(counts.values()))) or full
+        renderer.render(full)
+        renderer_aqi.render(renderer_aqi.update_limits(ax_aqi, aqi_timestamps, aqi))
+
+    timer = fig.canvas.new_timer(interval=int(1000 / fps))
+    timer.add_callback(draw_frame)
+    timer.start()
+    plt.show()
+
+
+def start_acquisition(args):
+    # Runs dust_sensor_acquire.py, which never imports matplotlib, and maps
+    # the shared memory it publishes to
+    remove_stale(args.shared_memory)
+    command = [sys.executable, ACQUISITION_SCRIPT, "--shared-memory", args.shared_memory]
+    if args.metrics_port:
+        command += ["--metrics-port", str(args.metrics_port)]
+    if args.sensor_id:
+        command += ["--sensor-id", args.sensor_id]
+    if args.broker:
+        command += ["--broker", args.broker]
+    acquisition = subprocess.Popen(command)
+    deadline = time.monotonic() + ATTACH_TIMEOUT_SEC
+    while True:
+        try:
+            return acquisition, LiveViewReader(args.shared_memory)
+        except FileNotFoundError:
+            if acquisition.poll() is not None or time.monotonic() > deadline:
+                acquisition.terminate()
+                raise
+            time.sleep(0.1)
+
+
+def run_shared_view(acquisition, reader, fps, fig_aqi, ax_aqi, line_aqi, fig, ax, ax_bottom, lines_pm, line_pc):
+    # The acquisition process writes the series without ever waiting for
+    # this one. The lines get their data inside reader.read(), which runs
+    # again when a sample was written meanwhile, and recache() has
+    # matplotlib convert it before the shared views can change.
+    renderer = BlitRenderer(fig, list(lines_pm.values()) + list(line_pc.values()) + [ax.title, ax_bottom.title])
+    renderer_aqi = BlitRenderer(fig_aqi, [line_aqi, ax_aqi.title])
+    last_version = None
+
+    def set_lines(view):
+        samples = view["samples"]
+        timestamps = mdates.date2num(samples["timestamp"])
+        for name, line in lines_pm.items():
+            line.set_data(timestamps, samples[name])
+            line.recache(always=True)
+        for size, line in line_pc.items():
+            line.set_data(timestamps, samples[size])
+            line.recache(always=True)
+        aqi_series = view["aqi"]
+        line_aqi.set_data(*decimate_minmax(mdates.date2num(aqi_series["timestamp"]), aqi_series["aqi"], ax_aqi.get_window_extent().width))
+        line_aqi.recache(always=True)
+        return (timestamps,
+                np.concatenate([samples[name] for name in lines_pm]),
+                np.concatenate([samples[size] for size in line_pc]))
+
+    def draw_frame():
+        nonlocal last_version
+        if acquisition.poll() is not None:
+            print("Acquisition process stopped.")
+            plt.close("all")
+            return
+        version = reader.version
+        if version == last_version:
+            return # Nothing new since the last frame
+        try:
+            timestamps, pm, counts = reader.read(set_lines)
+            status = reader.status()
+        except TimeoutError:
+            return # Tried again on the next frame
+        last_version = version
+        set_titles(SimpleNamespace(**status), ax, ax_bottom, ax_aqi)
+
+        full = renderer.update_limits(ax, timestamps, pm)
+        full = renderer.update_limits(ax_bottom, timestamps, counts) or full
+        renderer.render(full)
+        aqi = line_aqi.get_xydata()
+        renderer_aqi.render(renderer_aqi.update_limits(ax_aqi, aqi[:, 0], aqi[:, 1]))
+
+    timer = fig.canvas.new_timer(interval=int(1000 / fps))
+    timer.add_callback(draw_frame)
+    timer.start()
+    plt.show()
+
+
+def main():
+    parser = ArgumentParser(description="Plot the data of one plantower sensor in real time")
+    parser.add_argument(
+        "--blit", action="store_true",
+        help="Read the sensor in a separate thread and only redraw the lines on a timer")
+    parser.add_argument(
+        "--fps", type=float, default=DEFAULT_RENDER_FPS,
+        help="Frame rate used with --blit and --shared-memory")
+    parser.add_argument(
+        "--metrics-port", type=int,
+        help="Serve sensor and AQI metrics in the Prometheus text format on this local port")
+    parser.add_argument(
+        "--sensor-id",
+        help="USB identity of the sensor to use when several are plugged in, "
+             "as listed by python -m plantower.discovery")
+    parser.add_argument(
+        "--broker", nargs="?", const=DEFAULT_SOCKET_PATH, metavar="SOCKET",
+        help="Read from a broker started with python -m plantower.broker "
+             "instead of opening the serial port, from the --sensor-id sensor "
+             "or else the first one the broker sends")
+    parser.add_argument(
+        "--shared-memory", nargs="?", const=DEFAULT_SHARED_MEMORY_NAME, metavar="NAME",
+        help="Read the sensor in a separate process, dust_sensor_acquire.py, which "
+             "publishes the data in shared memory, and redraw on a timer (--fps)")
+    args = parser.parse_args()
+
+    if args.shared_memory:
+        main_shared_view(args)
+        return
+
+    metrics = None
+    if args.metrics_port:
+        metrics = Metrics()
+        metrics.serve(args.metrics_port)
+    sensor = None
+    if args.broker:
+        sensor = BrokerSubscriber(args.broker, args.sensor_id, bind_first=True)
+    aq_utils = DustSensorUtilsMono(sensor, metrics=metrics, sensor_id=args.sensor_id)
+
+    # Set up the plot
+    matplotlib.use('TkAgg')
+    fig_aqi, ax_aqi, line_aqi = create_aqi_figure()
+    fig, ax, ax_bottom, lines_pm, line_pc = create_pm_figure(aq_utils)
+
+    #actually do the reading
+    print("Start reading data")
+    try:
+        if args.blit:
+            run_blit(aq_utils, args.fps, fig_aqi, ax_aqi, line_aqi, fig, ax, ax_bottom, lines_pm, line_pc)
+        else:
+            run_redraw_every_sample(aq_utils, fig_aqi, ax_aqi, line_aqi, fig, ax, ax_bottom, lines_pm, line_pc)
+    except KeyboardInterrupt:
+        print("Real-time plotting stopped.")
+
+
+def main_shared_view(args):
+    acquisition, reader = start_acquisition(args)
+    status = SimpleNamespace(**reader.status())
+
+    matplotlib.use('TkAgg')
+    fig_aqi, ax_aqi, line_aqi = create_aqi_figure()
+    fig, ax, ax_bottom, lines_pm, line_pc = create_pm_figure(status)
+
+    print("Start reading data")
+    try:
+        run_shared_view(acquisition, reader, args.fps, fig_aqi, ax_aqi, line_aqi, fig, ax, ax_bottom, lines_pm, line_pc)
+    except KeyboardInterrupt:
+        print("Real-time plotting stopped.")
+    finally:
+        acquisition.terminate()
+        acquisition.wait()
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+    Replays a recording through DustSensorUtilsMono to backtest the AQI computation
+"""
+
+from argparse import ArgumentParser
+import time
+from dust_sensor_utils_mono import DustSensorUtilsMono
+from plantower.replay import ReplayPlantower
+
+
+def main():
+    parser = ArgumentParser(description="Replay a plantower recording and compute the AQI")
+    parser.add_argument("recording", help="File written by plantower.recorder.FrameRecorder")
+    parser.add_argument(
+        "--speed", type=float, default=0,
+        help="Replay speed relative to real time, 0 (default) replays as fast as possible")
+    parser.add_argument("--csv", help="Write the AQI history to this CSV file")
+    args = parser.parse_args()
+
+    replay = ReplayPlantower(args.recording, speed=args.speed)
+    # AQI is computed after every sample rather than in a background thread,
+    # so the result does not depend on the replay speed
+    aq_utils = DustSensorUtilsMono(replay, background_updates=False, aqi_queue_length=max(len(replay), 1))
+
+    start = time.perf_counter()
+    csv = open(args.csv, "w") if args.csv else None
+    try:
+        if csv:
+            csv.write("timestamp,aqi\n")
+        while not replay.finished:
+            sample = aq_utils.read_sample()
+            if sample is None:
+                continue
+            aqi = aq_utils.update_aqi()
+            if csv and aqi is not None:
+                csv.write(f"{sample.timestamp.isoformat()},{aqi}\n")
+    finally:
+        if csv:
+            csv.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"Replayed {aq_utils.sample_count} samples in {elapsed:.2f} s | {aq_utils.elapsed_time} | {aq_utils.aqi}")
+
+
+if __name__ == "__main__":
+    main()
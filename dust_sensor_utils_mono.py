@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
-import serial.tools.list_ports
-import sys
+import logging
 import plantower
 import time
-from collections import deque
-from datetime import timedelta
+import numpy as np
 import threading as th
+from nowcast import NowCastEngine
+from ring_buffer import SeriesStore
+from shared_view import LiveViewWriter
+from rollup import RollupEngine
+from plantower.metrics import TimedLock
+from plantower.discovery import SensorDirectory
+from plantower.aqi import PM25_BREAKPOINTS, concentration_to_aqi, category_name
+from plantower.warmup import wait_until_ready, WARMUP_READY
 
 
 class DustSensorUtilsMono:
@@ -15,165 +21,170 @@ class DustSensorUtilsMono:
     MAX_AQI_QUEUE_LENGTH = 10000
     MEASUREMENT_WINDOW_LENGTH_SEC = 600 # 10 minutes
     WAKEUP_DELAY_SEC = 30
+    RECONNECT_TIMEOUT_SEC = 30 # How long a read keeps reopening a failed port
+
+    # AQI breakpoints for PM2.5, see plantower.aqi
+    BREAKPOINTS = PM25_BREAKPOINTS
+
+    # Plotted series and the PlantowerReading field they are taken from
+    PM_SERIES = {
+        "pm1_cf1": "pm10_cf1",
+        "pm2_5_cf1": "pm25_cf1",
+        "pm10_cf1": "pm100_cf1",
+        "pm1_std": "pm10_std",
+        "pm2_5_std": "pm25_std",
+        "pm10_std": "pm100_std",
+    }
+    PARTICLE_SERIES = {
+        ">0.3um": "gr03um",
+        ">0.5um": "gr05um",
+        ">1.0um": "gr10um",
+        ">2.5um": "gr25um",
+        ">5.0um": "gr50um",
+        ">10um": "gr100um",
+    }
+    PARTICLE_SIZES = list(PARTICLE_SERIES.keys())
+    # Attributes published next to the series in shared memory
+    STATUS_FIELDS = ("aqi", "elapsed_time", "sample_count")
 
-    # AQI breakpoints for PM2.5
-    BREAKPOINTS = [
-                (0.0, 12.0, 0, 50),
-                (12.1, 35.4, 51, 100),
-                (35.5, 55.4, 101, 150),
-                (55.5, 150.4, 151, 200),
-                (150.5, 250.4, 201, 300),
-                (250.5, 500.4, 301, 500)
-            ]
+    _logger = logging.getLogger("DustSensorUtilsMono")
 
     sample_count = 0
-    plot_timestamps = deque(maxlen=MAX_QUEUE_LENGTH)
-
-    pm1_cf1 = deque(maxlen=MAX_QUEUE_LENGTH)
-    pm2_5_cf1 = deque(maxlen=MAX_QUEUE_LENGTH)
-    pm10_cf1 = deque(maxlen=MAX_QUEUE_LENGTH)
-
-    pm1_std = deque(maxlen=MAX_QUEUE_LENGTH)
-    pm2_5_std = deque(maxlen=MAX_QUEUE_LENGTH)
-    pm10_std = deque(maxlen=MAX_QUEUE_LENGTH)
-
-    particle_counts = {
-        ">0.3um": deque(maxlen=MAX_QUEUE_LENGTH),
-        ">0.5um": deque(maxlen=MAX_QUEUE_LENGTH),
-        ">1.0um": deque(maxlen=MAX_QUEUE_LENGTH),
-        ">2.5um": deque(maxlen=MAX_QUEUE_LENGTH),
-        ">5.0um": deque(maxlen=MAX_QUEUE_LENGTH),
-        ">10um": deque(maxlen=MAX_QUEUE_LENGTH),
-    }
-    PARTICLE_SIZES = list(particle_counts.keys())
-
-    # Initialize a deque to store a 10 minutes window with PM2.5 readings and their timestamps
-    pm_timestamps = deque()
-    pm_readings = deque()
 
     aqi = "N/A"
     elapsed_time = "N/A"
 
-    # dequeue to store the AQI and the associated timestamp
-    aqi_timestamps = deque(maxlen=MAX_AQI_QUEUE_LENGTH)
-    plot_aqi = deque(maxlen=MAX_AQI_QUEUE_LENGTH)
-
-    def __init__(self):
+    # Ordered views of the stored series, only valid until the next sample
+    plot_timestamps = property(lambda self: self._samples["timestamp"])
+    pm1_cf1 = property(lambda self: self._samples["pm1_cf1"])
+    pm2_5_cf1 = property(lambda self: self._samples["pm2_5_cf1"])
+    pm10_cf1 = property(lambda self: self._samples["pm10_cf1"])
+    pm1_std = property(lambda self: self._samples["pm1_std"])
+    pm2_5_std = property(lambda self: self._samples["pm2_5_std"])
+    pm10_std = property(lambda self: self._samples["pm10_std"])
+    aqi_timestamps = property(lambda self: self._aqi_series["timestamp"])
+    plot_aqi = property(lambda self: self._aqi_series["aqi"])
+
+    @property
+    def particle_counts(self):
+        return {size: self._samples[size] for size in self.PARTICLE_SIZES}
+
+    # sensor can be any object with the Plantower read() and stream() interface, in which case
+    # no serial port is searched for and no wake up delay is applied.
+    # With background_updates disabled the AQI is not computed in a thread.
+    # queue_length and aqi_queue_length set how many samples and AQI values
+    # are kept for plotting. metrics is an optional plantower.metrics.Metrics.
+    # sensor_id selects one of several sensors by USB identity, see
+    # plantower.discovery, otherwise the first one found is used.
+    # With shared_memory_name the series and STATUS_FIELDS are kept in a
+    # shared memory block of that name, for a shared_view.LiveViewReader
+    # in another process.
+    def __init__(self, sensor=None, background_updates=True,
+                 queue_length=MAX_QUEUE_LENGTH, aqi_queue_length=MAX_AQI_QUEUE_LENGTH,
+                 metrics=None, sensor_id=None, shared_memory_name=None):
         self.lock = th.Lock()
+        self._metrics = metrics
+        self._guard = self.lock  # self.lock, timed when metrics are enabled
+        if metrics is not None:
+            self._guard = TimedLock(self.lock, metrics.histogram("aqi_lock_wait_seconds", "Time spent waiting for the lock"))
+            self._nowcast_time = metrics.histogram("aqi_nowcast_seconds", "Time taken by the NowCast computation")
+            self._read_errors = metrics.counter("aqi_read_errors_total", "Failed sensor reads")
         self._start_time = None
+        # Columnar ring buffers holding the plotted samples and the AQI history
+        columns = {"timestamp": "datetime64[ns]"}
+        for name in list(self.PM_SERIES) + self.PARTICLE_SIZES:
+            columns[name] = np.uint16
+        aqi_columns = {"timestamp": "datetime64[us]", "aqi": np.float32}
+        self.shared_view = None
+        if shared_memory_name is not None:
+            self.shared_view = LiveViewWriter(
+                shared_memory_name,
+                {"samples": (queue_length, columns), "aqi": (aqi_queue_length, aqi_columns)},
+                self.STATUS_FIELDS)
+            self._samples = self.shared_view.stores["samples"]
+            self._aqi_series = self.shared_view.stores["aqi"]
+            self._publish_status()
+        else:
+            self._samples = SeriesStore(queue_length, columns)
+            self._aqi_series = SeriesStore(aqi_queue_length, aqi_columns)
+        self._sample_fields = list(self.PM_SERIES.values()) + list(self.PARTICLE_SERIES.values())
+        # Minute, hour and day aggregates of every series, kept for as long as the process runs
+        self.rollups = RollupEngine(self._samples.columns[1:])
+        # 10 minutes window with PM2.5 readings and their timestamps
+        self._nowcast = NowCastEngine(self.MEASUREMENT_WINDOW_LENGTH_SEC)
+        # read_sample bumps the version and wakes up the AQI thread
+        self._window_changed = th.Condition(self.lock)
+        self._window_version = 0
+        self._last_aqi = None
+        self._subscribers = []
+        self.sensor_id = sensor_id
+        self._stream = None
+        if sensor is not None:
+            self._pt = sensor
+        else:
+            self._directory = SensorDirectory()
+            self._open_sensor()
+
+        if background_updates:
+            self._start_continuous_update()
+
+    def _open_sensor(self):
         serial_port = self._find_serial_port()
-        self._pt = plantower.Plantower(serial_port)
+        # A failing port is reopened by Plantower itself, on whatever port
+        # the sensor has been renumbered to. The watcher rescans when
+        # devices come and go, so the resolver finds the new port in the
+        # cache rather than scanning every port on each attempt
+        self._directory.watch()
+        self._pt = plantower.Plantower(
+            serial_port, metrics=self._metrics, reconnect_timeout=self.RECONNECT_TIMEOUT_SEC,
+            resolver=lambda: self._directory.resolve(self.sensor_id))
 
         if self.ENABLE_ACTIVE_MODE:
-            print(f"Making sure the sensor is correctly setup for active mode. Please wait {self.WAKEUP_DELAY_SEC} sec...")
+            print(f"Making sure the sensor is correctly setup for active mode. Please wait up to {self.WAKEUP_DELAY_SEC} sec...")
             #make sure it's in the correct mode if it's been used for passive beforehand
             #Not needed if freshly plugged in
             self._pt.mode_change(plantower.PMS_ACTIVE_MODE) #change back into active mode
             self._pt.set_to_wakeup() #ensure fan is spinning
-            # give it a chance to stabilise
-            for s in range(0, self.WAKEUP_DELAY_SEC):
-                time.sleep(1)
-                print(f"\rElapsed seconds: {s + 1}", end="", flush=True)
-            print("Done")
-
-            new_serial_port = self._find_serial_port()
-            if new_serial_port != serial_port:
-                self._pt = plantower.Plantower(new_serial_port)
-
-        self._start_continuous_update()
+            # give it a chance to stabilise, a sensor that was already running
+            # settles long before the delay is over
+            result = wait_until_ready(
+                self._pt, max_wait=self.WAKEUP_DELAY_SEC,
+                progress=lambda elapsed: print(f"\rElapsed seconds: {int(elapsed)}", end="", flush=True))
+            print(" Done" if result == WARMUP_READY else " Done (not settled)")
 
     def _add_pm25_reading(self, current_time, value):
-        with self.lock:
-            self.pm_timestamps.append(current_time)
-            self.pm_readings.append(value)
-
-            # Remove readings older than 10 minutes (600 seconds)
-            while self.pm_timestamps and current_time - self.pm_timestamps[0] > timedelta(seconds=self.MEASUREMENT_WINDOW_LENGTH_SEC):
-                self.pm_timestamps.popleft()
-                self.pm_readings.popleft()
+        with self._guard:
+            self._nowcast.add(current_time, value)
+            self._window_version += 1
+            self._window_changed.notify_all()
 
     def _calculate_nowcast_aqi(self):
-        with self.lock:
-            if len(self.pm_readings) < 2:
-                return None
-
-            # Calculate the range and scaled rate of change
-            min_pm = min(self.pm_readings)
-            max_pm = max(self.pm_readings)
-            range_pm = max_pm - min_pm
-            scaled_rate_of_change = range_pm / max_pm if max_pm != 0 else 0
-
-            # Calculate weight factor
-            weight_factor = max(1 - scaled_rate_of_change, 0.5)
-
-            # Calculate weighted average concentration
-            weighted_sum = 0
-            weight_sum = 0
-            for i, (pm, time) in enumerate(zip(self.pm_readings, self.pm_timestamps)):
-                time_diff = (self.pm_timestamps[-1] - time).total_seconds() / self.MEASUREMENT_WINDOW_LENGTH_SEC  # Normalize to 10 minutes
-                weight = weight_factor ** time_diff
-                weighted_sum += pm * weight
-                weight_sum += weight
-
-            nowcast_concentration = weighted_sum / weight_sum
-
-            for bp_low, bp_high, aqi_low, aqi_high in self.BREAKPOINTS:
-                if bp_low <= nowcast_concentration <= bp_high:
-                    aqi = ((aqi_high - aqi_low) / (bp_high - bp_low)) * (nowcast_concentration - bp_low) + aqi_low
-                    return round(aqi, 1)
-
-        return None  # If concentration is out of range
+        with self._guard:
+            if self._metrics is None:
+                nowcast_concentration = self._nowcast.concentration()
+            else:
+                start = time.perf_counter()
+                nowcast_concentration = self._nowcast.concentration()
+                self._nowcast_time.observe(time.perf_counter() - start)
+        # None until there are 2 samples, above the table the AQI is extrapolated
+        return concentration_to_aqi(nowcast_concentration)
 
     def _find_serial_port(self):
-        # List all available serial ports
-        ports = list(serial.tools.list_ports.comports())
-
-        # Filter ports that match 'ttyACM' or 'ttyUSB'
-        filtered_ports = [port for port in ports if 'ttyACM' in port.device or 'ttyUSB' in port.device]
-
-        if not filtered_ports:
-            self._logger.error('No matching serial ports found.')
-            sys.exit(1)
-
-        # If only one port is found, use it automatically
-        if len(filtered_ports) == 1:
-            selected_port = filtered_ports[0].device
-            self._logger.info(f'Using sensor on port {selected_port}')
-            return selected_port
-
-        # If multiple ports are found, prompt the user to select one
-        print('Multiple serial ports found:')
-        for i, port in enumerate(filtered_ports):
-            print(f'{i + 1}: {port.device}')
-
-        while True:
-            try:
-                choice = int(input('Select the desired port by number: '))
-                if 1 <= choice <= len(filtered_ports):
-                    selected_port = filtered_ports[choice - 1].device
-                    print(f'Using sensor on port {selected_port}')
-                    return selected_port
-                else:
-                    print(f'Please enter a number between 1 and {len(filtered_ports)}.')
-            except ValueError:
-                print('Invalid input. Please enter a number.')
+        # Sensors are found by USB identity, so once one has been picked the
+        # same sensor is found again after its port is renumbered
+        try:
+            selected_port = self._directory.resolve(self.sensor_id)
+        except plantower.PlantowerException as e:
+            self._logger.error(f'No matching serial ports found: {e}')
+            raise
+        if self.sensor_id is None:
+            self.sensor_id = self._directory.identify(selected_port)
+        self._logger.info(f'Using sensor {self.sensor_id} on port {selected_port}')
+        return selected_port
 
     @staticmethod
     def _aqi_category(aqi):
-        if 0 <= aqi:
-            if aqi <= 50:
-                return 'Good'
-            if aqi <= 100:
-                return 'Moderate'
-            if aqi <= 150:
-                return 'Unhealthy for Sensitive Groups'
-            if aqi <= 200:
-                return 'Unhealthy'
-            if aqi <= 300:
-                return 'Very Unhealthy'
-            if aqi <= 500:
-                return 'Hazardous'
-        return 'Out of range {aqi}'
+        return category_name(aqi)
 
     def _update_elapsed_time(self, current_time):
         elapsed_time = current_time - self._start_time
@@ -194,55 +205,91 @@ class DustSensorUtilsMono:
             self.elapsed_time += f"{int(elapsed_time.total_seconds())} sec."
 
     def read_sample(self):
+        # Samples come from the sensor stream, which never flushes the port,
+        # so every frame is used and none is waited for twice
+        if self._stream is None:
+            self._stream = self._pt.stream()
         try:
-            sample = self._pt.read()
+            sample = next(self._stream)
+        except StopIteration:
+            # End of a recording
+            self._stream = None
+            return None
         except plantower.PlantowerException as e:
-            # Handle the specific exception
+            # Handle the specific exception, the next call starts a new stream
+            self._stream = None
             self._logger.error(f"Error: {e}")
-            return
+            if self._metrics is not None:
+                self._read_errors.inc()
+            return None
 
         self.sample_count += 1
 
         if self._start_time is None:
             self._start_time = sample.timestamp
 
-        # Append new data to the lists
-        self.plot_timestamps.append(sample.timestamp)
-
-        self.pm1_cf1.append(sample.pm10_cf1)
-        self.pm2_5_cf1.append(sample.pm25_cf1)
-        self.pm10_cf1.append(sample.pm100_cf1)
-
-        self.pm1_std.append(sample.pm10_std)
-        self.pm2_5_std.append(sample.pm25_std)
-        self.pm10_std.append(sample.pm100_std)
-
-        self.particle_counts[">0.3um"].append(sample.gr03um)
-        self.particle_counts[">0.5um"].append(sample.gr05um)
-        self.particle_counts[">1.0um"].append(sample.gr10um)
-        self.particle_counts[">2.5um"].append(sample.gr25um)
-        self.particle_counts[">5.0um"].append(sample.gr50um)
-        self.particle_counts[">10um"].append(sample.gr100um)
+        # Append new data to the ring buffer, the lock keeps plotting threads
+        # from seeing a half written sample
+        values = [getattr(sample, field) for field in self._sample_fields]
+        with self._guard:
+            self._samples.append(sample.timestamp_ns, *values)
+            self.rollups.add(sample.timestamp_ns, values)
 
         # update PM data for AQI computation
         self._add_pm25_reading(sample.timestamp, sample.pm25_cf1)
 
         self._update_elapsed_time(sample.timestamp)
+        self._publish_status()
+        return sample
+
+    def _publish_status(self):
+        if self.shared_view is not None:
+            self.shared_view.set_status(**{field: getattr(self, field) for field in self.STATUS_FIELDS})
+
+    # Aggregates of every series for bins of resolution seconds (60, 3600 or 86400)
+    # between the start_ns and end_ns nanosecond timestamps, see RollupEngine.query
+    def rollup(self, resolution, start_ns=None, end_ns=None):
+        with self._guard:
+            return self.rollups.query(resolution, start_ns, end_ns)
+
+    # callback(timestamp, aqi, category) is called from the update thread
+    # every time the AQI changes
+    def subscribe(self, callback):
+        self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        self._subscribers = [cb for cb in self._subscribers if cb is not callback]
+
+    # Computes the AQI of the current window, publishes it and notifies the
+    # subscribers. The update thread calls it, with background_updates off
+    # call it after read_sample. Returns the AQI, None before 2 samples
+    def update_aqi(self):
+        aqi = self._calculate_nowcast_aqi()
+        if aqi is None:
+            return None
+        category = DustSensorUtilsMono._aqi_category(aqi)
+        self.aqi = f"{int(self.MEASUREMENT_WINDOW_LENGTH_SEC / 60)} min AQI: {aqi:.2f} | {category}"
+
+        with self._guard:
+            timestamp = self._nowcast.last_timestamp
+            self._aqi_series.append(np.datetime64(timestamp.replace(tzinfo=None), "us"), aqi)
+        self._publish_status()
+
+        if aqi != self._last_aqi:
+            self._last_aqi = aqi
+            for callback in self._subscribers:
+                callback(timestamp, aqi, category)
+        return aqi
 
     def _continuous_update(self):
+        version = 0
         while True:
-            aqi = self._calculate_nowcast_aqi()
-            if aqi is None:
-                continue
-            category = DustSensorUtilsMono._aqi_category(aqi)
-            self.aqi = f"{int(self.MEASUREMENT_WINDOW_LENGTH_SEC / 60)} min AQI: {aqi:.2f} | {category}"
-
-            with self.lock:
-                timestamp = self.pm_timestamps[-1]
-                self.aqi_timestamps.append(timestamp)
-                self.plot_aqi.append(aqi)
-
-            time.sleep(1)  # Update every second
+            # Sleep until read_sample changes the window, samples that arrive
+            # while the AQI is computed are handled in one go
+            with self._window_changed:
+                self._window_changed.wait_for(lambda: self._window_version != version)
+                version = self._window_version
+            self.update_aqi()
 
     def _start_continuous_update(self):
         update_thread = th.Thread(
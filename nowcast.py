@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import math
+from collections import deque
+from datetime import timedelta
+
+
+class NowCastEngine:
+    """
+    Incremental NowCast over a sliding time window.
+
+    The window minimum and maximum are tracked with monotonic deques. The
+    weighted average is kept as running sums that do not depend on the
+    weight factor. With ages measured in windows from a reference time,
+    a = (t - reference) / W, the weight of a sample is
+
+        weight_factor ** ((t_last - t) / W) = C * exp(L * a)
+
+    where L = -log(weight_factor) and C is the same for every sample, so it
+    cancels out of the average. exp(L * a) is expanded as a power series in
+    L, and the sums of a ** k and value * a ** k are kept for each term.
+    Adding or removing a sample updates every sum and any weight factor is
+    evaluated from them, so an update costs O(TERMS) however often the
+    factor changes. The reference time is moved to the newest sample once
+    it is a window old, which recomputes the sums once per window and
+    amortizes to O(TERMS) per sample too. Ages then stay within one window
+    of the reference and L is at most log(2), so the series is truncated
+    below the float precision.
+    """
+
+    TERMS = 17  # Series terms, log(2) ** 17 / 17! is below 1e-17
+
+    def __init__(self, window_sec):
+        self.window_sec = window_sec
+        self._window = timedelta(seconds=window_sec)
+        self._samples = deque()  # (sequence, timestamp, age, value)
+        self._min = deque()  # (sequence, value), values increasing
+        self._max = deque()  # (sequence, value), values decreasing
+        self._sequence = 0
+        self._reference = None
+        self._moments = [0.0] * self.TERMS  # Sum of age ** k
+        self._value_moments = [0.0] * self.TERMS  # Sum of value * age ** k
+
+    def __len__(self):
+        return len(self._samples)
+
+    @property
+    def last_timestamp(self):
+        return self._samples[-1][1] if self._samples else None
+
+    def _accumulate(self, age, value, sign):
+        # Adds (sign 1) or removes (sign -1) one sample from the sums
+        moments = self._moments
+        value_moments = self._value_moments
+        power = float(sign)
+        weighted = power * value
+        for k in range(self.TERMS):
+            moments[k] += power
+            value_moments[k] += weighted
+            power *= age
+            weighted *= age
+
+    def _rebase(self, reference):
+        # Recomputes the sums from a new reference time, which also clears
+        # the rounding left by the removals
+        self._reference = reference
+        self._moments = [0.0] * self.TERMS
+        self._value_moments = [0.0] * self.TERMS
+        samples = deque()
+        for seq, ts, _, value in self._samples:
+            age = (ts - reference).total_seconds() / self.window_sec
+            samples.append((seq, ts, age, value))
+            self._accumulate(age, value, 1)
+        self._samples = samples
+
+    def add(self, timestamp, value):
+        if self._reference is None:
+            self._reference = timestamp
+        age = (timestamp - self._reference).total_seconds() / self.window_sec
+        seq = self._sequence
+        self._sequence += 1
+        self._samples.append((seq, timestamp, age, value))
+        self._accumulate(age, value, 1)
+
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((seq, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((seq, value))
+
+        # Remove readings older than the window
+        while self._samples and timestamp - self._samples[0][1] > self._window:
+            old_seq, _, old_age, old_value = self._samples.popleft()
+            self._accumulate(old_age, old_value, -1)
+            if self._min[0][0] == old_seq:
+                self._min.popleft()
+            if self._max[0][0] == old_seq:
+                self._max.popleft()
+
+        if age > 1:
+            self._rebase(timestamp)
+
+    def concentration(self):
+        # Returns the NowCast concentration, None until there are 2 samples
+        if len(self._samples) < 2:
+            return None
+
+        # Calculate the range and scaled rate of change
+        min_pm = self._min[0][1]
+        max_pm = self._max[0][1]
+        range_pm = max_pm - min_pm
+        scaled_rate_of_change = range_pm / max_pm if max_pm != 0 else 0
+
+        # Calculate weight factor
+        weight_factor = max(1 - scaled_rate_of_change, 0.5)
+
+        # Series terms L ** k / k! times the sums, by Horner's rule
+        rate = -math.log(weight_factor)
+        moments = self._moments
+        value_moments = self._value_moments
+        weighted_sum = value_moments[-1]
+        weight_sum = moments[-1]
+        for k in range(self.TERMS - 1, 0, -1):
+            scale = rate / k
+            weighted_sum = value_moments[k - 1] + weighted_sum * scale
+            weight_sum = moments[k - 1] + weight_sum * scale
+        return weighted_sum / weight_sum
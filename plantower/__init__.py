@@ -2,6 +2,14 @@ from .plantower import (
     PlantowerReading,
     Plantower,
     PlantowerException,
+    PlantowerTimeout,
+    PlantowerFrameParser,
+    checksum_ok,
     PMS_PASSIVE_MODE,
     PMS_ACTIVE_MODE
 )
+from .async_plantower import AsyncPlantower
+from .array import PlantowerArray, find_sensor_ports
+from .passive import PassivePoller
+from .metrics import Metrics
+from .discovery import SensorDirectory
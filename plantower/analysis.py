@@ -0,0 +1,256 @@
+"""
+    Offline NowCast, AQI and statistics over recordings made with
+    plantower.recorder.
+    Each recording is split into time chunks that are processed in a pool of
+    worker processes. A chunk also reads the NowCast window before its start,
+    so its first values match what a live sensor would have reported, and
+    the chunk results are merged in time order, giving the same result for
+    any number of workers.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .aqi import PM25, aqi_categories
+from .batch import decode_valid_frames, verify_frames
+from .plantower import READING_FIELDS
+from .recorder import FrameLog
+
+NOWCAST_WINDOW_SEC = 600 # Same 10 minutes window as the live computation
+NOWCAST_FIELD = "pm25_cf1"
+DEFAULT_CHUNK_SEC = 86400 # Chunks are aligned to whole days
+BLOCK_ELEMENTS = 1 << 21 # Size of the temporary matrices used per block of samples
+
+AQI_DTYPE = np.dtype([
+    ("timestamp", "datetime64[ns]"),
+    ("concentration", np.float64),
+    ("aqi", np.float64),
+    ("category", np.int8)])
+
+def _range_extreme(values, starts, ends, func):
+    """
+        Returns func (np.minimum or np.maximum) over values[starts:ends + 1]
+        for every pair, using a sparse table of the extreme of every span of
+        2**k values
+    """
+    lengths = ends - starts + 1
+    levels = np.log2(lengths).astype(np.intp)
+    table = [values]
+    for level in range(1, int(levels.max()) + 1):
+        previous = table[-1]
+        half = 1 << (level - 1)
+        table.append(func(previous[:-half], previous[half:]))
+    result = np.empty(len(starts))
+    for level in np.unique(levels):
+        rows = np.flatnonzero(levels == level)
+        span = table[level]
+        result[rows] = func(span[starts[rows]], span[ends[rows] - (1 << level) + 1])
+    return result
+
+def nowcast(timestamps_ns, values, window_sec=NOWCAST_WINDOW_SEC, first=0):
+    """
+        Returns the NowCast concentration after every sample from index
+        first onwards, NaN until the window holds 2 samples.
+        timestamps_ns must be sorted, every sample sees the samples no older
+        than window_sec before it, weighted as in nowcast.NowCastEngine
+    """
+    timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    count = len(values)
+    result = np.full(max(count - first, 0), np.nan)
+    if count <= first:
+        return result
+    window_ns = int(window_sec * 1e9)
+    index = np.arange(first, count)
+    starts = np.searchsorted(timestamps_ns, timestamps_ns[first:] - window_ns, side="left")
+    high = _range_extreme(values, starts, index, np.maximum)
+    low = _range_extreme(values, starts, index, np.minimum)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(high != 0, (high - low) / high, 0)
+    log_factor = np.log(np.maximum(1 - rate, 0.5))
+
+    # Row i of the views holds the width samples up to sample i, oldest
+    # first, the samples before the window are masked out. Times are in
+    # windows since the first sample so the ages are a float subtraction
+    width = int((index - starts).max()) + 1
+    times = (timestamps_ns - timestamps_ns[0]) / window_ns
+    padded_values = np.concatenate((np.zeros(width - 1), values))
+    padded_times = np.concatenate((np.zeros(width - 1), times))
+    value_windows = np.lib.stride_tricks.sliding_window_view(padded_values, width)
+    time_windows = np.lib.stride_tricks.sliding_window_view(padded_times, width)
+    masked = starts - index + width - 1 # Leading positions outside each window
+    position = np.arange(width)
+    block = max(1, BLOCK_ELEMENTS // width)
+    for block_start in range(0, len(index), block):
+        rows = slice(block_start, block_start + block)
+        samples = slice(first + block_start, first + block_start + block)
+        weights = np.subtract(times[samples, None], time_windows[samples])
+        weights *= log_factor[rows, None]
+        np.exp(weights, out=weights)
+        if masked[rows].any():
+            weights *= position >= masked[rows, None]
+        weight_sum = weights.sum(axis=1)
+        result[rows] = np.einsum("ij,ij->i", weights, value_windows[samples]) / weight_sum
+    result[index - starts < 1] = np.nan
+    return result
+
+class FieldStatistics(object):
+    """
+        Count, minimum, maximum, mean and variance of one series, merged
+        from partial results
+    """
+    __slots__ = ("count", "min", "max", "mean", "_m2")
+
+    def __init__(self, values=()):
+        values = np.asarray(values, dtype=np.float64)
+        self.count = len(values)
+        self.min = values.min() if self.count else np.nan
+        self.max = values.max() if self.count else np.nan
+        self.mean = values.mean() if self.count else np.nan
+        self._m2 = ((values - self.mean) ** 2).sum() if self.count else 0.0
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / self.count) if self.count else np.nan
+
+    def merge(self, other):
+        """
+            Adds the values summarised by other
+        """
+        if not other.count:
+            return
+        if not self.count:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count = count
+
+    def to_dict(self):
+        return {"count": self.count, "min": float(self.min),
+                "max": float(self.max), "mean": float(self.mean),
+                "std": float(self.std)}
+
+class ChunkResult(object):
+    """
+        Output of one chunk of a recording
+    """
+    __slots__ = ("aqi", "fields", "bad_frames")
+
+    def __init__(self, aqi, fields, bad_frames):
+        self.aqi = aqi
+        self.fields = fields
+        self.bad_frames = bad_frames
+
+def analyse_chunk(path, start_ns, end_ns, window_sec=NOWCAST_WINDOW_SEC):
+    """
+        Computes the AQI history and field statistics of the records of one
+        recording with start_ns <= timestamp < end_ns
+    """
+    with FrameLog(path) as log:
+        # The window before the chunk is read too, for the first NowCasts
+        records = log.range(start_ns - int(window_sec * 1e9), end_ns)
+        readings, bad_frames = decode_valid_frames(
+            records["frame"], records["timestamp"])
+        # Bad frames in the overlap are counted by the previous chunk
+        overlap = int(np.searchsorted(records["timestamp"], start_ns, side="left"))
+        if overlap:
+            bad_frames -= overlap - int(np.count_nonzero(
+                verify_frames(records["frame"][:overlap])))
+        # Frames are copied by the decoding, the mapping can be closed
+        del records
+    timestamps_ns = readings["timestamp"].astype(np.int64)
+    first = int(np.searchsorted(timestamps_ns, start_ns, side="left"))
+    concentration = nowcast(
+        timestamps_ns, readings[NOWCAST_FIELD], window_sec, first)
+    aqi = np.empty(len(concentration), dtype=AQI_DTYPE)
+    aqi["timestamp"] = readings["timestamp"][first:]
+    aqi["concentration"] = concentration
+    aqi["aqi"] = PM25.aqi_array(concentration)
+    aqi["category"] = aqi_categories(aqi["aqi"])
+    fields = dict(
+        (name, FieldStatistics(readings[name][first:]))
+        for name in READING_FIELDS)
+    fields["aqi"] = FieldStatistics(aqi["aqi"][~np.isnan(aqi["aqi"])])
+    return ChunkResult(aqi, fields, bad_frames)
+
+def _analyse_chunk(task):
+    return analyse_chunk(*task)
+
+class SensorAnalysis(object):
+    """
+        Merged results of one recording
+    """
+    def __init__(self, path):
+        self.path = path
+        self.aqi = np.empty(0, dtype=AQI_DTYPE)
+        self.fields = dict(
+            (name, FieldStatistics()) for name in READING_FIELDS + ("aqi",))
+        self.bad_frames = 0
+
+    def merge(self, chunks):
+        """
+            Adds chunk results, which must be in time order
+        """
+        chunks = list(chunks)
+        self.aqi = np.concatenate([self.aqi] + [chunk.aqi for chunk in chunks])
+        for chunk in chunks:
+            for name, statistics in chunk.fields.items():
+                self.fields[name].merge(statistics)
+            self.bad_frames += chunk.bad_frames
+
+    def summary(self):
+        """
+            Returns the statistics as a dict of plain numbers
+        """
+        summary = dict(
+            (name, statistics.to_dict())
+            for name, statistics in self.fields.items())
+        summary["bad_frames"] = self.bad_frames
+        return summary
+
+def split_chunks(path, chunk_sec=DEFAULT_CHUNK_SEC, window_sec=NOWCAST_WINDOW_SEC):
+    """
+        Returns the (path, start_ns, end_ns, window_sec) tasks covering every
+        record of a recording, with chunks aligned to multiples of chunk_sec
+        since the epoch. Chunks without records are left out
+    """
+    chunk_ns = int(chunk_sec * 1e9)
+    with FrameLog(path) as log:
+        numbers = np.unique(log.timestamps // chunk_ns)
+    return [(path, int(number) * chunk_ns, (int(number) + 1) * chunk_ns, window_sec)
+            for number in numbers]
+
+def analyse(paths, chunk_sec=DEFAULT_CHUNK_SEC, window_sec=NOWCAST_WINDOW_SEC, workers=None):
+    """
+        Analyses recordings, one per sensor, and returns a dict of path to
+        SensorAnalysis in the order of paths.
+        workers is the number of processes, None uses every core and 1
+        runs everything in this process
+    """
+    paths = list(dict.fromkeys(paths)) # A recording listed twice is analysed once
+    tasks = []
+    for path in paths:
+        tasks.extend(split_chunks(path, chunk_sec, window_sec))
+    if workers == 1:
+        results = map(_analyse_chunk, tasks)
+        return _merge(paths, tasks, results)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map returns the results in task order whatever order they finish in
+        results = executor.map(_analyse_chunk, tasks)
+        return _merge(paths, tasks, results)
+
+def _merge(paths, tasks, results):
+    analyses = dict((path, SensorAnalysis(path)) for path in paths)
+    chunks = dict((path, []) for path in paths)
+    for task, result in zip(tasks, results):
+        chunks[task[0]].append(result)
+    for path, analysis in analyses.items():
+        analysis.merge(chunks[path])
+    return analyses
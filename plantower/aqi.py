@@ -0,0 +1,179 @@
+"""
+    US EPA Air Quality Index from PM2.5 and PM10 concentrations.
+    Concentrations are truncated to the precision of the breakpoint table,
+    as the EPA specifies, so there are no gaps between rows, and the row is
+    found with a binary search. Single values go through bisect without
+    NumPy overhead, arrays of any size are converted at once.
+"""
+
+from bisect import bisect_left, bisect_right
+import math
+
+import numpy as np
+
+# Concentration low, high in ug/m3, AQI low, high
+PM25_BREAKPOINTS = (
+    (0.0, 12.0, 0, 50),
+    (12.1, 35.4, 51, 100),
+    (35.5, 55.4, 101, 150),
+    (55.5, 150.4, 151, 200),
+    (150.5, 250.4, 201, 300),
+    (250.5, 350.4, 301, 400),
+    (350.5, 500.4, 401, 500),
+)
+# Table in force since May 2024
+PM25_BREAKPOINTS_2024 = (
+    (0.0, 9.0, 0, 50),
+    (9.1, 35.4, 51, 100),
+    (35.5, 55.4, 101, 150),
+    (55.5, 125.4, 151, 200),
+    (125.5, 225.4, 201, 300),
+    (225.5, 325.4, 301, 500),
+)
+PM10_BREAKPOINTS = (
+    (0, 54, 0, 50),
+    (55, 154, 51, 100),
+    (155, 254, 101, 150),
+    (255, 354, 151, 200),
+    (355, 424, 201, 300),
+    (425, 504, 301, 400),
+    (505, 604, 401, 500),
+)
+
+# Handling of concentrations above the table
+MODE_NONE = "none" # No AQI, None or NaN
+MODE_CLAMP = "clamp" # Top of the table
+MODE_EXTRAPOLATE = "extrapolate" # Continue the slope of the last row
+DEFAULT_MODE = MODE_EXTRAPOLATE
+
+CATEGORY_NAMES = (
+    "Good", "Moderate", "Unhealthy for Sensitive Groups", "Unhealthy",
+    "Very Unhealthy", "Hazardous")
+CATEGORY_LIMITS = (50, 100, 150, 200, 300) # Highest AQI of each category but the last
+CATEGORY_UNKNOWN = -1 # Category code when there is no AQI
+
+BATCH_DTYPE = np.dtype([
+    ("pm25", np.float64), ("pm10", np.float64), ("aqi", np.float64),
+    ("category", np.int8)])
+
+_TRUNCATION_MARGIN = 1e-9 # Keeps 35.4 from being truncated to 35.3
+
+class BreakpointTable(object):
+    """
+        One pollutant's breakpoints, prepared for scalar and array lookups
+    """
+    def __init__(self, rows, decimals):
+        """
+            rows are (concentration low, high, AQI low, high), decimals is
+            the precision concentrations are truncated to
+        """
+        self.rows = tuple(tuple(row) for row in rows)
+        self.scale = 10 ** decimals
+        self.lows = [row[0] for row in self.rows]
+        self.slopes = [
+            (aqi_high - aqi_low) / (high - low)
+            for low, high, aqi_low, aqi_high in self.rows]
+        self.top = self.rows[-1][1]
+        self.top_aqi = self.rows[-1][3]
+        self._array = np.array(self.rows, dtype=np.float64)
+        self._slopes = np.array(self.slopes)
+
+    def aqi(self, concentration, mode=DEFAULT_MODE):
+        """
+            Returns the AQI of one concentration rounded to one decimal, or
+            None when it has none
+        """
+        if concentration is None or concentration != concentration:
+            return None
+        concentration = math.floor(
+            max(concentration, 0) * self.scale + _TRUNCATION_MARGIN) / self.scale
+        if concentration > self.top:
+            if mode == MODE_CLAMP:
+                return float(self.top_aqi)
+            if mode != MODE_EXTRAPOLATE:
+                return None
+        row = bisect_right(self.lows, concentration) - 1
+        low, _, aqi_low, _ = self.rows[row]
+        return _round(self.slopes[row] * (concentration - low) + aqi_low)
+
+    def aqi_array(self, concentrations, mode=DEFAULT_MODE):
+        """
+            Returns the AQI of every concentration rounded to one decimal,
+            NaN where there is none, in an array of the same shape
+        """
+        concentrations = np.asarray(concentrations, dtype=np.float64)
+        shape = concentrations.shape
+        concentrations = np.atleast_1d(concentrations)
+        truncated = np.floor(
+            np.maximum(concentrations, 0) * self.scale + _TRUNCATION_MARGIN) / self.scale
+        rows = np.searchsorted(self._array[:, 0], truncated, side="right") - 1
+        rows = np.clip(rows, 0, len(self.rows) - 1)
+        result = self._slopes[rows] * (truncated - self._array[rows, 0]) + self._array[rows, 2]
+        result = np.round(result, 1)
+        above = truncated > self.top
+        if mode == MODE_CLAMP:
+            result[above] = self.top_aqi
+        elif mode != MODE_EXTRAPOLATE:
+            result[above] = np.nan
+        return result.reshape(shape)
+
+PM25 = BreakpointTable(PM25_BREAKPOINTS, 1)
+PM25_2024 = BreakpointTable(PM25_BREAKPOINTS_2024, 1)
+PM10 = BreakpointTable(PM10_BREAKPOINTS, 0)
+
+def _round(value):
+    """
+        Rounds to one decimal exactly like numpy.round, so single values
+        and arrays give the same results
+    """
+    return round(value * 10) / 10
+
+def concentration_to_aqi(concentration, table=PM25, mode=DEFAULT_MODE):
+    """
+        Returns the AQI of a single concentration, None if there is none
+    """
+    return table.aqi(concentration, mode)
+
+def aqi_category(aqi):
+    """
+        Returns the category code of a single AQI, an index into
+        CATEGORY_NAMES, or CATEGORY_UNKNOWN
+    """
+    if aqi is None or aqi != aqi or aqi < 0:
+        return CATEGORY_UNKNOWN
+    return bisect_left(CATEGORY_LIMITS, aqi)
+
+def category_name(aqi):
+    """
+        Returns the category name of a single AQI
+    """
+    code = aqi_category(aqi)
+    if code == CATEGORY_UNKNOWN:
+        return "Out of range %s" % aqi
+    return CATEGORY_NAMES[code]
+
+def aqi_categories(aqi):
+    """
+        Returns the category codes of an array of AQI values
+    """
+    aqi = np.asarray(aqi, dtype=np.float64)
+    codes = np.searchsorted(CATEGORY_LIMITS, aqi, side="left").astype(np.int8)
+    codes[~(aqi >= 0)] = CATEGORY_UNKNOWN
+    return codes
+
+def batch_aqi(pm25=None, pm10=None, mode=DEFAULT_MODE, pm25_table=PM25):
+    """
+        Converts arrays of PM2.5 and PM10 concentrations, either may be
+        left out, into a structured array holding the AQI of each
+        pollutant, the overall AQI (the highest of the two) and its
+        category code
+    """
+    if pm25 is None and pm10 is None:
+        raise ValueError("No concentrations given")
+    count = len(pm25) if pm25 is not None else len(pm10)
+    result = np.empty(count, dtype=BATCH_DTYPE)
+    result["pm25"] = np.nan if pm25 is None else pm25_table.aqi_array(pm25, mode)
+    result["pm10"] = np.nan if pm10 is None else PM10.aqi_array(pm10, mode)
+    result["aqi"] = np.fmax(result["pm25"], result["pm10"])
+    result["category"] = aqi_categories(result["aqi"])
+    return result
@@ -0,0 +1,181 @@
+"""
+    Reads many Plantower sensors from a single thread.
+    Every serial port is registered with a selector and its bytes fed into
+    its own frame parser, so the cost grows with the data rate rather than
+    with the number of sensors.
+"""
+
+import logging
+import selectors
+import time
+from serial import Serial, SerialException
+from serial.tools import list_ports
+
+from .plantower import (
+    PlantowerReading,
+    PlantowerException,
+    PlantowerFrameParser,
+    DEFAULT_BAUD_RATE,
+    DEFAULT_LOGGING_LEVEL,
+    PMS_PASSIVE_MODE,
+    PMS_CMD_CHANGE_MODE_PASSIVE,
+    PMS_CMD_CHANGE_MODE_ACTIVE
+)
+
+SENSOR_PORT_NAMES = ("ttyUSB", "ttyACM") # Device names used by sensor adapters
+
+def find_sensor_ports():
+    """
+        Returns the sorted device names of all serial ports that look like
+        a sensor adapter
+    """
+    return sorted(
+        port.device for port in list_ports.comports()
+        if any(name in port.device for name in SENSOR_PORT_NAMES))
+
+class SensorPort(object):
+    """
+        State kept for each sensor in the array
+    """
+    __slots__ = ("sensor_id", "port", "serial", "parser")
+
+    def __init__(self, sensor_id, port, serial):
+        self.sensor_id = sensor_id
+        self.port = port
+        self.serial = serial
+        self.parser = PlantowerFrameParser()
+
+class PlantowerArray(object):
+    """
+        Multiplexes several PMS5003 sensors in one thread
+    """
+    def __init__(
+            self, ports=None, baud=DEFAULT_BAUD_RATE,
+            log_level=DEFAULT_LOGGING_LEVEL):
+        """
+            ports can be a dict of sensor id to port, a list of ports (the
+            port is then used as the sensor id) or None to open every port
+            that looks like a sensor
+        """
+        self.logger = logging.getLogger("PMS5003 Array")
+        self.logger.setLevel(log_level)
+        self.baud = baud
+        self.sensors = {}
+        self._selector = selectors.DefaultSelector()
+        if ports is None:
+            ports = find_sensor_ports()
+        if not isinstance(ports, dict):
+            ports = dict((port, port) for port in ports)
+        for sensor_id, port in ports.items():
+            self.add_sensor(sensor_id, port)
+
+    def add_sensor(self, sensor_id, port):
+        """
+            Opens a port and adds it to the array
+        """
+        if sensor_id in self.sensors:
+            raise PlantowerException("Duplicate sensor id %s" % sensor_id)
+        try:
+            serial = Serial(port=port, baudrate=self.baud, timeout=0)
+        except SerialException as exp:
+            self.logger.error(str(exp))
+            raise PlantowerException(str(exp))
+        sensor = SensorPort(sensor_id, port, serial)
+        self._selector.register(serial.fileno(), selectors.EVENT_READ, sensor)
+        self.sensors[sensor_id] = sensor
+        self.logger.info("Sensor %s on port %s", sensor_id, port)
+        return sensor
+
+    def remove_sensor(self, sensor_id):
+        """
+            Closes a port and removes it from the array
+        """
+        sensor = self.sensors.pop(sensor_id)
+        try:
+            self._selector.unregister(sensor.serial.fileno())
+        except (KeyError, ValueError):
+            pass
+        sensor.serial.close()
+
+    def _read_sensor(self, sensor, frames):
+        """
+            Drains a readable port into its parser and collects the frames
+        """
+        try:
+            data = sensor.serial.read(sensor.serial.in_waiting or 1)
+        except SerialException as exp:
+            self.logger.error("Sensor %s: %s", sensor.sensor_id, exp)
+            self.remove_sensor(sensor.sensor_id)
+            return
+        received = time.time_ns()
+        sensor.parser.feed(data)
+        for frame in sensor.parser.frames():
+            frames.append((sensor.sensor_id, received, frame))
+
+    def poll_frames(self, timeout=None):
+        """
+            Waits up to timeout seconds for data and returns a list of
+            (sensor_id, timestamp_ns, frame) tuples for every frame completed
+        """
+        frames = []
+        for key, _ in self._selector.select(timeout):
+            if isinstance(key.data, SensorPort):
+                self._read_sensor(key.data, frames)
+        return frames
+
+    def poll(self, timeout=None):
+        """
+            Same as poll_frames but returns (sensor_id, reading) tuples
+        """
+        return [
+            (sensor_id, PlantowerReading(frame, received))
+            for sensor_id, received, frame in self.poll_frames(timeout)]
+
+    def readings(self, timeout=None):
+        """
+            Generator yielding (sensor_id, reading) tuples as frames complete.
+            Stops when no sensors are left
+        """
+        while self.sensors:
+            for item in self.poll(timeout):
+                yield item
+
+    def __iter__(self):
+        return self.readings()
+
+    def write(self, command, sensor_id=None):
+        """
+            Sends a command to one sensor, or to all of them if no sensor
+            is given
+        """
+        if sensor_id is None:
+            targets = list(self.sensors.values())
+        else:
+            targets = [self.sensors[sensor_id]]
+        for sensor in targets:
+            sensor.serial.write(command)
+        for sensor in targets:
+            sensor.serial.flush()  # Make sure tx buffer is completely sent
+
+    def mode_change(self, mode=PMS_PASSIVE_MODE, sensor_id=None):
+        """
+            Sets one or all of the sensors into passive or active mode
+        """
+        if mode == PMS_PASSIVE_MODE:
+            self.write(PMS_CMD_CHANGE_MODE_PASSIVE, sensor_id)
+        else:
+            self.write(PMS_CMD_CHANGE_MODE_ACTIVE, sensor_id)
+
+    def close(self):
+        """
+            Closes every port
+        """
+        for sensor_id in list(self.sensors):
+            self.remove_sensor(sensor_id)
+        self._selector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
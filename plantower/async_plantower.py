@@ -0,0 +1,221 @@
+"""
+    asyncio interface for the Plantower PMS5003.
+    The serial port is registered with the event loop so one loop can
+    serve many sensors without a thread per sensor.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from serial import Serial, SerialException
+
+from .plantower import (
+    PlantowerReading,
+    PlantowerException,
+    PlantowerTimeout,
+    PlantowerFrameParser,
+    DEFAULT_SERIAL_PORT,
+    DEFAULT_BAUD_RATE,
+    DEFAULT_READ_TIMEOUT,
+    DEFAULT_LOGGING_LEVEL,
+    MODE_CHANGE_DELAY,
+    PASSIVE_READ_DELAY,
+    SLEEP_CMD_DELAY,
+    PMS_PASSIVE_MODE,
+    PMS_CMD_CHANGE_MODE_PASSIVE,
+    PMS_CMD_CHANGE_MODE_ACTIVE,
+    PMS_CMD_TO_SLEEP,
+    PMS_CMD_TO_WAKEUP,
+    PMS_CMD_READ_IN_PASSIVE
+)
+
+DEFAULT_MAX_QUEUED_READINGS = 64 # Readings kept while nobody is awaiting them
+
+class AsyncPlantower(object):
+    """
+        asyncio interface to the PMS5003 sensor
+    """
+    def __init__(
+            self, port=DEFAULT_SERIAL_PORT, baud=DEFAULT_BAUD_RATE,
+            read_timeout=DEFAULT_READ_TIMEOUT,
+            log_level=DEFAULT_LOGGING_LEVEL,
+            max_queued_readings=DEFAULT_MAX_QUEUED_READINGS):
+        """
+            Setup the interface for the sensor. The port is opened straight
+            away but only attached to the running loop on first use
+        """
+        self.logger = logging.getLogger("PMS5003 Async Interface")
+        self.logger.setLevel(log_level)
+        self.port = port
+        self.baud = baud
+        self.read_timeout = read_timeout
+        self.mode_change_delay = MODE_CHANGE_DELAY
+        self.passive_read_delay = PASSIVE_READ_DELAY
+        self.sleep_cmd_delay = SLEEP_CMD_DELAY
+        try:
+            # timeout=0 makes reads non-blocking, the loop tells us when
+            # there is something to read
+            self.serial = Serial(port=self.port, baudrate=self.baud, timeout=0)
+            self.logger.debug("Port Opened Successfully")
+        except SerialException as exp:
+            self.logger.error(str(exp))
+            raise PlantowerException(str(exp))
+        self.parser = PlantowerFrameParser()
+        self._readings = deque(maxlen=max_queued_readings)
+        self._loop = None
+        self._waiters = deque() # Futures of the reads waiting, oldest first
+        self._error = None
+
+    def _attach(self):
+        """
+            Registers the serial port with the running event loop
+        """
+        if self._error is not None:
+            raise self._error
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop.add_reader(self.serial.fileno(), self._on_readable)
+
+    def _detach(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.serial.fileno())
+            self._loop = None
+
+    def _wake_waiters(self, exp=None):
+        """
+            Wakes every waiting read in the order they started, each takes
+            a reading if one is left and waits again otherwise. With exp
+            set they all fail with it
+        """
+        waiters = self._waiters
+        self._waiters = deque()
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if exp is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exp)
+
+    def _on_readable(self):
+        """
+            Called by the loop whenever the serial port has data
+        """
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except OSError as exp:
+            # SerialException is an OSError, a port that went away may
+            # raise either
+            self.logger.error(str(exp))
+            self._error = PlantowerException(str(exp))
+            self._detach()
+            self._wake_waiters(self._error)
+            return
+        received = time.time_ns()
+        self.parser.feed(data)
+        for frame in self.parser.frames():
+            self._readings.append(PlantowerReading(frame, received))
+        if self._readings:
+            self._wake_waiters()
+
+    def _flush(self):
+        self.serial.reset_input_buffer()
+        self.parser.reset()
+        self._readings.clear()
+
+    async def _write(self, command):
+        """
+            Sends a command and waits, without blocking the loop, for it to
+            leave the transmit buffer
+        """
+        self._attach()
+        self.serial.write(command)
+        await self._loop.run_in_executor(None, self.serial.flush)
+
+    async def read(self, perform_flush=True):
+        """
+            Waits for the next reading from the sensor
+            if perform_flush is set to true any buffered data is dropped first.
+            Concurrent reads get successive readings, in the order they
+            started
+        """
+        self._attach()
+        if perform_flush:
+            self._flush()
+        deadline = self._loop.time() + self.read_timeout
+        while not self._readings:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                raise PlantowerTimeout("No message recieved")
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return self._readings.popleft()
+
+    async def read_in_passive(self, perform_flush=True):
+        """
+            Requests a reading from a sensor in passive mode and waits for it
+        """
+        self._attach()
+        if perform_flush:
+            self._flush()
+        await self._write(PMS_CMD_READ_IN_PASSIVE)
+        ret = await self.read(False)
+        await asyncio.sleep(self.passive_read_delay)  # Wait sensor busy finished
+        return ret
+
+    async def mode_change(self, mode=PMS_PASSIVE_MODE):
+        """
+            Sets the sensor into passive or active mode
+        """
+        if mode == PMS_PASSIVE_MODE:
+            await self._write(PMS_CMD_CHANGE_MODE_PASSIVE)
+            self.logger.info("Sensor set in passive mode")
+        else:
+            await self._write(PMS_CMD_CHANGE_MODE_ACTIVE)
+            self.logger.info("Sensor set in active mode")
+        await asyncio.sleep(self.mode_change_delay)  # Wait sensor busy finished
+
+    async def sleep(self):
+        """
+            Stops the sensor fan
+        """
+        await self._write(PMS_CMD_TO_SLEEP)
+        await asyncio.sleep(self.sleep_cmd_delay)
+
+    async def wakeup(self):
+        """
+            Starts the sensor fan
+        """
+        await self._write(PMS_CMD_TO_WAKEUP)
+        await asyncio.sleep(self.sleep_cmd_delay)
+
+    def close(self):
+        """
+            Detaches from the loop and closes the serial port
+        """
+        self._detach()
+        self.serial.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+            Yields every reading in order as it arrives, without flushing
+        """
+        return await self.read(False)
+
+    async def __aenter__(self):
+        self._attach()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.close()
@@ -0,0 +1,113 @@
+"""
+    Batch decoding of stored Plantower frames using NumPy.
+    Intended for offline reprocessing of large numbers of frames where
+    creating a PlantowerReading per frame is too slow.
+"""
+
+import numpy as np
+
+from .plantower import (
+    PlantowerException,
+    FRAME_LENGTH,
+    READING_FIELDS
+)
+
+FIRST_FIELD_WORD = 2 # Index of the first data word within a frame
+TIMESTAMP_DTYPE = "datetime64[ns]"
+
+READING_DTYPE = np.dtype(
+    [("timestamp", TIMESTAMP_DTYPE)] +
+    [(name, np.uint16) for name in READING_FIELDS])
+
+def _as_frame_matrix(frames):
+    """
+        Returns an (N, 32) uint8 view of the frames without copying.
+        Accepts any buffer holding concatenated frames, or an existing 2D array
+    """
+    if isinstance(frames, np.ndarray) and frames.ndim == 2:
+        if frames.shape[1] != FRAME_LENGTH:
+            raise PlantowerException(
+                "Frames must be %d bytes long" % FRAME_LENGTH)
+        return frames.view(np.uint8)
+    data = np.frombuffer(frames, dtype=np.uint8)
+    if data.size % FRAME_LENGTH:
+        raise PlantowerException(
+            "Buffer length %d is not a multiple of %d" %
+            (data.size, FRAME_LENGTH))
+    return data.reshape(-1, FRAME_LENGTH)
+
+def _field_words(matrix):
+    """
+        Returns an (N, 12) big endian view over the data fields of the frames
+    """
+    words = matrix.view(">u2")
+    return words[:, FIRST_FIELD_WORD:FIRST_FIELD_WORD + len(READING_FIELDS)]
+
+def _timestamp_column(timestamps, count):
+    """
+        Converts the supplied timestamps (datetime64 or integer nanoseconds
+        since the epoch) into a datetime64[ns] array
+    """
+    if timestamps is None:
+        return np.full(count, np.datetime64("NaT"), dtype=TIMESTAMP_DTYPE)
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind == "M":
+        timestamps = timestamps.astype(TIMESTAMP_DTYPE)
+    else:
+        timestamps = timestamps.astype(np.int64).view(TIMESTAMP_DTYPE)
+    if timestamps.shape != (count,):
+        raise PlantowerException(
+            "Expected %d timestamps, got %d" % (count, timestamps.size))
+    return timestamps
+
+def decode_frames(frames, timestamps=None):
+    """
+        Decodes N concatenated 32 byte frames into a structured array with a
+        timestamp column followed by one column per reading field.
+        The values are the same as the attributes of PlantowerReading.
+        timestamps is optional and can hold datetime64 values or integer
+        nanoseconds since the epoch, one per frame
+    """
+    matrix = _as_frame_matrix(frames)
+    count = matrix.shape[0]
+    out = np.empty(count, dtype=READING_DTYPE)
+    out["timestamp"] = _timestamp_column(timestamps, count)
+    words = _field_words(matrix)
+    for i, name in enumerate(READING_FIELDS):
+        out[name] = words[:, i]
+    return out
+
+def verify_frames(frames):
+    """
+        Checks the checksums of N concatenated frames at once.
+        Returns a boolean mask with True for every frame that is valid
+    """
+    matrix = _as_frame_matrix(frames)
+    calc = matrix[:, :-2].sum(axis=1, dtype=np.uint32)
+    sent = matrix.view(">u2")[:, -1]
+    return calc == sent
+
+def decode_valid_frames(frames, timestamps=None):
+    """
+        Same as decode_frames but frames failing the checksum are skipped.
+        Returns a tuple of the decoded array and the number of bad frames
+    """
+    matrix = _as_frame_matrix(frames)
+    mask = verify_frames(matrix)
+    if timestamps is not None:
+        timestamps = _timestamp_column(timestamps, matrix.shape[0])[mask]
+    bad = int(mask.size - np.count_nonzero(mask))
+    return decode_frames(matrix[mask], timestamps), bad
+
+def decode_columns(frames, timestamps=None):
+    """
+        Decodes N concatenated 32 byte frames into a dict of column arrays
+        keyed by field name, plus a "timestamp" column
+    """
+    matrix = _as_frame_matrix(frames)
+    count = matrix.shape[0]
+    words = _field_words(matrix).astype(np.uint16)
+    columns = {"timestamp": _timestamp_column(timestamps, count)}
+    for i, name in enumerate(READING_FIELDS):
+        columns[name] = words[:, i]
+    return columns
@@ -0,0 +1,497 @@
+"""
+    Shares sensors between processes.
+    The broker owns the serial ports and publishes every frame on a Unix
+    domain socket. Each subscriber has a bounded queue: a subscriber that
+    does not keep up loses its oldest frames, which are counted, and never
+    holds up the ports or the other subscribers. Frames are encoded once and
+    the same bytes are queued for every subscriber.
+    BrokerSubscriber reads from the socket with the Plantower interface.
+    The broker can also record every frame with plantower.recorder, one
+    file per sensor, for dust_sensor_replay.py and dust_sensor_analysis.py.
+"""
+
+import logging
+import os
+import re
+import socket
+import struct
+import tempfile
+import time
+from collections import deque
+import selectors
+
+from .plantower import (
+    PlantowerReading,
+    PlantowerException,
+    PlantowerTimeout,
+    StreamStats,
+    FRAME_LENGTH,
+    DEFAULT_BAUD_RATE,
+    ACTIVE_FRAME_PERIOD,
+    DEFAULT_LOGGING_LEVEL,
+    PMS_PASSIVE_MODE
+)
+from .array import PlantowerArray, SensorPort
+
+DEFAULT_SOCKET_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "plantower.sock")
+DEFAULT_QUEUE_LENGTH = 256 # Frames kept for a subscriber that falls behind
+MAX_SEND_MESSAGES = 64 # Queued frames sent to a subscriber in one call
+POLL_TIMEOUT = 1.0
+# Subscribers wait a few frame periods, a read timing out means frames stopped
+DEFAULT_SUBSCRIBER_TIMEOUT = 3 * ACTIVE_FRAME_PERIOD
+RECEIVE_SIZE = 65536
+
+# Sensor id length, sequence number of the frame for its sensor, timestamp,
+# followed by the sensor id and the frame
+MESSAGE_HEADER = struct.Struct("<BIq")
+SEQUENCE_MASK = 0xffffffff
+HELLO_END = b"\n" # Ends the sensor id a subscriber sends when it connects
+MAX_HELLO_LENGTH = 256
+
+def encode_message(sensor_id, sequence, timestamp_ns, frame):
+    """
+        Builds the message sent to subscribers for one frame
+    """
+    name = sensor_id.encode("utf-8")
+    return MESSAGE_HEADER.pack(len(name), sequence, timestamp_ns) + name + bytes(frame)
+
+class Subscriber(object):
+    """
+        State kept by the broker for each connected subscriber
+    """
+    __slots__ = ("sock", "sensor_id", "ready", "hello", "queue", "pending",
+                 "sent", "dropped", "events")
+
+    def __init__(self, sock, queue_length):
+        self.sock = sock
+        self.sensor_id = None # None receives every sensor
+        self.ready = False # Set once the sensor id has been received
+        self.hello = bytearray()
+        self.queue = deque(maxlen=queue_length)
+        self.pending = None # Part of a send still to go out
+        self.sent = 0
+        self.dropped = 0
+        self.events = selectors.EVENT_READ
+
+class FrameBroker(PlantowerArray):
+    """
+        Reads sensors like PlantowerArray and publishes their frames
+    """
+    def __init__(
+            self, ports=None, socket_path=DEFAULT_SOCKET_PATH,
+            queue_length=DEFAULT_QUEUE_LENGTH, baud=DEFAULT_BAUD_RATE,
+            log_level=DEFAULT_LOGGING_LEVEL, record_dir=None):
+        """
+            ports is used as for PlantowerArray, sensor ids are what
+            subscribers ask for. queue_length is the number of frames kept
+            for each subscriber. With record_dir every frame is also
+            appended to a recording in that directory, named after its
+            sensor (recording_path)
+        """
+        super().__init__(ports, baud, log_level)
+        self.logger = logging.getLogger("PMS5003 Broker")
+        self.logger.setLevel(log_level)
+        self.socket_path = socket_path
+        self.queue_length = queue_length
+        self.subscribers = {} # fileno -> Subscriber
+        self._sequences = {}
+        self.record_dir = record_dir
+        if record_dir is not None:
+            os.makedirs(record_dir, exist_ok=True)
+        self._recorders = {} # sensor id -> FrameRecorder
+        self._server = self._listen(socket_path)
+        self._selector.register(self._server, selectors.EVENT_READ, self._server)
+
+    def _listen(self, path):
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path) # Left over by a broker that did not stop cleanly
+            else:
+                raise PlantowerException("A broker is already running on %s" % path)
+            finally:
+                probe.close()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        server.setblocking(False)
+        self.logger.info("Publishing on %s", path)
+        return server
+
+    def _accept(self):
+        try:
+            sock, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        subscriber = Subscriber(sock, self.queue_length)
+        self.subscribers[sock.fileno()] = subscriber
+        self._selector.register(sock, subscriber.events, subscriber)
+
+    def _drop_subscriber(self, subscriber):
+        self.subscribers.pop(subscriber.sock.fileno(), None)
+        try:
+            self._selector.unregister(subscriber.sock)
+        except (KeyError, ValueError):
+            pass
+        subscriber.sock.close()
+        self.logger.info(
+            "Subscriber left, %d frames sent, %d dropped",
+            subscriber.sent, subscriber.dropped)
+
+    def _read_subscriber(self, subscriber):
+        """
+            Receives the sensor id a subscriber wants, anything else it
+            sends is ignored. An empty read means it disconnected
+        """
+        try:
+            data = subscriber.sock.recv(MAX_HELLO_LENGTH)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop_subscriber(subscriber)
+            return
+        if subscriber.ready:
+            return
+        subscriber.hello += data
+        end = subscriber.hello.find(HELLO_END)
+        if end < 0:
+            if len(subscriber.hello) > MAX_HELLO_LENGTH:
+                self._drop_subscriber(subscriber)
+            return
+        sensor_id = subscriber.hello[:end].decode("utf-8", "replace")
+        subscriber.sensor_id = sensor_id or None
+        subscriber.ready = True
+        subscriber.hello = None
+        self.logger.info("Subscriber for %s", sensor_id or "every sensor")
+
+    def _set_events(self, subscriber, events):
+        if events != subscriber.events:
+            subscriber.events = events
+            self._selector.modify(subscriber.sock, events, subscriber)
+
+    def _send(self, subscriber):
+        """
+            Sends as much of the queue as the socket takes without blocking
+        """
+        queue = subscriber.queue
+        while subscriber.pending is not None or queue:
+            if subscriber.pending is None:
+                count = min(len(queue), MAX_SEND_MESSAGES)
+                subscriber.pending = memoryview(
+                    b"".join([queue.popleft() for _ in range(count)]))
+                subscriber.sent += count
+            try:
+                sent = subscriber.sock.send(subscriber.pending)
+            except BlockingIOError:
+                break
+            except OSError:
+                self._drop_subscriber(subscriber)
+                return
+            subscriber.pending = subscriber.pending[sent:] if sent < len(subscriber.pending) else None
+        waiting = subscriber.pending is not None or queue
+        self._set_events(
+            subscriber,
+            selectors.EVENT_READ | selectors.EVENT_WRITE if waiting
+            else selectors.EVENT_READ)
+
+    def recording_path(self, sensor_id):
+        """
+            Recording of a sensor, its id with anything but letters, digits,
+            dots and dashes replaced
+        """
+        name = re.sub(r"[^A-Za-z0-9.-]", "_", str(sensor_id)).strip("_")
+        return os.path.join(self.record_dir, name + ".rec")
+
+    def _record(self, sensor_id, timestamp_ns, frame):
+        recorder = self._recorders.get(sensor_id)
+        if recorder is None:
+            # Only recording needs NumPy, an optional dependency
+            from .recorder import FrameRecorder
+            path = self.recording_path(sensor_id)
+            recorder = self._recorders[sensor_id] = FrameRecorder(path)
+            self.logger.info("Recording %s to %s", sensor_id, path)
+        recorder.write(frame, timestamp_ns)
+
+    def publish(self, sensor_id, timestamp_ns, frame):
+        """
+            Queues a frame for every subscriber that wants it, and records
+            it when recording
+        """
+        if self.record_dir is not None:
+            self._record(sensor_id, timestamp_ns, frame)
+        sequence = (self._sequences.get(sensor_id, -1) + 1) & SEQUENCE_MASK
+        self._sequences[sensor_id] = sequence
+        message = encode_message(str(sensor_id), sequence, timestamp_ns, frame)
+        for subscriber in list(self.subscribers.values()):
+            if not subscriber.ready:
+                continue
+            if subscriber.sensor_id is not None and subscriber.sensor_id != str(sensor_id):
+                continue
+            if len(subscriber.queue) == subscriber.queue.maxlen:
+                subscriber.dropped += 1 # The oldest frame makes room
+            subscriber.queue.append(message)
+            if not subscriber.events & selectors.EVENT_WRITE:
+                # Nothing waiting, a subscriber keeping up gets it right away
+                self._send(subscriber)
+
+    def poll_frames(self, timeout=None):
+        """
+            Same as PlantowerArray.poll_frames, also serving subscribers and
+            publishing every frame read
+        """
+        frames = []
+        for key, events in self._selector.select(timeout):
+            data = key.data
+            if isinstance(data, SensorPort):
+                self._read_sensor(data, frames)
+            elif data is self._server:
+                self._accept()
+            elif isinstance(data, Subscriber):
+                if events & selectors.EVENT_READ:
+                    self._read_subscriber(data)
+                if events & selectors.EVENT_WRITE and data.sock.fileno() in self.subscribers:
+                    self._send(data)
+        for sensor_id, timestamp_ns, frame in frames:
+            self.publish(sensor_id, timestamp_ns, frame)
+        return frames
+
+    def serve_forever(self, timeout=POLL_TIMEOUT):
+        """
+            Publishes frames until no sensors are left
+        """
+        while self.sensors:
+            self.poll_frames(timeout)
+
+    def stats(self):
+        """
+            Returns a list of (sensor id, frames sent, frames dropped) for
+            every subscriber
+        """
+        return [
+            (subscriber.sensor_id, subscriber.sent, subscriber.dropped)
+            for subscriber in self.subscribers.values()]
+
+    def close(self):
+        """
+            Disconnects the subscribers, closes the recordings, removes the
+            socket and closes every port
+        """
+        for subscriber in list(self.subscribers.values()):
+            self._drop_subscriber(subscriber)
+        for recorder in self._recorders.values():
+            recorder.close() # Writes the buffered frames
+        self._recorders.clear()
+        self._selector.unregister(self._server)
+        self._server.close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+        super().close()
+
+class BrokerSubscriber(object):
+    """
+        Receives frames from a FrameBroker, with the Plantower interface
+    """
+    def __init__(
+            self, socket_path=DEFAULT_SOCKET_PATH, sensor_id=None,
+            read_timeout=DEFAULT_SUBSCRIBER_TIMEOUT,
+            log_level=DEFAULT_LOGGING_LEVEL, bind_first=False):
+        """
+            sensor_id selects one sensor, by default frames from every
+            sensor are received and sensor_id is set to the sensor of the
+            last frame read. With bind_first and no sensor_id, the sensor
+            of the first frame received is kept and frames from the others
+            are skipped, so a single series never mixes sensors
+        """
+        self.logger = logging.getLogger("PMS5003 Subscriber")
+        self.logger.setLevel(log_level)
+        self.port = socket_path
+        self.read_timeout = read_timeout
+        self.sensor_id = sensor_id
+        self.bind_first = bind_first
+        self.stream_stats = StreamStats()
+        self._buffer = bytearray()
+        self._sequences = {}
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+            self.sock.sendall((sensor_id or "").encode("utf-8") + HELLO_END)
+        except OSError as exp:
+            self.sock.close()
+            self.logger.error(str(exp))
+            raise PlantowerException(str(exp))
+
+    def _next_message(self):
+        """
+            Returns the next complete (sensor id, timestamp, frame) from the
+            received data, or None if more data is needed
+        """
+        buf = self._buffer
+        while len(buf) >= MESSAGE_HEADER.size:
+            name_length, sequence, timestamp_ns = MESSAGE_HEADER.unpack_from(buf)
+            end = MESSAGE_HEADER.size + name_length + FRAME_LENGTH
+            if len(buf) < end:
+                return None
+            sensor_id = buf[MESSAGE_HEADER.size:end - FRAME_LENGTH].decode("utf-8")
+            frame = bytes(buf[end - FRAME_LENGTH:end])
+            del buf[:end]
+            if self.bind_first:
+                if self.sensor_id is None:
+                    self.sensor_id = sensor_id
+                    self.logger.info("Following sensor %s", sensor_id)
+                elif sensor_id != self.sensor_id:
+                    continue # Another sensor on the same broker
+            previous = self._sequences.get(sensor_id)
+            if previous is not None:
+                # Frames the broker dropped for this subscriber
+                self.stream_stats.dropped += (sequence - previous - 1) & SEQUENCE_MASK
+            self._sequences[sensor_id] = sequence
+            return sensor_id, timestamp_ns, frame
+        return None
+
+    def _receive(self, timeout):
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(RECEIVE_SIZE)
+        except socket.timeout:
+            return False
+        except OSError as exp:
+            raise PlantowerException(str(exp))
+        if not data:
+            raise PlantowerException("Broker closed the connection")
+        self._buffer += data
+        return True
+
+    def _flush(self):
+        """
+            Drops everything received so far, as a serial flush would
+        """
+        while True:
+            self.sock.setblocking(False)
+            try:
+                if not self.sock.recv(RECEIVE_SIZE):
+                    break
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as exp:
+                raise PlantowerException(str(exp))
+        del self._buffer[:]
+        self._sequences.clear() # Frames flushed here are not drops
+
+    def _read_message(self):
+        message = self._next_message()
+        deadline = time.monotonic() + self.read_timeout
+        while message is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PlantowerTimeout("No message recieved")
+            self._receive(remaining)
+            message = self._next_message()
+        return message
+
+    def read_frame(self, perform_flush=True):
+        """
+            Returns the next raw frame, flushing what was already received
+            first if perform_flush is set
+        """
+        if perform_flush:
+            self._flush()
+        sensor_id, _, frame = self._read_message()
+        self.sensor_id = sensor_id
+        return frame
+
+    def read(self, perform_flush=True):
+        """
+            Returns the next reading, stamped with the time the broker
+            received it
+        """
+        if perform_flush:
+            self._flush()
+        sensor_id, timestamp_ns, frame = self._read_message()
+        self.sensor_id = sensor_id
+        return PlantowerReading(frame, timestamp_ns)
+
+    def read_in_passive(self, perform_flush=True):
+        return self.read(perform_flush)
+
+    def stream(self, batch=False):
+        """
+            Generator returning every reading the broker sends, like
+            Plantower.stream. Frames dropped by the broker because this
+            subscriber fell behind are counted in stream_stats.dropped
+        """
+        stats = self.stream_stats
+        while True:
+            readings = []
+            message = self._next_message()
+            if message is None:
+                message = self._read_message()
+            while message is not None:
+                self.sensor_id = message[0]
+                readings.append(PlantowerReading(message[2], message[1]))
+                message = self._next_message()
+            stats.reads += 1
+            stats.frames += len(readings)
+            stats.max_backlog = max(stats.max_backlog, len(readings))
+            if batch:
+                yield readings
+            else:
+                for reading in readings:
+                    yield reading
+
+    def mode_change(self, mode=PMS_PASSIVE_MODE):
+        """
+            Commands belong to the broker, they have no effect here
+        """
+        self.logger.debug("Ignoring mode change on a subscriber")
+
+    def set_to_sleep(self, to_sleep=True):
+        self.logger.debug("Ignoring sleep command on a subscriber")
+
+    def set_to_wakeup(self):
+        self.set_to_sleep(False)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from .discovery import SensorDirectory
+
+    parser = ArgumentParser(description="Share plantower sensors over a Unix socket")
+    parser.add_argument(
+        "ports", nargs="*",
+        help="Serial ports to publish, every sensor found by default")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Socket path")
+    parser.add_argument(
+        "--queue-length", type=int, default=DEFAULT_QUEUE_LENGTH,
+        help="Frames kept for a subscriber that falls behind")
+    parser.add_argument(
+        "--record", metavar="DIR",
+        help="Also record every frame in this directory, one file per sensor")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # Sensors are published under their USB identity unless ports are given
+    ports = args.ports or SensorDirectory().scan()
+    broker = FrameBroker(
+        ports, args.socket, args.queue_length, log_level=logging.INFO,
+        record_dir=args.record)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
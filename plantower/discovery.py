@@ -0,0 +1,278 @@
+"""
+    Finds sensors by their USB identity rather than by device name.
+    Each adapter gets a stable sensor id from its USB serial number, or from
+    its VID:PID and bus location when it has none. The mapping is cached on
+    disk so a known sensor is found again after its port is renumbered, and
+    a port is never chosen interactively.
+"""
+
+import json
+import logging
+import os
+import threading
+from serial.tools import list_ports
+
+from .plantower import PlantowerException, DEFAULT_LOGGING_LEVEL
+from .array import SENSOR_PORT_NAMES
+
+try:
+    from serial.tools.list_ports_linux import SysFS
+except ImportError: # Not on Linux, every lookup goes through comports()
+    SysFS = None
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "plantower", "ports.json")
+DEFAULT_WATCH_INTERVAL = 1.0 # Seconds between checks for added or removed ports
+DEV_DIR = "/dev"
+
+def sensor_id_for(vid, pid, serial_number=None, location=None):
+    """
+        Returns the stable id of the adapter with this USB identity
+    """
+    if serial_number:
+        return "%04x:%04x:%s" % (vid, pid, serial_number)
+    return "%04x:%04x@%s" % (vid, pid, location)
+
+class SensorIdentity(object):
+    """
+        USB identity of the adapter behind a serial port
+    """
+    __slots__ = ("vid", "pid", "serial_number", "location", "port")
+
+    def __init__(self, vid, pid, serial_number=None, location=None, port=None):
+        self.vid = vid
+        self.pid = pid
+        self.serial_number = serial_number
+        self.location = location
+        self.port = port
+
+    @classmethod
+    def from_port_info(cls, info):
+        """
+            Builds the identity from a pyserial ListPortInfo, returns None
+            for ports that are not USB adapters
+        """
+        if info.vid is None or info.pid is None:
+            return None
+        return cls(info.vid, info.pid, info.serial_number, info.location,
+                   info.device)
+
+    @property
+    def sensor_id(self):
+        return sensor_id_for(
+            self.vid, self.pid, self.serial_number, self.location)
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**dict((name, values.get(name)) for name in cls.__slots__))
+
+def _is_sensor_port(device, names=SENSOR_PORT_NAMES):
+    return any(name in device for name in names)
+
+def _identify(port):
+    """
+        Reads the identity of a single port from sysfs, without listing
+        every port. Returns None if it cannot be read this way
+    """
+    if SysFS is None or not os.path.exists(port):
+        return None
+    try:
+        return SensorIdentity.from_port_info(SysFS(port))
+    except (OSError, ValueError):
+        return None
+
+class SensorDirectory(object):
+    """
+        Maps stable sensor ids to their current serial ports
+    """
+    def __init__(
+            self, cache_path=DEFAULT_CACHE_PATH, names=SENSOR_PORT_NAMES,
+            log_level=DEFAULT_LOGGING_LEVEL):
+        """
+            cache_path is the JSON file remembering known sensors, None
+            disables the cache.
+            names are the device names that look like a sensor adapter
+        """
+        self.logger = logging.getLogger("PMS5003 Discovery")
+        self.logger.setLevel(log_level)
+        self.cache_path = cache_path
+        self.names = tuple(names)
+        self.known = {} # sensor id -> SensorIdentity, port is the last seen
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._load()
+
+    def _load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as cache:
+                entries = json.load(cache)
+            for sensor_id, values in entries.items():
+                self.known[sensor_id] = SensorIdentity.from_dict(values)
+        except (OSError, ValueError, TypeError) as exp:
+            self.logger.warning(
+                "Ignoring unreadable port cache %s: %s", self.cache_path, exp)
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        # Held throughout, the watcher thread and resolve() both save
+        # through the same temporary file
+        with self._lock:
+            entries = dict(
+                (sensor_id, identity.to_dict())
+                for sensor_id, identity in self.known.items())
+            try:
+                os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                temp_path = self.cache_path + ".tmp"
+                with open(temp_path, "w") as cache:
+                    json.dump(entries, cache, indent=1, sort_keys=True)
+                os.replace(temp_path, self.cache_path)
+            except OSError as exp:
+                self.logger.warning(
+                    "Could not write port cache %s: %s", self.cache_path, exp)
+
+    def scan(self):
+        """
+            Lists every port, updates the known sensors and returns a dict
+            of sensor id to port for the sensors currently plugged in
+        """
+        present = {}
+        for info in list_ports.comports():
+            if not _is_sensor_port(info.device, self.names):
+                continue
+            identity = SensorIdentity.from_port_info(info)
+            if identity is None:
+                # Not a USB adapter, the device name is all there is
+                present[info.device] = info.device
+                continue
+            present[identity.sensor_id] = identity.port
+            with self._lock:
+                known = self.known.get(identity.sensor_id)
+                changed = known is None or known.port != identity.port
+                self.known[identity.sensor_id] = identity
+            if changed:
+                self.logger.info(
+                    "Sensor %s is on port %s", identity.sensor_id, identity.port)
+                self._save()
+        return present
+
+    def _check_cached(self, sensor_id):
+        """
+            Returns the last known port of the sensor if it still belongs
+            to it, without a full scan
+        """
+        with self._lock:
+            known = self.known.get(sensor_id)
+        if known is None or known.port is None:
+            return None
+        identity = _identify(known.port)
+        if identity is not None and identity.sensor_id == sensor_id:
+            return known.port
+        return None
+
+    def resolve(self, sensor_id=None):
+        """
+            Returns the current port of a sensor. Without a sensor id, the
+            only sensor plugged in is used, or the first one by id if there
+            are several. Raises PlantowerException if it is not plugged in.
+            While watching, a renumbered sensor's new port is usually known
+            already and no full scan is needed
+        """
+        if sensor_id is not None:
+            port = self._check_cached(sensor_id)
+            if port is not None:
+                return port
+        present = self.scan()
+        if sensor_id is not None:
+            if sensor_id not in present:
+                raise PlantowerException("Sensor %s not found" % sensor_id)
+            return present[sensor_id]
+        if not present:
+            raise PlantowerException("No sensor found")
+        sensor_id = sorted(present)[0]
+        if len(present) > 1:
+            self.logger.warning(
+                "Found sensors %s, using %s", ", ".join(sorted(present)),
+                sensor_id)
+        return present[sensor_id]
+
+    def identify(self, port):
+        """
+            Returns the sensor id of the adapter on port, or the port itself
+            if it has no USB identity
+        """
+        identity = _identify(port)
+        if identity is None:
+            for info in list_ports.comports():
+                if info.device == port:
+                    identity = SensorIdentity.from_port_info(info)
+                    break
+        if identity is None:
+            return port
+        return identity.sensor_id
+
+    def _devices(self):
+        """
+            Returns the sensor device names currently present, this is much
+            cheaper than a full scan so it is what the watcher polls
+        """
+        if os.path.isdir(DEV_DIR):
+            try:
+                return frozenset(
+                    name for name in os.listdir(DEV_DIR)
+                    if _is_sensor_port(name, self.names))
+            except OSError:
+                pass
+        return frozenset(
+            info.device for info in list_ports.comports()
+            if _is_sensor_port(info.device, self.names))
+
+    def watch(self, callback=None, interval=DEFAULT_WATCH_INTERVAL):
+        """
+            Watches for sensors being plugged in, removed or renumbered from
+            a daemon thread. A rescan only happens when the set of devices
+            changes, then callback, if given, is called with the dict of
+            sensor id to port of the sensors present
+        """
+        if self._watcher is not None:
+            raise PlantowerException("Already watching")
+        self._stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch, args=(callback, interval), daemon=True)
+        self._watcher.start()
+
+    def _watch(self, callback, interval):
+        devices = self._devices()
+        while not self._stop.wait(interval):
+            current = self._devices()
+            if current == devices:
+                continue
+            devices = current
+            present = self.scan()
+            if callback is not None:
+                try:
+                    callback(present)
+                except Exception:
+                    self.logger.exception("Hotplug callback failed")
+
+    def stop(self):
+        """
+            Stops watching
+        """
+        if self._watcher is None:
+            return
+        self._stop.set()
+        self._watcher.join()
+        self._watcher = None
+
+if __name__ == "__main__":
+    directory = SensorDirectory()
+    for sensor_id, port in sorted(directory.scan().items()):
+        print("%s %s" % (sensor_id, port))
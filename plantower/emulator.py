@@ -0,0 +1,352 @@
+"""
+    Software PMS5003 for tests and benchmarks.
+    Opens a pseudo-terminal that Plantower can open like a real sensor,
+    sends valid frames in active mode, answers the passive mode, sleep and
+    wakeup commands and can inject faults into the data stream.
+"""
+
+import errno
+import logging
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+
+from .plantower import (
+    FRAME_HEADER,
+    FRAME_LENGTH,
+    FRAME_DATA_LENGTH,
+    READING_FIELDS,
+    DEFAULT_BAUD_RATE,
+    DEFAULT_LOGGING_LEVEL,
+    PMS_PASSIVE_MODE,
+    PMS_ACTIVE_MODE
+)
+
+COMMAND_LENGTH = 7 # Length of a command sent to the sensor
+CMD_CHANGE_MODE = 0xe1
+CMD_READ_IN_PASSIVE = 0xe2
+CMD_SLEEP = 0xe4
+
+DEFAULT_FRAME_RATE = 1.0 # Frames per second sent in active mode
+# Frames per second filling a 9600 baud line, 10 bits per byte with the
+# start and stop bits, about 30
+LINE_FRAME_RATE = DEFAULT_BAUD_RATE / 10.0 / FRAME_LENGTH
+
+MAX_BACKLOG = 4096 # Bytes queued for a reader before frames are dropped
+IDLE_POLL = 0.1 # Longest time between checks for commands and stop requests
+
+FAULT_GARBAGE = "garbage"
+FAULT_TRUNCATED = "truncated"
+FAULT_BAD_CHECKSUM = "bad_checksum"
+FAULTS = (FAULT_GARBAGE, FAULT_TRUNCATED, FAULT_BAD_CHECKSUM)
+
+def encode_frame(values, reserved=0):
+    """
+        Builds a valid 32 byte frame from the 12 field values, given either
+        as a sequence in frame order or as a dict keyed by field name
+    """
+    if isinstance(values, dict):
+        values = [values.get(name, 0) for name in READING_FIELDS]
+    body = (
+        FRAME_HEADER +
+        struct.pack(">H12HH", FRAME_DATA_LENGTH, *(list(values) + [reserved])))
+    return body + struct.pack(">H", sum(body) & 0xffff)
+
+class RandomWalk(object):
+    """
+        Default source of plausible looking readings
+    """
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+        self._pm = 10.0
+
+    def __call__(self):
+        self._pm = min(max(self._pm + self._random.uniform(-1, 1), 0), 500)
+        pm1 = int(self._pm * 0.7)
+        pm25 = int(self._pm)
+        pm10 = int(self._pm * 1.2)
+        count = int(self._pm * 100)
+        return (
+            pm1, pm25, pm10, pm1, pm25, pm10,
+            count, count // 3, count // 20, count // 200, count // 500,
+            count // 1000)
+
+class PMS5003Emulator(object):
+    """
+        Emulates a PMS5003 on a pseudo-terminal
+    """
+    def __init__(
+            self, rate=DEFAULT_FRAME_RATE, values=None, fault_rates=None,
+            seed=None, log_level=DEFAULT_LOGGING_LEVEL):
+        """
+            rate is the number of frames per second sent in active mode, None
+            sends them unthrottled, as fast as the reader takes them, which
+            is far faster than a real sensor's 9600 baud line. LINE_FRAME_RATE
+            sends them back to back as fast as that line carries them.
+            values is a callable returning the 12 field values for each frame,
+            by default a random walk is used.
+            fault_rates maps fault names (FAULTS) to the probability of that
+            fault being injected instead of a frame
+        """
+        self.logger = logging.getLogger("PMS5003 Emulator")
+        self.logger.setLevel(log_level)
+        self.rate = rate
+        self.values = values if values is not None else RandomWalk(seed)
+        self.fault_rates = dict(fault_rates or {})
+        self._random = random.Random(seed)
+        self.mode = PMS_ACTIVE_MODE
+        self.asleep = False
+        self.frames_sent = 0
+        self.frames_dropped = 0 # Frames dropped because nobody was reading
+        self.faults_sent = 0
+        self.commands = 0
+        self.port = None
+        self._master = None
+        self._slave = None
+        self._pending = bytearray() # Injected data waiting to be written
+        self._commands = bytearray()
+        self._out = bytearray() # Data waiting for the pty to accept it
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._replug = None # Timer plugging the sensor back in
+
+    def start(self):
+        """
+            Opens the pseudo-terminal and starts emulating.
+            The device name to open is then available as port
+        """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.logger.info("Emulated sensor on %s", self.port)
+        return self
+
+    def stop(self):
+        """
+            Stops emulating and closes the pseudo-terminal
+        """
+        if self._replug is not None:
+            self._replug.cancel()
+            self._replug = None
+        self._stop()
+
+    def _stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close()
+
+    def _close(self):
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = None
+        self._slave = None
+
+    def disconnect(self, duration=None):
+        """
+            Simulates the sensor being unplugged, readers of the port get an
+            error from then on. If duration is given the sensor is plugged
+            back in after that many seconds, see reconnect
+        """
+        self._stop()
+        if duration is not None:
+            self._replug = threading.Timer(duration, self.reconnect)
+            self._replug.daemon = True
+            self._replug.start()
+
+    def reconnect(self):
+        """
+            Simulates the sensor being plugged back in. It powers up awake
+            in active mode on a new pseudo-terminal, whose name may differ
+            like a real sensor's device name. A Plantower created with
+            resolver=lambda: emulator.port follows it
+        """
+        self._replug = None
+        if self._running:
+            return
+        self.mode = PMS_ACTIVE_MODE
+        self.asleep = False
+        with self._lock:
+            del self._pending[:]
+        del self._commands[:]
+        del self._out[:]
+        self.start()
+
+    def _inject(self, data):
+        with self._lock:
+            self._pending += data
+        self.faults_sent += 1
+
+    def inject_garbage(self, length=16):
+        """
+            Sends random bytes that are not part of a frame
+        """
+        self._inject(bytes(self._random.getrandbits(8) for _ in range(length)))
+
+    def inject_truncated(self):
+        """
+            Sends a frame that stops part way through
+        """
+        frame = encode_frame(self.values())
+        self._inject(frame[:self._random.randrange(2, len(frame) - 1)])
+
+    def inject_bad_checksum(self):
+        """
+            Sends a complete frame with a wrong checksum
+        """
+        frame = bytearray(encode_frame(self.values()))
+        frame[-1] ^= 0xff
+        self._inject(bytes(frame))
+
+    def _next_frame(self):
+        """
+            Returns the next frame to send, possibly replaced by a fault
+        """
+        for fault in FAULTS:
+            probability = self.fault_rates.get(fault, 0)
+            if probability and self._random.random() < probability:
+                self.faults_sent += 1
+                if fault == FAULT_GARBAGE:
+                    return bytes(
+                        self._random.getrandbits(8) for _ in range(16))
+                frame = encode_frame(self.values())
+                if fault == FAULT_TRUNCATED:
+                    return frame[:self._random.randrange(2, len(frame) - 1)]
+                return frame[:-1] + bytes([frame[-1] ^ 0xff])
+        self.frames_sent += 1
+        return encode_frame(self.values())
+
+    def _send(self, data):
+        """
+            Queues data for the reader. If the reader has stopped taking data
+            the frame is dropped like a real sensor talking to nobody
+        """
+        if len(self._out) >= MAX_BACKLOG:
+            self.frames_dropped += 1
+            return
+        self._out += data
+
+    def _flush_out(self):
+        """
+            Writes as much of the queued data as the pty takes without blocking
+        """
+        try:
+            written = os.write(self._master, self._out)
+        except OSError as exp:
+            if exp.errno not in (errno.EAGAIN, errno.EIO):
+                raise
+            return
+        del self._out[:written]
+
+    def _handle_command(self, command, data):
+        self.commands += 1
+        if command == CMD_CHANGE_MODE:
+            self.mode = PMS_ACTIVE_MODE if data else PMS_PASSIVE_MODE
+            self.logger.debug("Mode changed to %d", self.mode)
+        elif command == CMD_SLEEP:
+            self.asleep = not data
+            if not self.asleep:
+                # Sensor always comes back from sleep in active mode
+                self.mode = PMS_ACTIVE_MODE
+            self.logger.debug("Asleep %s", self.asleep)
+        elif command == CMD_READ_IN_PASSIVE:
+            if not self.asleep and self.mode == PMS_PASSIVE_MODE:
+                self._send(self._next_frame())
+
+    def _process_commands(self, data):
+        buf = self._commands
+        buf += data
+        while True:
+            start = buf.find(FRAME_HEADER)
+            if start < 0:
+                del buf[:max(len(buf) - 1, 0)]
+                return
+            del buf[:start]
+            if len(buf) < COMMAND_LENGTH:
+                return
+            command = bytes(buf[:COMMAND_LENGTH])
+            if ((command[5] << 8) | command[6]) == sum(command[:5]):
+                del buf[:COMMAND_LENGTH]
+                self._handle_command(command[2], (command[3] << 8) | command[4])
+            else:
+                del buf[:2]
+
+    def _run(self):
+        next_due = time.monotonic()
+        while self._running:
+            streaming = not self.asleep and self.mode == PMS_ACTIVE_MODE
+            timeout = IDLE_POLL
+            if streaming and self.rate is not None:
+                timeout = min(max(next_due - time.monotonic(), 0), IDLE_POLL)
+            with self._lock:
+                self._out += self._pending
+                del self._pending[:]
+            if streaming and self.rate is None and not self._out:
+                self._send(self._next_frame())
+            writers = [self._master] if self._out else []
+            try:
+                readable, writable, _ = select.select(
+                    [self._master], writers, [], timeout)
+            except (OSError, ValueError):
+                return
+            if readable:
+                try:
+                    data = os.read(self._master, 256)
+                except OSError:
+                    data = b''
+                if data:
+                    self._process_commands(data)
+            if writable:
+                self._flush_out()
+            if (streaming and self.rate is not None and
+                    time.monotonic() >= next_due):
+                self._send(self._next_frame())
+                # Do not try to catch up after a long stall
+                next_due = max(
+                    next_due + 1.0 / self.rate, time.monotonic() - 1.0)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    PARSER = ArgumentParser(description="Emulate a PMS5003 on a pseudo-terminal")
+    PARSER.add_argument(
+        "--rate", type=float, default=DEFAULT_FRAME_RATE,
+        help="Frames per second in active mode, 0 for as fast as possible")
+    PARSER.add_argument(
+        "--line-rate", action="store_true",
+        help="Send frames back to back at the 9600 baud line rate, about "
+             "%.0f per second" % LINE_FRAME_RATE)
+    for NAME in FAULTS:
+        PARSER.add_argument(
+            "--" + NAME.replace("_", "-"), type=float, default=0,
+            help="Probability of sending a %s fault" % NAME)
+    ARGS = PARSER.parse_args()
+    EMULATOR = PMS5003Emulator(
+        rate=LINE_FRAME_RATE if ARGS.line_rate else ARGS.rate or None,
+        fault_rates=dict((NAME, getattr(ARGS, NAME)) for NAME in FAULTS))
+    EMULATOR.start()
+    print("Emulated sensor on %s, Ctrl+C to stop" % EMULATOR.port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        EMULATOR.stop()
@@ -0,0 +1,218 @@
+"""
+    Lightweight counters and latency histograms.
+    Objects take an optional Metrics registry and skip all instrumentation
+    when none is given. The registry can be read as a dict snapshot or in
+    the Prometheus text format, optionally served over HTTP.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.0,
+    5.0, float("inf"))
+
+DEFAULT_METRICS_ADDRESS = "127.0.0.1"
+
+class Counter(object):
+    """
+        Monotonically increasing count
+    """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Histogram(object):
+    """
+        Distribution of observed values in fixed buckets
+    """
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+class TimedLock(object):
+    """
+        Wraps a lock and records how long each acquisition waited
+    """
+    def __init__(self, lock, histogram):
+        self.lock = lock
+        self.histogram = histogram
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.histogram.observe(time.perf_counter() - start)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.lock.release()
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels)
+
+class Metrics(object):
+    """
+        Registry of counters, histograms and collectors
+    """
+    def __init__(self):
+        self._metrics = {} # (name, labels) -> metric
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = factory()
+                self._metrics[key] = metric
+                self._help.setdefault(name, (kind, help_text))
+        return metric
+
+    def counter(self, name, help_text="", **labels):
+        """
+            Returns the counter with this name and labels, creating it if needed
+        """
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS, **labels):
+        """
+            Returns the histogram with this name and labels, creating it if needed
+        """
+        return self._get(
+            "histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def add_collector(self, name, help_text, labels, func):
+        """
+            Registers a counter whose value is read from func() when a
+            snapshot is taken, for counts that are kept elsewhere anyway
+        """
+        with self._lock:
+            self._collectors.append(
+                (name, tuple(sorted(labels.items())), func))
+            self._help.setdefault(name, ("counter", help_text))
+
+    def relabel(self, labels, **changes):
+        """
+            Changes the labels of every metric and collector carrying all of
+            labels, keeping their values, as when a sensor moves to a new port
+        """
+        match = set(labels.items())
+
+        def moved(key):
+            if not match.issubset(key):
+                return key
+            updated = dict(key)
+            updated.update(changes)
+            return tuple(sorted(updated.items()))
+
+        with self._lock:
+            self._metrics = dict(
+                ((name, moved(key)), metric)
+                for (name, key), metric in self._metrics.items())
+            self._collectors = [
+                (name, moved(key), func)
+                for name, key, func in self._collectors]
+
+    def _items(self):
+        with self._lock:
+            metrics = list(self._metrics.items())
+            collectors = list(self._collectors)
+        for (name, labels), metric in metrics:
+            yield name, labels, metric
+        for name, labels, func in collectors:
+            counter = Counter()
+            counter.value = func()
+            yield name, labels, counter
+
+    def snapshot(self):
+        """
+            Returns the current values as a dict keyed by name, then by labels
+        """
+        result = {}
+        for name, labels, metric in self._items():
+            if isinstance(metric, Histogram):
+                value = {
+                    "count": metric.count,
+                    "sum": metric.sum,
+                    "buckets": dict(zip(metric.buckets, metric.counts)),
+                }
+            else:
+                value = metric.value
+            result.setdefault(name, {})[labels] = value
+        return result
+
+    def exposition(self):
+        """
+            Returns the current values in the Prometheus text format
+        """
+        by_name = {}
+        for name, labels, metric in self._items():
+            by_name.setdefault(name, []).append((labels, metric))
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text = self._help[name]
+            if help_text:
+                lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for labels, metric in by_name[name]:
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, metric.counts):
+                        cumulative += count
+                        bucket_labels = labels + (
+                            ("le", "+Inf" if bound == float("inf") else repr(bound)),)
+                        lines.append("%s_bucket%s %d" % (
+                            name, _format_labels(bucket_labels), cumulative))
+                    lines.append("%s_sum%s %r" % (
+                        name, _format_labels(labels), metric.sum))
+                    lines.append("%s_count%s %d" % (
+                        name, _format_labels(labels), metric.count))
+                else:
+                    lines.append("%s%s %s" % (
+                        name, _format_labels(labels), metric.value))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, address=DEFAULT_METRICS_ADDRESS):
+        """
+            Serves the exposition over HTTP from a daemon thread.
+            Returns the server, call shutdown() on it to stop
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,196 @@
+"""
+    Pipelined polling of Plantower sensors in passive mode.
+    Read requests are sent to every sensor in staggered rounds and the
+    responses matched as they arrive, instead of blocking and sleeping after
+    every request. The time a sensor needs between requests is learnt from
+    its responses.
+"""
+
+import time
+
+from .array import PlantowerArray
+from .plantower import (
+    DEFAULT_BAUD_RATE,
+    DEFAULT_READ_TIMEOUT,
+    DEFAULT_LOGGING_LEVEL,
+    MODE_CHANGE_DELAY,
+    PMS_PASSIVE_MODE,
+    PMS_CMD_READ_IN_PASSIVE
+)
+
+DEFAULT_POLL_INTERVAL = 1.0 # Target time between requests to the same sensor
+MIN_HOLDOFF = 0.05 # First back off applied when a sensor stops answering
+MAX_HOLDOFF = 5.0 # Longest back off between requests to a silent sensor
+HOLDOFF_DECAY = 0.9 # Back off reduction after every answered request
+
+class PollState(object):
+    """
+        Scheduling state and statistics of one passive sensor
+    """
+    __slots__ = (
+        "next_due", "sent", "sent_ns", "holdoff", "polls", "responses",
+        "timeouts", "unsolicited", "latency_total", "latency_min",
+        "latency_max", "started")
+
+    def __init__(self, next_due):
+        self.next_due = next_due
+        self.sent = None # When the outstanding request was sent
+        self.sent_ns = None # Same in nanoseconds since the epoch, as frames are stamped
+        self.holdoff = 0.0 # Learnt minimum gap after a response
+        self.polls = 0
+        self.responses = 0
+        self.timeouts = 0
+        self.unsolicited = 0
+        self.latency_total = 0.0
+        self.latency_min = None
+        self.latency_max = None
+        self.started = next_due
+
+    def record_response(self, latency):
+        self.sent = None
+        self.sent_ns = None
+        self.responses += 1
+        self.latency_total += latency
+        if self.latency_min is None or latency < self.latency_min:
+            self.latency_min = latency
+        if self.latency_max is None or latency > self.latency_max:
+            self.latency_max = latency
+        self.holdoff *= HOLDOFF_DECAY
+        if self.holdoff < MIN_HOLDOFF / 10:
+            self.holdoff = 0.0
+
+    def record_timeout(self):
+        self.sent = None
+        self.sent_ns = None
+        self.timeouts += 1
+        self.holdoff = min(max(self.holdoff * 2, MIN_HOLDOFF), MAX_HOLDOFF)
+
+class PassivePoller(PlantowerArray):
+    """
+        Polls many PMS5003 sensors in passive mode from one thread
+    """
+    def __init__(
+            self, ports=None, interval=DEFAULT_POLL_INTERVAL,
+            response_timeout=DEFAULT_READ_TIMEOUT, set_passive=True,
+            baud=DEFAULT_BAUD_RATE, log_level=DEFAULT_LOGGING_LEVEL):
+        """
+            interval is the target time between two requests to the same
+            sensor, 0 polls each sensor as fast as it answers.
+            If set_passive is true the sensors are put into passive mode
+        """
+        self.interval = interval
+        self.response_timeout = response_timeout
+        self.poll_state = {}
+        PlantowerArray.__init__(self, ports, baud, log_level)
+        now = time.monotonic()
+        start = now
+        if set_passive:
+            self.mode_change(PMS_PASSIVE_MODE)
+            start += MODE_CHANGE_DELAY
+        # Spread the requests over the interval so the sensors are not all
+        # asked at the same moment
+        stagger = interval / len(self.sensors) if self.sensors else 0
+        for i, sensor_id in enumerate(self.sensors):
+            self.poll_state[sensor_id] = PollState(start + i * stagger)
+
+    def add_sensor(self, sensor_id, port):
+        sensor = PlantowerArray.add_sensor(self, sensor_id, port)
+        self.poll_state[sensor_id] = PollState(time.monotonic())
+        return sensor
+
+    def remove_sensor(self, sensor_id):
+        PlantowerArray.remove_sensor(self, sensor_id)
+        self.poll_state.pop(sensor_id, None)
+
+    def _send_due(self, now):
+        """
+            Sends a read request to every idle sensor that is due one
+        """
+        for sensor_id, sensor in self.sensors.items():
+            state = self.poll_state[sensor_id]
+            if state.sent is None and state.next_due <= now:
+                sensor.serial.write(PMS_CMD_READ_IN_PASSIVE)
+                state.sent = now
+                state.sent_ns = time.time_ns()
+                state.polls += 1
+
+    def _expire(self, now):
+        """
+            Gives up on requests that have not been answered in time
+        """
+        for sensor_id, state in self.poll_state.items():
+            if (state.sent is not None and
+                    now - state.sent > self.response_timeout):
+                self.logger.debug("Sensor %s did not answer", sensor_id)
+                state.record_timeout()
+                state.next_due = now + state.holdoff
+
+    def _next_event(self, now):
+        """
+            Returns how long until a request is due or times out
+        """
+        events = []
+        for sensor_id in self.sensors:
+            state = self.poll_state[sensor_id]
+            if state.sent is None:
+                events.append(state.next_due)
+            else:
+                events.append(state.sent + self.response_timeout)
+        if not events:
+            return None
+        return max(min(events) - now, 0)
+
+    def poll_frames(self, timeout=None):
+        """
+            Sends any due requests, then waits up to timeout seconds for
+            responses. Returns (sensor_id, timestamp_ns, frame) tuples.
+            Each response is timed from its request to the read that
+            completed it. Frames without a request outstanding, or read
+            before it was sent, are counted as unsolicited and dropped
+        """
+        now = time.monotonic()
+        self._send_due(now)
+        wait = self._next_event(now)
+        if timeout is not None and (wait is None or timeout < wait):
+            wait = timeout
+        responses = []
+        for item in PlantowerArray.poll_frames(self, wait):
+            sensor_id, received, _ = item
+            state = self.poll_state.get(sensor_id)
+            if state is None:
+                continue
+            if state.sent is None or received < state.sent_ns:
+                state.unsolicited += 1
+                continue
+            latency = (received - state.sent_ns) / 1e9
+            sent = state.sent
+            state.record_response(latency)
+            state.next_due = max(
+                sent + self.interval, sent + latency + state.holdoff)
+            responses.append(item)
+        self._expire(time.monotonic())
+        return responses
+
+    def stats(self):
+        """
+            Returns a dict of per sensor statistics: requests sent, responses,
+            timeouts, achieved poll rate in Hz and response latency in seconds
+        """
+        now = time.monotonic()
+        result = {}
+        for sensor_id, state in self.poll_state.items():
+            elapsed = now - state.started
+            result[sensor_id] = {
+                "polls": state.polls,
+                "responses": state.responses,
+                "timeouts": state.timeouts,
+                "unsolicited": state.unsolicited,
+                "rate_hz": state.responses / elapsed if elapsed > 0 else 0.0,
+                "latency_avg": (
+                    state.latency_total / state.responses
+                    if state.responses else None),
+                "latency_min": state.latency_min,
+                "latency_max": state.latency_max,
+                "holdoff": state.holdoff,
+            }
+        return result
@@ -9,13 +9,29 @@ import time
 from datetime import datetime, timezone, timedelta
 from serial import Serial, SerialException
 
+try:
+    from termios import error as TermiosError
+except ImportError: # Not on a POSIX system
+    TermiosError = OSError
+
 DEFAULT_SERIAL_PORT = "/dev/ttyUSB0" # Serial port to use if no other specified
 DEFAULT_BAUD_RATE = 9600 # Serial baud rate to use if no other specified
 DEFAULT_SERIAL_TIMEOUT = 2 # Serial timeout to use if not specified
 DEFAULT_READ_TIMEOUT = 1 #How long to sit looking for the correct character sequence.
+ACTIVE_FRAME_PERIOD = 2.3 # Longest time between frames in active mode, in stable air
 
 DEFAULT_LOGGING_LEVEL = logging.WARN
 
+MODE_CHANGE_DELAY = 0.2 # Time the sensor is busy after a mode change
+PASSIVE_READ_DELAY = 0.5 # Time the sensor is busy after a passive read
+SLEEP_CMD_DELAY = 2 # Time the sensor ignores commands after sleep/wakeup
+
+RECONNECT_MIN_DELAY = 0.1 # First wait before reopening a failed port
+RECONNECT_MAX_DELAY = 5 # Longest wait between attempts to reopen a port
+
+# Raised by pyserial when the adapter is unplugged or reset
+SERIAL_ERRORS = (SerialException, OSError, TermiosError)
+
 MSG_CHAR_1 = b'\x42' # First character to be recieved in a valid packet
 MSG_CHAR_2 = b'\x4d' # Second character to be recieved in a valid packet
 
@@ -28,28 +44,78 @@ PMS_CMD_TO_SLEEP = b'\x42\x4d\xe4\x00\x00\x01\x73'
 PMS_CMD_TO_WAKEUP = b'\x42\x4d\xe4\x00\x01\x01\x74'
 PMS_CMD_READ_IN_PASSIVE = b'\x42\x4d\xe2\x00\x00\x01\x71'
 
+FRAME_HEADER = MSG_CHAR_1 + MSG_CHAR_2 # Start of every data frame
+FRAME_LENGTH = 32 # Total length of a data frame including header and checksum
+FRAME_DATA_LENGTH = FRAME_LENGTH - 4 # Value of the length field in a data frame
+SERIAL_BUFFER_SIZE = 4095 # Bytes a tty holds before incoming data is lost
+OVERRUN_WARNING_INTERVAL = 60 # Seconds between receive buffer full warnings
+
+# Data fields in the order they appear in a frame, each one a big endian word
+# starting at byte 4
+READING_FIELDS = (
+    "pm10_cf1", "pm25_cf1", "pm100_cf1",
+    "pm10_std", "pm25_std", "pm100_std",
+    "gr03um", "gr05um", "gr10um", "gr25um", "gr50um", "gr100um")
+
+def checksum_ok(frame):
+    """
+        Checks the last 2 bytes of a single frame against the sum of the
+        other bytes, without raising or logging
+    """
+    view = memoryview(frame)
+    return ((view[-2] << 8) | view[-1]) == sum(view[:-2])
+
+def _field_property(index):
+    """
+        Creates a read only property decoding one data field from the payload
+    """
+    offset = index * 2
+    def getter(self):
+        return (self._payload[offset] << 8) | self._payload[offset + 1]
+    getter.__doc__ = READING_FIELDS[index]
+    return property(getter)
+
 class PlantowerReading(object):
     """
-        Describes a single reading from the PMS5003 sensor
+        Describes a single reading from the PMS5003 sensor.
+        Only the raw data bytes and an integer timestamp are stored, field
+        values and the datetime are decoded when they are accessed
     """
-    def __init__(self, line):
+    __slots__ = ("_payload", "timestamp_ns")
+
+    def __init__(self, line, timestamp_ns=None):
         """
             Takes a line from the Plantower serial port and converts it into
-            an object containing the data
-        """
-        self.timestamp = datetime.now(timezone.utc)
-        self.pm10_cf1 = round(line[4] * 256 + line[5], 1)
-        self.pm25_cf1 = round(line[6] * 256 + line[7], 1)
-        self.pm100_cf1 = round(line[8] * 256 + line[9], 1)
-        self.pm10_std = round(line[10] * 256 + line[11], 1)
-        self.pm25_std = round(line[12] * 256 + line[13], 1)
-        self.pm100_std = round(line[14] * 256 + line[15], 1)
-        self.gr03um = round(line[16] * 256 + line[17], 1)
-        self.gr05um = round(line[18] * 256 + line[19], 1)
-        self.gr10um = round(line[20] * 256 + line[21], 1)
-        self.gr25um = round(line[22] * 256 + line[23], 1)
-        self.gr50um = round(line[24] * 256 + line[25], 1)
-        self.gr100um = round(line[26] * 256 + line[27], 1)
+            an object containing the data.
+            timestamp_ns is the reception time in nanoseconds since the epoch,
+            defaults to now
+        """
+        self._payload = bytes(line[4:4 + 2 * len(READING_FIELDS)])
+        self.timestamp_ns = (
+            time.time_ns() if timestamp_ns is None else timestamp_ns)
+
+    @property
+    def timestamp(self):
+        """
+            Reception time as a timezone aware datetime
+        """
+        seconds, nanoseconds = divmod(self.timestamp_ns, 1000000000)
+        return (
+            datetime.fromtimestamp(seconds, timezone.utc) +
+            timedelta(microseconds=nanoseconds // 1000))
+
+    pm10_cf1 = _field_property(0)
+    pm25_cf1 = _field_property(1)
+    pm100_cf1 = _field_property(2)
+    pm10_std = _field_property(3)
+    pm25_std = _field_property(4)
+    pm100_std = _field_property(5)
+    gr03um = _field_property(6)
+    gr05um = _field_property(7)
+    gr10um = _field_property(8)
+    gr25um = _field_property(9)
+    gr50um = _field_property(10)
+    gr100um = _field_property(11)
 
     def __str__(self):
         return (
@@ -65,6 +131,112 @@ class PlantowerException(Exception):
     """
     pass
 
+class PlantowerTimeout(PlantowerException):
+    """
+        No frame arrived in time, the data received so far was not invalid
+    """
+    pass
+
+class PlantowerFrameParser(object):
+    """
+        Incremental parser for the Plantower serial protocol.
+        Accepts arbitrary chunks of bytes as they arrive from the serial port,
+        keeps partial frames between calls and hands out complete frames
+        that have passed the checksum.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self.frames_ok = 0 # Number of frames that passed the checksum
+        self.bad_checksums = 0 # Number of frames dropped due to the checksum
+        self.bytes_discarded = 0 # Number of bytes skipped while resyncing
+
+    def reset(self):
+        """
+            Drops any partially received data
+        """
+        self.bytes_discarded += len(self._buffer)
+        del self._buffer[:]
+
+    def feed(self, data):
+        """
+            Adds a chunk of data received from the serial port
+        """
+        self._buffer += data
+
+    def bytes_needed(self):
+        """
+            Returns the minimum number of bytes required before another frame
+            can possibly be completed
+        """
+        return max(FRAME_LENGTH - len(self._buffer), 1)
+
+    def next_frame(self):
+        """
+            Returns the next complete and verified frame from the buffered
+            data, or None if more data is needed
+        """
+        buf = self._buffer
+        while True:
+            start = buf.find(FRAME_HEADER)
+            if start < 0:
+                # Keep a trailing first header byte, it may be completed later
+                keep = 1 if buf[-1:] == MSG_CHAR_1 else 0
+                self.bytes_discarded += len(buf) - keep
+                del buf[:len(buf) - keep]
+                return None
+            if start:
+                self.bytes_discarded += start
+                del buf[:start]
+            if len(buf) < FRAME_LENGTH:
+                return None
+            frame = bytes(buf[:FRAME_LENGTH])
+            length = (frame[2] << 8) | frame[3]
+            if length == FRAME_DATA_LENGTH and checksum_ok(frame):
+                del buf[:FRAME_LENGTH]
+                self.frames_ok += 1
+                return frame
+            # Not a valid frame, skip this header and look for the next one
+            self.bad_checksums += 1
+            self.bytes_discarded += 2
+            del buf[:2]
+
+    def frames(self):
+        """
+            Generator returning all the complete frames currently buffered
+        """
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+class StreamStats(object):
+    """
+        Counts kept by Plantower.stream
+    """
+    __slots__ = ("frames", "reads", "dropped", "discarded", "overruns", "max_backlog")
+
+    def __init__(self):
+        self.frames = 0 # Frames delivered
+        self.reads = 0 # Reads that completed at least one frame
+        self.dropped = 0 # Frames lost to a bad checksum while streaming
+        # Bytes skipped while resyncing, what is left of frames cut short,
+        # for instance by an overrun. Bytes the full buffer never took in
+        # cannot be counted.
+        self.discarded = 0
+        # Reads that found the receive buffer full, bytes may have been lost
+        # before reaching the parser
+        self.overruns = 0
+        self.max_backlog = 0 # Most frames completed by a single read
+
+def _close_quietly(serial):
+    """
+        Closes a port that may already be broken
+    """
+    try:
+        serial.close()
+    except SERIAL_ERRORS:
+        pass
+
 class Plantower(object):
     """
         Actual interface to the PMS5003 sensor
@@ -73,9 +245,16 @@ class Plantower(object):
             self, port=DEFAULT_SERIAL_PORT, baud=DEFAULT_BAUD_RATE,
             serial_timeout=DEFAULT_SERIAL_TIMEOUT,
             read_timeout=DEFAULT_READ_TIMEOUT,
-            log_level=DEFAULT_LOGGING_LEVEL):
+            log_level=DEFAULT_LOGGING_LEVEL, metrics=None,
+            reconnect_timeout=None, resolver=None):
         """
-            Setup the interface for the sensor
+            Setup the interface for the sensor.
+            metrics is an optional plantower.metrics.Metrics registry.
+            With reconnect_timeout set, a failing port is reopened for up to
+            that many seconds, with exponential backoff, before a
+            PlantowerException is raised. resolver, if given, is called
+            without arguments to get the port to reopen, so a port that was
+            renumbered is followed
         """
         self.logger = logging.getLogger("PMS5003 Interface")
         self.logger.setLevel(log_level)
@@ -87,14 +266,150 @@ class Plantower(object):
         self.logger.info("Serial Timeout: %s", self.serial_timeout)
         self.read_timeout = read_timeout
         self.logger.info("Read Timeout: %s", self.read_timeout)
+        self.reconnect_timeout = reconnect_timeout
+        self.resolver = resolver
+        self.mode = None # Last mode set with mode_change, restored on reconnect
+        self.reconnects = 0 # Number of times the port was reopened
         try:
-            self.serial = Serial(
-                port=self.port, baudrate=self.baud,
-                timeout=self.serial_timeout)
+            self.serial = self._open()
             self.logger.debug("Port Opened Successfully")
         except SerialException as exp:
             self.logger.error(str(exp))
             raise PlantowerException(str(exp))
+        self.parser = PlantowerFrameParser()
+        self.stream_stats = StreamStats()
+        self._overrun_warned = None # When the last overrun was logged
+        # Time between frames in active mode, measured while streaming
+        self.frame_period = ACTIVE_FRAME_PERIOD
+        self._last_read = (None, 0) # Time of the last read and its frame count
+        self.metrics = metrics
+        if metrics is not None:
+            self._setup_metrics(metrics)
+
+    def _setup_metrics(self, metrics):
+        """
+            Registers this sensor's counters, the parser counts are read
+            only when a snapshot is taken. Checksum failures are counted
+            by the parser, read_timeouts only counts reads that timed out
+        """
+        parser = self.parser
+        labels = {"port": self.port}
+        metrics.add_collector(
+            "plantower_frames_ok_total", "Frames that passed the checksum",
+            labels, lambda: parser.frames_ok)
+        metrics.add_collector(
+            "plantower_bad_checksums_total", "Frames dropped by the checksum",
+            labels, lambda: parser.bad_checksums)
+        metrics.add_collector(
+            "plantower_bytes_discarded_total", "Bytes skipped while resyncing",
+            labels, lambda: parser.bytes_discarded)
+        self._read_timeouts = metrics.counter(
+            "plantower_read_timeouts_total", "Reads that returned no frame",
+            **labels)
+        self._port_failures = metrics.counter(
+            "plantower_port_failures_total",
+            "Reads given up because the port could not be reopened", **labels)
+        self._read_latency = metrics.histogram(
+            "plantower_read_seconds", "Time taken by read", **labels)
+        self._passive_latency = metrics.histogram(
+            "plantower_passive_response_seconds",
+            "Time from a passive read request to its frame", **labels)
+        metrics.add_collector(
+            "plantower_reconnects_total", "Times the port was reopened",
+            labels, lambda: self.reconnects)
+        stats = self.stream_stats
+        metrics.add_collector(
+            "plantower_stream_dropped_total",
+            "Frames lost to a bad checksum while streaming",
+            labels, lambda: stats.dropped)
+        metrics.add_collector(
+            "plantower_stream_discarded_bytes_total",
+            "Bytes skipped while resyncing the stream, as after an overrun",
+            labels, lambda: stats.discarded)
+        metrics.add_collector(
+            "plantower_stream_overruns_total",
+            "Stream reads that found the receive buffer full",
+            labels, lambda: stats.overruns)
+
+    def _set_port(self, port):
+        """
+            Follows the sensor to a new port, moving its metrics to the
+            new port label with their counts
+        """
+        if port != self.port and self.metrics is not None:
+            self.metrics.relabel({"port": self.port}, port=port)
+        self.port = port
+
+    def _open(self):
+        return Serial(
+            port=self.port, baudrate=self.baud, timeout=self.serial_timeout)
+
+    def _reconnect(self, exp, deadline):
+        """
+            Reopens the port after a serial failure, following renumbering
+            and restoring the mode. The parser is kept, so a frame cut by
+            the failure is dropped by its checksum and counted as usual
+        """
+        self.logger.warning("Serial failure on %s: %s", self.port, exp)
+        _close_quietly(self.serial)
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            serial = None
+            try:
+                if self.resolver is not None:
+                    self._set_port(self.resolver())
+                serial = self._open()
+                if self.mode is not None:
+                    serial.write(
+                        PMS_CMD_CHANGE_MODE_PASSIVE
+                        if self.mode == PMS_PASSIVE_MODE
+                        else PMS_CMD_CHANGE_MODE_ACTIVE)
+                    serial.flush()
+            except (PlantowerException,) + SERIAL_ERRORS as retry_exp:
+                if serial is not None:
+                    _close_quietly(serial)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.logger.error("Could not reopen the port: %s", retry_exp)
+                    if self.metrics is not None:
+                        self._port_failures.inc()
+                    raise PlantowerException(
+                        "Could not reopen the port: %s" % retry_exp)
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            self.serial = serial
+            self.reconnects += 1
+            self.logger.warning("Reopened port %s", self.port)
+            if self.mode is not None:
+                time.sleep(MODE_CHANGE_DELAY)
+            return
+
+    def _call(self, operation, *args):
+        """
+            Runs operation, reconnecting and running it again after a serial
+            failure when reconnection is enabled. A port that keeps failing
+            right after being reopened gives up after reconnect_timeout too
+        """
+        deadline = None
+        while True:
+            try:
+                return operation(*args)
+            except SERIAL_ERRORS as exp:
+                if self.reconnect_timeout is None:
+                    raise
+                if deadline is None:
+                    deadline = time.monotonic() + self.reconnect_timeout
+                elif time.monotonic() >= deadline:
+                    self.logger.error("Port keeps failing: %s", exp)
+                    if self.metrics is not None:
+                        self._port_failures.inc()
+                    raise PlantowerException("Port keeps failing: %s" % exp)
+                self._reconnect(exp, deadline)
+
+    def _write(self, command):
+        self.serial.write(command)
+        self.serial.flush()  # Make sure tx buffer is completely sent
 
     def set_log_level(self, log_level):
         """
@@ -107,17 +422,56 @@ class Plantower(object):
             Uses the last 2 bytes of the data packet from the Plantower sensor
             to verify that the data recived is correct
         """
-        calc = 0
-        ord_arr = []
-         #Add all the bytes together except the checksum bytes
-        for char in bytearray(recv[:-2]):
-            calc += char
-            ord_arr.append(char)
-        self.logger.debug(str(ord_arr))
+        if checksum_ok(recv):
+            return
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(str(list(bytearray(recv[:-2]))))
         sent = (recv[-2] << 8) | recv[-1] # Combine the 2 bytes together
-        if sent != calc:
-            self.logger.error("Checksum failure %d != %d", sent, calc)
+        self.logger.error(
+            "Checksum failure %d != %d", sent, sum(bytearray(recv[:-2])))
+        raise PlantowerException("Checksum failure")
+
+    def read_frame(self, perform_flush=True):
+        """
+            Reads a raw frame from the serial port and returns it
+            if perform_flush is set to true it will flush the serial buffer
+            before performing the read, otherwise, it'll just read the first
+            item in the buffer
+        """
+        if self.metrics is None:
+            return self._call(self._read_frame, perform_flush)
+        start = time.perf_counter()
+        try:
+            frame = self._call(self._read_frame, perform_flush)
+        except PlantowerTimeout:
+            self._read_timeouts.inc()
+            raise
+        self._read_latency.observe(time.perf_counter() - start)
+        return frame
+
+    def _read_frame(self, perform_flush):
+        if perform_flush:
+            self.serial.reset_input_buffer()  #Flush any data in the buffer
+            self.parser.reset()
+        frame = self.parser.next_frame() # May already have one buffered
+        if frame is not None:
+            return frame
+        bad_checksums = self.parser.bad_checksums
+        deadline = time.monotonic() + self.read_timeout
+        while time.monotonic() < deadline:
+            # Wait for at least enough for a frame, then take whatever is there
+            inp = self.serial.read(
+                max(self.parser.bytes_needed(), self.serial.in_waiting))
+            if not inp:
+                continue
+            self.parser.feed(inp)
+            frame = self.parser.next_frame()
+            if frame is not None:
+                return frame
+        if self.parser.bad_checksums != bad_checksums:
+            self.logger.error("Checksum failure")
             raise PlantowerException("Checksum failure")
+        raise PlantowerTimeout("No message recieved")
 
     def read(self, perform_flush=True):
         """
@@ -126,24 +480,108 @@ class Plantower(object):
             before performing the read, otherwise, it'll just read the first
             item in the buffer
         """
-        recv = b''
-        start = datetime.now(timezone.utc) #Start timer
-        if perform_flush:
-            self.serial.reset_input_buffer()  #Flush any data in the buffer
-        while(
-                datetime.now(timezone.utc) <
-                (start + timedelta(seconds=self.read_timeout))):
-            inp = self.serial.read() # Read a character from the input
-            if inp == MSG_CHAR_1: # check it matches
-                recv += inp # if it does add it to recieve string
-                inp = self.serial.read() # read the next character
-                if inp == MSG_CHAR_2: # check it's what's expected
-                    recv += inp # att it to the recieve string
-                    recv += self.serial.read(30) # read the remaining 30 bytes
-                    self._verify(recv) # verify the checksum
-                    return PlantowerReading(recv) # convert to reading object
-            #If the character isn't what we are expecting loop until timeout
-        raise PlantowerException("No message recieved")
+        return PlantowerReading(self.read_frame(perform_flush))
+
+    def stream(self, batch=False):
+        """
+            Generator returning every reading in active mode, in order and
+            stamped with its arrival time. The serial buffer is never
+            flushed: everything already received is handed out before
+            waiting for more, so a slow consumer gets the backlog rather
+            than losing it.
+            With batch set, each step returns the list of readings
+            completed by one read of the port instead of a single reading.
+            Raises PlantowerException if no frame arrives within
+            read_timeout, the parser keeps any partial frame so a new
+            stream carries on where this one stopped.
+            Readings that queued up are stamped one frame_period apart,
+            the last one with the time of the read.
+            Drops and overruns are counted in stream_stats
+        """
+        while True:
+            frames, timestamp_ns = self._stream_frames()
+            readings = [
+                PlantowerReading(frame, frame_ns) for frame, frame_ns
+                in zip(frames, self._stamp(len(frames), timestamp_ns))]
+            if batch:
+                yield readings
+            else:
+                for reading in readings:
+                    yield reading
+
+    def _stamp(self, count, received_ns):
+        """
+            Timestamps of count frames completed by a read at received_ns.
+            Two reads in a row of a single frame give the frame period,
+            frames that queued up are spaced by it going back from the last
+            one, and never earlier than the previous frame
+        """
+        last, last_count = self._last_read
+        self._last_read = (received_ns, count)
+        if count == 1 and last_count == 1:
+            gap = received_ns - last
+            if 0 < gap <= 2e9 * ACTIVE_FRAME_PERIOD:
+                self.frame_period = gap / 1e9
+        step = int(self.frame_period * 1e9)
+        if count > 1 and last is not None:
+            step = max(min(step, (received_ns - last) // count), 0)
+        return [received_ns - (count - 1 - i) * step for i in range(count)]
+
+    def _stream_frames(self):
+        """
+            Next frames of the stream, counted in the same read metrics as
+            read_frame
+        """
+        if self.metrics is None:
+            return self._call(self._stream_read)
+        start = time.perf_counter()
+        try:
+            result = self._call(self._stream_read)
+        except PlantowerTimeout:
+            self._read_timeouts.inc()
+            raise
+        self._read_latency.observe(time.perf_counter() - start)
+        return result
+
+    def _stream_read(self):
+        """
+            Returns the frames completed by the next read and the time they
+            arrived
+        """
+        stats = self.stream_stats
+        bad_checksums = self.parser.bad_checksums
+        discarded = self.parser.bytes_discarded
+        try:
+            frames = list(self.parser.frames()) # Left over from a read()
+            timestamp_ns = time.time_ns()
+            deadline = time.monotonic() + self.read_timeout
+            while not frames:
+                if time.monotonic() >= deadline:
+                    raise PlantowerTimeout("No message recieved")
+                waiting = self.serial.in_waiting
+                if waiting >= SERIAL_BUFFER_SIZE:
+                    stats.overruns += 1
+                    now = time.monotonic()
+                    if (self._overrun_warned is None or
+                            now - self._overrun_warned >= OVERRUN_WARNING_INTERVAL):
+                        # Every overrun is counted, a slow consumer would
+                        # otherwise log one on every read
+                        self._overrun_warned = now
+                        self.logger.warning(
+                            "Receive buffer full, frames may have been lost "
+                            "(%d overruns so far)", stats.overruns)
+                inp = self.serial.read(max(self.parser.bytes_needed(), waiting))
+                timestamp_ns = time.time_ns()
+                if inp:
+                    self.parser.feed(inp)
+                    frames = list(self.parser.frames())
+        finally:
+            stats.dropped += self.parser.bad_checksums - bad_checksums
+            stats.discarded += self.parser.bytes_discarded - discarded
+        stats.reads += 1
+        stats.frames += len(frames)
+        stats.max_backlog = max(stats.max_backlog, len(frames))
+        return frames, timestamp_ns
 
     def mode_change(self, mode=PMS_PASSIVE_MODE):
         """
@@ -154,15 +592,14 @@ class Plantower(object):
         """
 
         if mode == PMS_PASSIVE_MODE:
-            self.serial.write(PMS_CMD_CHANGE_MODE_PASSIVE)
-            self.serial.flush()  # Make sure tx buffer is completely sent
+            self._call(self._write, PMS_CMD_CHANGE_MODE_PASSIVE)
             self.logger.info("Sensor set in passive mode")
         else:
-            self.serial.write(PMS_CMD_CHANGE_MODE_ACTIVE)
-            self.serial.flush()  # Make sure tx buffer is completely sent
+            self._call(self._write, PMS_CMD_CHANGE_MODE_ACTIVE)
             self.logger.info("Sensor set in active mode")
+        self.mode = mode
 
-        time.sleep(0.2)  # Wait sensor busy finished
+        time.sleep(MODE_CHANGE_DELAY)  # Wait sensor busy finished
 
     def read_in_passive(self, perform_flush=True):
         """
@@ -172,14 +609,28 @@ class Plantower(object):
              is same as the active mode.
         """
 
+        start = time.perf_counter()
+        ret = PlantowerReading(self._call(self._passive_frame, perform_flush))
+        if self.metrics is not None:
+            self._passive_latency.observe(time.perf_counter() - start)
+        time.sleep(PASSIVE_READ_DELAY)  # Wait sensor busy finished
+        return ret
+
+    def _passive_frame(self, perform_flush):
+        """
+            Requests a frame and reads it, run again as a whole if the port
+            has to be reopened
+        """
         if perform_flush:
             self.serial.reset_input_buffer()  # Flush any data in the buffer
-
-        self.serial.write(PMS_CMD_READ_IN_PASSIVE)
-        self.serial.flush()  # Make sure tx buffer is completely sent
-        ret = self.read(False)
-        time.sleep(0.5)  # Wait sensor busy finished
-        return ret
+            self.parser.reset()
+        self._write(PMS_CMD_READ_IN_PASSIVE)
+        try:
+            return self._read_frame(False)
+        except PlantowerTimeout:
+            if self.metrics is not None:
+                self._read_timeouts.inc()
+            raise
 
     def set_to_sleep(self, to_sleep=True):
         """
@@ -189,13 +640,11 @@ class Plantower(object):
         """
 
         if to_sleep:
-            self.serial.write(PMS_CMD_TO_SLEEP)
+            self._call(self._write, PMS_CMD_TO_SLEEP)
         else:
-            self.serial.write(PMS_CMD_TO_WAKEUP)
-
-        self.serial.flush()  # Make sure tx buffer is completely sent
+            self._call(self._write, PMS_CMD_TO_WAKEUP)
         # Number not specified in datasheet but sensor does not receive command for 2s.
-        time.sleep(2)  
+        time.sleep(SLEEP_CMD_DELAY)
 
     def set_to_wakeup(self):
         """
@@ -0,0 +1,231 @@
+"""
+    Append only binary storage of raw Plantower frames.
+    Each record is a little endian 64 bit timestamp in nanoseconds since the
+    epoch followed by the 32 byte frame, 40 bytes in total. The reader maps
+    the file into memory and finds time ranges with a binary search, returning
+    NumPy views of the records without copying them.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .batch import decode_frames
+from .plantower import (
+    PlantowerReading,
+    PlantowerException,
+    FRAME_LENGTH,
+    DEFAULT_LOGGING_LEVEL
+)
+
+FILE_MAGIC = b"PMSREC01"
+FILE_HEADER = struct.Struct("<8sII") # Magic, record size, reserved
+TIMESTAMP = struct.Struct("<q")
+RECORD_SIZE = TIMESTAMP.size + FRAME_LENGTH
+RECORD_DTYPE = np.dtype([("timestamp", "<i8"), ("frame", np.uint8, FRAME_LENGTH)])
+
+DEFAULT_SYNC_RECORDS = 60 # Records buffered before they are written and synced
+DEFAULT_SYNC_INTERVAL = 10.0 # Longest time in seconds a record stays buffered
+
+def to_timestamp_ns(value):
+    """
+        Converts a datetime, numpy datetime64 or integer nanoseconds since the
+        epoch into integer nanoseconds
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            raise PlantowerException("Naive datetime, a timezone is needed")
+        seconds = int(value.timestamp())
+        return seconds * 1000000000 + value.microsecond * 1000
+    if isinstance(value, np.datetime64):
+        return int(value.astype("datetime64[ns]").astype(np.int64))
+    return int(value)
+
+def _read_header(fh, path):
+    header = fh.read(FILE_HEADER.size)
+    if len(header) != FILE_HEADER.size:
+        raise PlantowerException("%s: incomplete header" % path)
+    magic, record_size, _ = FILE_HEADER.unpack(header)
+    if magic != FILE_MAGIC or record_size != RECORD_SIZE:
+        raise PlantowerException("%s: not a frame recording" % path)
+
+class FrameRecorder(object):
+    """
+        Appends frames to a recording, writing and syncing them in batches
+    """
+    def __init__(
+            self, path, sync_records=DEFAULT_SYNC_RECORDS,
+            sync_interval=DEFAULT_SYNC_INTERVAL,
+            log_level=DEFAULT_LOGGING_LEVEL):
+        """
+            Opens or creates the recording at path. Buffered records are
+            written and synced after sync_records records or sync_interval
+            seconds, whichever comes first
+        """
+        self.logger = logging.getLogger("PMS5003 Recorder")
+        self.logger.setLevel(log_level)
+        self.path = path
+        self.sync_records = sync_records
+        self.sync_interval = sync_interval
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._last_sync = time.monotonic()
+        self._last_timestamp = None
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            os.write(self._fd, FILE_HEADER.pack(FILE_MAGIC, RECORD_SIZE, 0))
+            os.fsync(self._fd)
+        else:
+            with open(path, "rb") as fh:
+                _read_header(fh, path)
+            # Drop a record that was only partly written before a crash
+            whole = (size - FILE_HEADER.size) // RECORD_SIZE
+            end = FILE_HEADER.size + whole * RECORD_SIZE
+            if end != size:
+                self.logger.warning(
+                    "Dropping %d bytes of a partial record", size - end)
+                os.ftruncate(self._fd, end)
+            if whole:
+                os.lseek(self._fd, end - RECORD_SIZE, os.SEEK_SET)
+                self._last_timestamp = TIMESTAMP.unpack(
+                    os.read(self._fd, TIMESTAMP.size))[0]
+        os.lseek(self._fd, 0, os.SEEK_END)
+
+    def write(self, frame, timestamp_ns=None):
+        """
+            Buffers one frame, timestamped now unless a timestamp is given.
+            Timestamps must not go backwards, an earlier one is replaced by
+            the last one written so the file stays sorted
+        """
+        if len(frame) != FRAME_LENGTH:
+            raise PlantowerException("Frames must be %d bytes long" % FRAME_LENGTH)
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        if self._last_timestamp is not None and timestamp_ns < self._last_timestamp:
+            self.logger.warning("Timestamp went backwards, clamping it")
+            timestamp_ns = self._last_timestamp
+        self._last_timestamp = timestamp_ns
+        self._buffer += TIMESTAMP.pack(timestamp_ns)
+        self._buffer += frame
+        self._buffered += 1
+        if (self._buffered >= self.sync_records or
+                time.monotonic() - self._last_sync >= self.sync_interval):
+            self.flush()
+
+    def flush(self):
+        """
+            Writes the buffered records and syncs them to disk
+        """
+        if self._buffer:
+            with memoryview(self._buffer) as view:
+                written = 0
+                while written < len(view):
+                    written += os.write(self._fd, view[written:])
+            del self._buffer[:]
+            self._buffered = 0
+            os.fsync(self._fd)
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._fd is not None:
+            self.flush()
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+class FrameLog(object):
+    """
+        Read only, memory mapped view of a recording
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, "rb")
+        _read_header(self._fh, path)
+        self._mmap = None
+        self.records = np.empty(0, dtype=RECORD_DTYPE)
+        self.refresh()
+
+    def refresh(self):
+        """
+            Maps records appended since the file was opened
+        """
+        size = os.fstat(self._fh.fileno()).st_size
+        count = (size - FILE_HEADER.size) // RECORD_SIZE
+        if count == len(self.records):
+            return
+        # The old mapping is released once no views of it are left
+        self._mmap = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.records = np.frombuffer(
+            self._mmap, dtype=RECORD_DTYPE, count=count,
+            offset=FILE_HEADER.size)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        return self.records["timestamp"]
+
+    def _bounds(self, start, end):
+        timestamps = self.timestamps
+        first = 0 if start is None else int(np.searchsorted(
+            timestamps, to_timestamp_ns(start), side="left"))
+        last = len(timestamps) if end is None else int(np.searchsorted(
+            timestamps, to_timestamp_ns(end), side="left"))
+        return first, last
+
+    def range(self, start=None, end=None):
+        """
+            Returns the records with start <= timestamp < end as a view.
+            start and end can be datetimes, datetime64 or nanoseconds
+        """
+        first, last = self._bounds(start, end)
+        return self.records[first:last]
+
+    def frames(self, start=None, end=None):
+        """
+            Returns an (N, 32) view of the frames in the time range
+        """
+        return self.range(start, end)["frame"]
+
+    def decode(self, start=None, end=None):
+        """
+            Decodes the frames in the time range with plantower.batch
+        """
+        records = self.range(start, end)
+        return decode_frames(records["frame"], records["timestamp"])
+
+    def readings(self, start=None, end=None):
+        """
+            Generator of PlantowerReading objects for the time range
+        """
+        for record in self.range(start, end):
+            yield PlantowerReading(
+                record["frame"].tobytes(), int(record["timestamp"]))
+
+    def close(self):
+        self.records = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass # Views handed out are still in use
+            self._mmap = None
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
@@ -0,0 +1,136 @@
+"""
+    Replays a recording made with plantower.recorder in place of a sensor.
+    Readings keep their original timestamps and can be delivered in real
+    time, N times faster or as fast as they are asked for.
+"""
+
+import logging
+import time
+
+from .plantower import (
+    PlantowerReading,
+    PlantowerException,
+    DEFAULT_LOGGING_LEVEL,
+    PMS_PASSIVE_MODE,
+    checksum_ok
+)
+from .recorder import FrameLog
+
+class ReplayPlantower(object):
+    """
+        Stands in for Plantower, reading frames from a recording
+    """
+    def __init__(
+            self, recording, speed=1.0, start=None, end=None,
+            log_level=DEFAULT_LOGGING_LEVEL):
+        """
+            recording is a path or an open FrameLog.
+            speed is the replay rate relative to real time, None or 0 replays
+            without any delay.
+            start and end limit the replay to a time range
+        """
+        self.logger = logging.getLogger("PMS5003 Replay")
+        self.logger.setLevel(log_level)
+        if not isinstance(recording, FrameLog):
+            recording = FrameLog(recording)
+        self.log = recording
+        self.speed = speed or None
+        self.port = recording.path
+        self._records = recording.range(start, end)
+        self._index = 0
+        self._wall_start = None
+        self.bad_checksums = 0 # Recorded frames skipped for their checksum
+
+    @property
+    def finished(self):
+        """
+            True once every frame has been replayed
+        """
+        return self._index >= len(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def _wait_for(self, timestamp_ns):
+        """
+            Sleeps until the frame is due at the replay speed
+        """
+        first = int(self._records[0]["timestamp"])
+        if self._wall_start is None:
+            self._wall_start = time.monotonic()
+        due = self._wall_start + (timestamp_ns - first) / 1e9 / self.speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _next_record(self):
+        """
+            Returns the next raw frame and its original timestamp, skipping
+            frames that fail the checksum as a sensor read would
+        """
+        while not self.finished:
+            record = self._records[self._index]
+            self._index += 1
+            frame = record["frame"].tobytes()
+            if not checksum_ok(frame):
+                self.bad_checksums += 1
+                self.logger.debug("Skipping a recorded frame with a bad checksum")
+                continue
+            timestamp_ns = int(record["timestamp"])
+            if self.speed is not None:
+                self._wait_for(timestamp_ns)
+            return frame, timestamp_ns
+        raise PlantowerException("End of recording")
+
+    def read_frame(self, perform_flush=True):
+        """
+            Returns the next raw frame.
+            Frames are never skipped so perform_flush is ignored
+        """
+        return self._next_record()[0]
+
+    def read(self, perform_flush=True):
+        """
+            Returns the next reading with its original timestamp.
+            Frames are never skipped so perform_flush is ignored
+        """
+        frame, timestamp_ns = self._next_record()
+        return PlantowerReading(frame, timestamp_ns)
+
+    def stream(self, batch=False):
+        """
+            Generator returning the remaining readings, with batch set each
+            step returns a list holding one reading. Stops at the end of the
+            recording
+        """
+        while True:
+            try:
+                reading = self.read()
+            except PlantowerException:
+                if self.finished:
+                    return
+                raise
+            yield [reading] if batch else reading
+
+    def read_in_passive(self, perform_flush=True):
+        return self.read(perform_flush)
+
+    def mode_change(self, mode=PMS_PASSIVE_MODE):
+        """
+            Commands have no effect on a recording
+        """
+        self.logger.debug("Ignoring mode change during replay")
+
+    def set_to_sleep(self, to_sleep=True):
+        self.logger.debug("Ignoring sleep command during replay")
+
+    def set_to_wakeup(self):
+        self.set_to_sleep(False)
+
+    def rewind(self):
+        """
+            Starts the replay again from the first frame
+        """
+        self._index = 0
+        self._wall_start = None
+        self.bad_checksums = 0
@@ -0,0 +1,114 @@
+"""
+    Detects when a sensor has finished warming up.
+    The datasheet asks for 30 seconds after wakeup before the data is stable,
+    but a sensor whose fan was already running is ready much sooner. Frames
+    are read during the warm up and the sensor is declared ready once enough
+    valid frames in a row have arrived and the readings have settled. The
+    fixed delay is only used as an upper bound.
+"""
+
+import time
+from collections import deque
+from serial import SerialException
+
+from .plantower import PlantowerException, PlantowerTimeout
+
+DEFAULT_MAX_WAIT = 30 # Datasheet time for stable data after wakeup
+DEFAULT_STREAK = 5 # Valid frames in a row needed before the data is trusted
+DEFAULT_WINDOW = 5 # Readings compared to decide if the values have settled
+DEFAULT_TOLERANCE = 0.15 # Allowed spread relative to the mean
+# Allowed spread regardless of the mean, so clean air does not look unsettled
+DEFAULT_FLOORS = {"pm25_cf1": 2, "gr03um": 50}
+
+WARMUP_READY = "ready"
+WARMUP_TIMEOUT = "timeout"
+WARMUP_PORT_LOST = "port lost"
+
+class WarmupDetector(object):
+    """
+        Decides from successive readings whether the sensor has settled
+    """
+    def __init__(
+            self, streak=DEFAULT_STREAK, window=DEFAULT_WINDOW,
+            tolerance=DEFAULT_TOLERANCE, floors=None):
+        """
+            floors maps the reading fields that are checked to the spread
+            always accepted for that field
+        """
+        self.streak = streak
+        self.tolerance = tolerance
+        self.floors = dict(floors or DEFAULT_FLOORS)
+        self._history = dict(
+            (field, deque(maxlen=window)) for field in self.floors)
+        self._valid = 0
+
+    def reset(self):
+        """
+            Called on an invalid frame, the streak starts again
+        """
+        self._valid = 0
+        for values in self._history.values():
+            values.clear()
+
+    def add(self, reading):
+        """
+            Adds a reading and returns True once the sensor looks ready
+        """
+        self._valid += 1
+        for field, values in self._history.items():
+            values.append(getattr(reading, field))
+        return self.ready
+
+    @property
+    def ready(self):
+        if self._valid < self.streak:
+            return False
+        nonzero = False
+        for field, values in self._history.items():
+            if len(values) < values.maxlen:
+                return False
+            low = min(values)
+            high = max(values)
+            mean = sum(values) / len(values)
+            if high - low > max(self.tolerance * mean, self.floors[field]):
+                return False
+            nonzero = nonzero or high > 0
+        # A fan that has only just started reports zeros for a while
+        return nonzero
+
+def wait_until_ready(
+        sensor, max_wait=DEFAULT_MAX_WAIT, min_wait=0, passive=False,
+        detector=None, progress=None):
+    """
+        Reads from the sensor until it looks ready or max_wait seconds have
+        passed. Use passive=True for a sensor in passive mode.
+        progress, if given, is called with the elapsed seconds after each read.
+        Returns WARMUP_READY, WARMUP_TIMEOUT or WARMUP_PORT_LOST if the
+        port stopped working, for instance because it was renumbered
+    """
+    if detector is None:
+        detector = WarmupDetector()
+    start = time.monotonic()
+    elapsed = 0
+    while elapsed < max_wait:
+        try:
+            if passive:
+                reading = sensor.read_in_passive()
+            else:
+                reading = sensor.read(perform_flush=False)
+            ready = detector.add(reading)
+        except PlantowerTimeout:
+            # In stable air frames come only every 2.3 s, longer than a
+            # read waits, so a timeout says nothing about the data
+            ready = False
+        except PlantowerException:
+            detector.reset()
+            ready = False
+        except (SerialException, OSError):
+            return WARMUP_PORT_LOST
+        elapsed = time.monotonic() - start
+        if progress is not None:
+            progress(elapsed)
+        if ready and elapsed >= min_wait:
+            return WARMUP_READY
+    return WARMUP_TIMEOUT
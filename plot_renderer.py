@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+def decimate_minmax(x, y, bins):
+    # Reduces a series to at most about 2 * bins points, keeping the minimum
+    # and maximum of every bin so peaks stay visible on screen
+    n = len(y)
+    bins = int(bins)
+    if bins <= 0 or n <= 2 * bins:
+        return x, y
+    size = n // bins
+    used = size * bins
+    rows = np.asarray(y[:used]).reshape(bins, size)
+    offsets = np.arange(bins) * size
+    low = offsets + rows.argmin(axis=1)
+    high = offsets + rows.argmax(axis=1)
+    # Keep each pair in time order
+    index = np.empty(2 * bins + n - used, dtype=np.intp)
+    index[0:2 * bins:2] = np.minimum(low, high)
+    index[1:2 * bins:2] = np.maximum(low, high)
+    index[2 * bins:] = np.arange(used, n)
+    return np.asarray(x)[index], np.asarray(y)[index]
+
+
+def _expand(low, high, data_low, data_high, headroom):
+    # Returns new limits if the data has left [low, high], otherwise None
+    if data_low >= low and data_high <= high:
+        return None
+    span = data_high - data_low
+    if span <= 0:
+        span = abs(data_high) or 1.0
+    return data_low - span * headroom, data_high + span * headroom
+
+
+class BlitRenderer:
+    """
+    Redraws only the animated artists of a figure on top of a cached
+    background. A full draw, which also refreshes the background, only
+    happens when the data leaves the current axis limits or the window is
+    resized.
+    """
+
+    X_HEADROOM = 0.25  # Room left on the time axis so new samples fit
+    Y_HEADROOM = 0.1
+
+    def __init__(self, fig, artists):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.artists = list(artists)
+        self._background = None
+        for artist in self.artists:
+            artist.set_animated(True)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def update_limits(self, ax, x, y):
+        # Moves the limits of ax when x or y leave them, returns True if they
+        # changed and the figure needs a full redraw
+        changed = False
+        if len(x):
+            xlim = _expand(*ax.get_xlim(), np.min(x), np.max(x), self.X_HEADROOM)
+            if xlim is not None:
+                ax.set_xlim(*xlim)
+                changed = True
+        if len(y):
+            ylim = _expand(*ax.get_ylim(), np.min(y), np.max(y), self.Y_HEADROOM)
+            if ylim is not None:
+                ax.set_ylim(*ylim)
+                changed = True
+        return changed
+
+    def render(self, full=False):
+        if full or self._background is None:
+            # Triggers draw_event, which caches the background
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+class SeriesStore:
+    """
+    Fixed capacity columnar ring buffer backed by NumPy arrays.
+
+    Every value is written twice, at slot i and i + capacity, so the last
+    len(store) values of a column are always contiguous. A column can then
+    be returned in chronological order as a view, without copying, which is
+    what matplotlib wants on every redraw. Appending is O(1).
+
+    A view is only valid until the next append, which may overwrite its
+    oldest element.
+    """
+
+    def __init__(self, capacity, columns):
+        # columns maps the column name to its NumPy dtype
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self._data = {name: self._allocate(name, dtype)
+                      for name, dtype in columns.items()}
+        self._arrays = tuple(self._data[name] for name in self.columns)
+        self._head = 0  # Slot written by the next append
+        self._count = 0
+
+    def _allocate(self, name, dtype):
+        # Storage of one column, 2 * capacity values
+        return np.zeros(2 * self.capacity, dtype=dtype)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, *values):
+        # One value per column, in column order
+        head = self._head
+        mirror = head + self.capacity
+        for array, value in zip(self._arrays, values):
+            array[head] = value
+            array[mirror] = value
+        self._head = head + 1 if head + 1 < self.capacity else 0
+        if self._count < self.capacity:
+            self._count += 1
+
+    def __getitem__(self, name):
+        end = self._head + self.capacity
+        return self._data[name][end - self._count:end]
+
+    def last(self, name):
+        if not self._count:
+            raise IndexError("SeriesStore is empty")
+        return self._data[name][self._head + self.capacity - 1]
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._arrays)
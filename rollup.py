@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+class RollupLevel:
+    """
+    Min, max, sum and count per field for fixed size time bins at one
+    resolution. The bins live in a ring, so only the most recent ones are
+    kept and memory never grows.
+    """
+
+    def __init__(self, seconds, bins, field_count):
+        self.seconds = seconds
+        self.bins = bins
+        self._bin_ns = seconds * 1_000_000_000
+        self.index = np.full(bins, -1, dtype=np.int64)  # Bin number held by each slot
+        self.count = np.zeros(bins, dtype=np.int64)
+        self.min = np.zeros((bins, field_count))
+        self.max = np.zeros((bins, field_count))
+        self.sum = np.zeros((bins, field_count))
+
+    def add(self, timestamp_ns, values):
+        number = timestamp_ns // self._bin_ns
+        slot = number % self.bins
+        held = self.index[slot]
+        if held != number:
+            if held > number:
+                return  # Older than anything kept at this resolution
+            self.index[slot] = number
+            self.count[slot] = 0
+            self.min[slot] = values
+            self.max[slot] = values
+            self.sum[slot] = 0
+        else:
+            np.minimum(self.min[slot], values, out=self.min[slot])
+            np.maximum(self.max[slot], values, out=self.max[slot])
+        self.count[slot] += 1
+        self.sum[slot] += values
+
+    def query(self, fields, start_ns=None, end_ns=None):
+        selected = self.index >= 0
+        if start_ns is not None:
+            selected &= self.index >= start_ns // self._bin_ns
+        if end_ns is not None:
+            selected &= self.index * self._bin_ns < end_ns
+        slots = np.flatnonzero(selected)
+        slots = slots[np.argsort(self.index[slots])]
+
+        dtype = [("start", "datetime64[s]"), ("count", np.int64)]
+        for field in fields:
+            dtype += [(f"{field}_min", np.float64), (f"{field}_max", np.float64), (f"{field}_mean", np.float64)]
+        result = np.empty(len(slots), dtype=dtype)
+        result["start"] = (self.index[slots] * self.seconds).astype("datetime64[s]")
+        result["count"] = self.count[slots]
+        for i, field in enumerate(fields):
+            result[f"{field}_min"] = self.min[slots, i]
+            result[f"{field}_max"] = self.max[slots, i]
+            result[f"{field}_mean"] = self.sum[slots, i] / self.count[slots]
+        return result
+
+
+class RollupEngine:
+    """
+    Streaming aggregates of every field at several resolutions, updated in
+    O(1) per sample and bounded in memory.
+    """
+
+    # (bin length in seconds, number of bins kept)
+    DEFAULT_RESOLUTIONS = (
+        (60, 24 * 60),  # 1 minute bins for a day
+        (3600, 90 * 24),  # 1 hour bins for 90 days
+        (86400, 10 * 366),  # 1 day bins for 10 years
+    )
+
+    def __init__(self, fields, resolutions=DEFAULT_RESOLUTIONS):
+        self.fields = tuple(fields)
+        self.levels = {seconds: RollupLevel(seconds, bins, len(self.fields))
+                       for seconds, bins in resolutions}
+
+    @property
+    def resolutions(self):
+        return sorted(self.levels)
+
+    def add(self, timestamp_ns, values):
+        # values holds one number per field, in field order
+        values = np.asarray(values, dtype=np.float64)
+        for level in self.levels.values():
+            level.add(timestamp_ns, values)
+
+    def query(self, resolution, start_ns=None, end_ns=None):
+        # Returns a structured array with one row per bin overlapping
+        # [start_ns, end_ns): start, count and min, max, mean of every field
+        if resolution not in self.levels:
+            raise ValueError(f"Unknown resolution {resolution}, use one of {self.resolutions}")
+        return self.levels[resolution].query(self.fields, start_ns, end_ns)
+
+    @property
+    def nbytes(self):
+        return sum(level.index.nbytes + level.count.nbytes + level.min.nbytes + level.max.nbytes + level.sum.nbytes
+                   for level in self.levels.values())
@@ -18,6 +18,7 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-     python_requires='>=3.3, <4',
-     install_requires=['pyserial']
+     python_requires='>=3.8',
+     install_requires=['pyserial'],
+     extras_require={'numpy': ['numpy']}
 )
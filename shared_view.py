@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ring_buffer import SeriesStore
+
+DEFAULT_SHARED_MEMORY_NAME = "plantower_live"
+HEADER_SIZE = 4096  # Sequence counter, descriptor length, writer PID and the JSON descriptor
+HEADER_FIELDS = 3
+DESCRIPTOR_OFFSET = 32
+ALIGNMENT = 64
+STATUS_SIZE = 256  # Bytes for each status text, including its length
+RETRY_DELAY = 0.0005  # Reader wait while a write is in progress
+READ_TIMEOUT = 1.0  # Longest a reader waits for a write to finish
+
+_created = set()  # Blocks created by a writer in this process
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(stores, status_fields):
+    # Places the head and count, then the columns of every store, then the
+    # status texts, and returns the positions as a JSON friendly dict
+    offset = HEADER_SIZE
+    layout = {"stores": {}, "status": {}}
+    for name, (capacity, columns) in stores.items():
+        entry = {"capacity": capacity, "state": offset, "columns": []}
+        offset += 16
+        for column, dtype in columns.items():
+            dtype = np.dtype(dtype)
+            offset = _align(offset)
+            entry["columns"].append([column, dtype.str, offset])
+            offset += 2 * capacity * dtype.itemsize
+        layout["stores"][name] = entry
+    for field in status_fields:
+        layout["status"][field] = offset
+        offset += STATUS_SIZE
+    layout["size"] = offset
+    return layout
+
+
+class SeqLock:
+    """
+    Writer side of a sequence lock. The counter is odd while a write is in
+    progress, so a reader knows its data is consistent when it saw the
+    same even value before and after reading.
+    """
+
+    def __init__(self, counter):
+        self._counter = counter
+        self._lock = threading.Lock()  # Writers may be in several threads
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._counter[0] += 1
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._counter[0] += 1
+        self._lock.release()
+
+
+class SharedSeriesStore(SeriesStore):
+    """
+    SeriesStore whose columns, head and count live in shared memory, every
+    change being made under the sequence lock.
+    """
+
+    def __init__(self, buffer, layout, seqlock):
+        self._buffer = buffer
+        self._offsets = {column: offset for column, _, offset in layout["columns"]}
+        self._state = np.ndarray(2, dtype=np.int64, buffer=buffer, offset=layout["state"])
+        self._seqlock = seqlock
+        super().__init__(layout["capacity"], {column: np.dtype(dtype) for column, dtype, _ in layout["columns"]})
+
+    def _allocate(self, name, dtype):
+        return np.ndarray(2 * self.capacity, dtype=dtype, buffer=self._buffer, offset=self._offsets[name])
+
+    def _get_head(self):
+        return int(self._state[0])
+
+    def _set_head(self, value):
+        self._state[0] = value
+
+    def _get_count(self):
+        return int(self._state[1])
+
+    def _set_count(self, value):
+        self._state[1] = value
+
+    _head = property(_get_head, _set_head)
+    _count = property(_get_count, _set_count)
+
+    def append(self, *values):
+        with self._seqlock:
+            super().append(*values)
+
+    def clear(self):
+        with self._seqlock:
+            super().clear()
+
+
+class LiveViewWriter:
+    """
+    Creates a shared memory block holding several SharedSeriesStore and a
+    few status texts, for a LiveViewReader in another process.
+    """
+
+    def __init__(self, name=DEFAULT_SHARED_MEMORY_NAME, stores=None, status_fields=()):
+        # stores maps a store name to (capacity, columns), columns mapping
+        # the column name to its NumPy dtype as for SeriesStore
+        layout = _layout(stores or {}, status_fields)
+        descriptor = json.dumps(layout).encode("utf-8")
+        if DESCRIPTOR_OFFSET + len(descriptor) > HEADER_SIZE:
+            raise ValueError("Too many columns for the shared memory header")
+        try:
+            self._shm = SharedMemory(name=name, create=True, size=layout["size"])
+        except FileExistsError:
+            remove_stale(name)
+            self._shm = SharedMemory(name=name, create=True, size=layout["size"])
+        self.name = name
+        _created.add(self._shm._name)
+        buffer = self._shm.buf
+        buffer[DESCRIPTOR_OFFSET:DESCRIPTOR_OFFSET + len(descriptor)] = descriptor
+        self._header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=buffer)
+        self._header[2] = os.getpid()
+        self._header[1] = len(descriptor)
+        self._seqlock = SeqLock(self._header)
+        self.stores = {store: SharedSeriesStore(buffer, entry, self._seqlock)
+                       for store, entry in layout["stores"].items()}
+        self._status = layout["status"]
+
+    def set_status(self, **values):
+        # Texts longer than the slot are cut
+        with self._seqlock:
+            for field, value in values.items():
+                offset = self._status[field]
+                data = str(value).encode("utf-8")[:STATUS_SIZE - 2]
+                self._shm.buf[offset:offset + 2] = len(data).to_bytes(2, "little")
+                self._shm.buf[offset + 2:offset + 2 + len(data)] = data
+
+    def close(self):
+        # Removes the block, readers keep their mapping until they close it
+        self.stores = {}
+        self._header = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # Views still held elsewhere, the mapping goes with the process
+        self._shm.unlink()
+        _created.discard(self._shm._name)
+
+
+class SharedSeriesView:
+    """
+    Read only view of a SharedSeriesStore in another process, returning
+    its columns in chronological order without copying them.
+    """
+
+    def __init__(self, buffer, layout):
+        self.capacity = layout["capacity"]
+        self.columns = tuple(column for column, _, _ in layout["columns"])
+        self._state = np.ndarray(2, dtype=np.int64, buffer=buffer, offset=layout["state"])
+        self._data = {}
+        for column, dtype, offset in layout["columns"]:
+            array = np.ndarray(2 * self.capacity, dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+            array.flags.writeable = False
+            self._data[column] = array
+        self._pinned = None  # Head and count used by every column during a read
+
+    def _pin(self):
+        self._pinned = (int(self._state[0]), int(self._state[1]))
+
+    def _unpin(self):
+        self._pinned = None
+
+    def __len__(self):
+        if self._pinned is not None:
+            return self._pinned[1]
+        return int(self._state[1])
+
+    def __getitem__(self, name):
+        head, count = self._pinned or (int(value) for value in self._state)
+        end = head + self.capacity
+        return self._data[name][end - count:end]
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists but belongs to another user
+    return True
+
+
+def remove_stale(name):
+    # Removes a block left behind by a writer that did not exit cleanly,
+    # returns whether there was one. Raises FileExistsError if the writer
+    # that created it is still running.
+    try:
+        stale = SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=stale.buf)
+    pid = int(header[2])
+    del header
+    stale.close()
+    if pid and _process_alive(pid):
+        # Left to its writer, which the resource tracker must not remove it for
+        if stale._name not in _created:
+            resource_tracker.unregister(stale._name, "shared_memory")
+        raise FileExistsError(f"Shared memory {name} is in use by process {pid}")
+    stale.unlink()
+    return True
+
+
+def _attach(name):
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 an attached block is registered with the
+        # resource tracker, which would remove it when this process exits.
+        # The writer's registration is shared by a reader in its process.
+        shm = SharedMemory(name=name)
+        if shm._name not in _created:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class LiveViewReader:
+    """
+    Maps the block of a LiveViewWriter. Data is only read inside read(),
+    which retries until it has seen a consistent state, so the writer never
+    waits for a reader.
+    """
+
+    def __init__(self, name=DEFAULT_SHARED_MEMORY_NAME):
+        self._shm = _attach(name)
+        buffer = self._shm.buf
+        self._header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=buffer)
+        self._header.flags.writeable = False
+        length = int(self._header[1])
+        if not length:
+            # Created but not filled in yet by the writer
+            self._header = None
+            self._shm.close()
+            raise FileNotFoundError(f"Shared memory {name} is not initialised yet")
+        layout = json.loads(bytes(buffer[DESCRIPTOR_OFFSET:DESCRIPTOR_OFFSET + length]))
+        self.stores = {store: SharedSeriesView(buffer, entry) for store, entry in layout["stores"].items()}
+        self._status = layout["status"]
+
+    @property
+    def version(self):
+        # Changes with every write, nothing needs redrawing while it is the same
+        return int(self._header[0])
+
+    def __getitem__(self, store):
+        return self.stores[store]
+
+    def read(self, func, *args, timeout=READ_TIMEOUT):
+        # Calls func(self, *args) until no write happened while it ran and
+        # returns its result. func must not keep the views it is given, only
+        # what it computes from them. Every column of a store has the same
+        # length during one call, and an exception raised on data changed
+        # meanwhile only leads to another call. Raises TimeoutError when no
+        # consistent state was seen within timeout seconds, as when the
+        # writer died in the middle of a write.
+        deadline = time.monotonic() + timeout
+        while True:
+            if time.monotonic() > deadline:
+                raise TimeoutError("Shared memory writer did not finish its write")
+            before = int(self._header[0])
+            if before & 1:
+                time.sleep(RETRY_DELAY)
+                continue
+            for store in self.stores.values():
+                store._pin()
+            try:
+                result = func(self, *args)
+            except Exception:
+                if int(self._header[0]) == before:
+                    raise
+                continue
+            finally:
+                for store in self.stores.values():
+                    store._unpin()
+            if int(self._header[0]) == before:
+                return result
+
+    def _read_status(self, _):
+        buffer = self._shm.buf
+        status = {}
+        for field, offset in self._status.items():
+            length = int.from_bytes(buffer[offset:offset + 2], "little")
+            status[field] = bytes(buffer[offset + 2:offset + 2 + length]).decode("utf-8", "replace")
+        return status
+
+    def status(self):
+        return self.read(self._read_status)
+
+    def close(self):
+        self.stores = {}
+        self._header = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
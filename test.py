@@ -3,8 +3,8 @@
     Basic test script to demonstrate active mode of the plantower
 """
 
-import time
 import plantower
+from plantower.warmup import wait_until_ready
 from utils import find_serial_port
 
 
@@ -16,7 +16,7 @@ print("Making sure it's correctly setup for active mode. Please wait")
 #Not needed if freshly plugged in
 PLANTOWER.mode_change(plantower.PMS_ACTIVE_MODE) #change back into active mode
 PLANTOWER.set_to_wakeup() #ensure fan is spinning
-time.sleep(30) # give it a chance to stabilise
+wait_until_ready(PLANTOWER) # give it a chance to stabilise, at most 30s
 
 new_serial_port = find_serial_port()
 if new_serial_port != serial_port:
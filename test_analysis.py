@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+    Unit tests of the offline analysis, whose results must not depend on
+    how a recording is cut into chunks
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from plantower.analysis import analyse, nowcast
+from plantower.emulator import encode_frame
+from plantower.recorder import FrameRecorder
+
+START_NS = 1700000000 * 10**9 + 1234 * 10**9 # Not aligned to any chunk
+PERIOD_NS = 7 * 10**9
+COUNT = 3000 # About 6 hours
+BAD = set(range(500, 3000, 257)) | {1028, 1029} # A few near chunk starts
+
+
+class AnalysisTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory, "sensor.rec")
+        rng = random.Random(1)
+        pm = 30
+        cls.timestamps = []
+        cls.pm25 = []
+        with FrameRecorder(cls.path) as recorder:
+            for i in range(COUNT):
+                pm = max(pm + rng.randint(-3, 3), 0)
+                frame = bytearray(encode_frame([pm] * 12))
+                timestamp_ns = START_NS + i * PERIOD_NS
+                if i in BAD:
+                    frame[-1] ^= 0xff
+                else:
+                    cls.timestamps.append(timestamp_ns)
+                    cls.pm25.append(pm)
+                recorder.write(bytes(frame), timestamp_ns)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def assert_same_aqi(self, actual, desired):
+        np.testing.assert_array_equal(actual["timestamp"], desired["timestamp"])
+        for name in ("concentration", "aqi"):
+            np.testing.assert_allclose(actual[name], desired[name], rtol=1e-12)
+        np.testing.assert_array_equal(actual["category"], desired["category"])
+
+    def analyse(self, chunk_sec):
+        return analyse([self.path], chunk_sec=chunk_sec, workers=1)[self.path]
+
+    def test_chunking_does_not_change_results(self):
+        whole = self.analyse(10**6)
+        for chunk_sec in (3600, 1800, 1000):
+            chunked = self.analyse(chunk_sec)
+            self.assert_same_aqi(chunked.aqi, whole.aqi)
+            self.assertEqual(chunked.bad_frames, whole.bad_frames)
+            for name, statistics in whole.fields.items():
+                other = chunked.fields[name]
+                self.assertEqual(other.count, statistics.count, name)
+                self.assertEqual(other.min, statistics.min, name)
+                self.assertEqual(other.max, statistics.max, name)
+                self.assertAlmostEqual(other.mean, statistics.mean, places=9)
+                self.assertAlmostEqual(other.std, statistics.std, places=9)
+
+    def test_every_frame_is_counted_once(self):
+        result = self.analyse(1000)
+        self.assertEqual(result.bad_frames, len(BAD))
+        self.assertEqual(len(result.aqi), COUNT - len(BAD))
+        self.assertEqual(result.fields["pm25_cf1"].count, COUNT - len(BAD))
+
+    def test_worker_processes_give_the_same_result(self):
+        local = self.analyse(3600)
+        pooled = analyse([self.path], chunk_sec=3600, workers=2)[self.path]
+        self.assert_same_aqi(pooled.aqi, local.aqi)
+        self.assertEqual(pooled.summary(), local.summary())
+
+    def test_nowcast_first_matches_the_full_series(self):
+        timestamps = np.array(self.timestamps, dtype=np.int64)
+        full = nowcast(timestamps, self.pm25)
+        np.testing.assert_allclose(nowcast(timestamps, self.pm25, first=1000), full[1000:], rtol=1e-12)
+        self.assertTrue(np.isnan(full[0]))
+        self.assertFalse(np.isnan(full[1:]).any())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+    Unit tests of the AQI breakpoint tables, single values and arrays
+"""
+
+import unittest
+
+import numpy as np
+
+from plantower.aqi import (
+    PM25, PM25_2024, PM10,
+    MODE_NONE, MODE_CLAMP, MODE_EXTRAPOLATE,
+    CATEGORY_UNKNOWN,
+    concentration_to_aqi, aqi_category, aqi_categories, batch_aqi
+)
+
+# Concentration, AQI at both ends of every row
+PM25_EDGES = (
+    (0.0, 0), (12.0, 50), (12.1, 51), (35.4, 100), (35.5, 101),
+    (55.4, 150), (55.5, 151), (150.4, 200), (150.5, 201), (250.4, 300),
+    (250.5, 301), (350.4, 400), (350.5, 401), (500.4, 500))
+PM25_2024_EDGES = (
+    (9.0, 50), (9.1, 51), (35.4, 100), (35.5, 101), (55.4, 150), (55.5, 151),
+    (125.4, 200), (125.5, 201), (225.4, 300), (225.5, 301), (325.4, 500))
+PM10_EDGES = (
+    (0, 0), (54, 50), (55, 51), (154, 100), (155, 101), (254, 150),
+    (255, 151), (354, 200), (355, 201), (424, 300), (425, 301), (504, 400),
+    (505, 401), (604, 500))
+
+
+class BreakpointTest(unittest.TestCase):
+
+    def check_edges(self, table, edges):
+        concentrations = [concentration for concentration, _ in edges]
+        expected = [float(aqi) for _, aqi in edges]
+        self.assertEqual([table.aqi(c) for c in concentrations], expected)
+        self.assertEqual(table.aqi_array(concentrations).tolist(), expected)
+
+    def test_pm25_edges(self):
+        self.check_edges(PM25, PM25_EDGES)
+
+    def test_pm25_2024_edges(self):
+        self.check_edges(PM25_2024, PM25_2024_EDGES)
+
+    def test_pm10_edges(self):
+        self.check_edges(PM10, PM10_EDGES)
+
+    def test_truncated_not_rounded(self):
+        # Values between two rows belong to the lower one
+        for concentration, aqi in ((350.45, 400), (350.49, 400), (12.09, 50), (35.45, 100)):
+            self.assertEqual(PM25.aqi(concentration), aqi)
+            self.assertEqual(PM25.aqi_array([concentration])[0], aqi)
+        self.assertEqual(PM10.aqi(54.9), 50)
+
+    def test_negative_is_zero(self):
+        self.assertEqual(PM25.aqi(-3), 0)
+        self.assertEqual(PM25.aqi_array([-3])[0], 0)
+
+    def test_above_the_table(self):
+        self.assertIsNone(PM25.aqi(500.5, MODE_NONE))
+        self.assertTrue(np.isnan(PM25.aqi_array([500.5], MODE_NONE)[0]))
+        self.assertEqual(PM25.aqi(600, MODE_CLAMP), 500)
+        self.assertEqual(PM25.aqi_array([600], MODE_CLAMP)[0], 500)
+        extrapolated = PM25.aqi(600, MODE_EXTRAPOLATE)
+        self.assertGreater(extrapolated, 500)
+        self.assertEqual(PM25.aqi_array([600], MODE_EXTRAPOLATE)[0], extrapolated)
+
+    def test_missing_concentration(self):
+        self.assertIsNone(concentration_to_aqi(None))
+        self.assertIsNone(concentration_to_aqi(float("nan")))
+        self.assertTrue(np.isnan(PM25.aqi_array([np.nan], MODE_NONE)[0]))
+
+    def test_scalars_and_arrays_agree(self):
+        concentrations = np.round(np.linspace(0, 520, 5201), 1)
+        expected = [PM25.aqi(c, MODE_CLAMP) for c in concentrations]
+        self.assertEqual(PM25.aqi_array(concentrations, MODE_CLAMP).tolist(), expected)
+
+    def test_shape_is_kept(self):
+        self.assertEqual(PM25.aqi_array(350.5).shape, ())
+        self.assertEqual(float(PM25.aqi_array(350.5)), 401)
+        grid = PM25.aqi_array([[12.0, 12.1], [350.4, 350.5]])
+        self.assertEqual(grid.tolist(), [[50, 51], [400, 401]])
+        self.assertEqual(PM25.aqi_array([]).shape, (0,))
+
+
+class CategoryTest(unittest.TestCase):
+
+    def test_category_edges(self):
+        aqi = [0, 50, 50.1, 100, 101, 150, 151, 200, 201, 300, 301, 500]
+        expected = [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+        self.assertEqual([aqi_category(value) for value in aqi], expected)
+        self.assertEqual(aqi_categories(aqi).tolist(), expected)
+
+    def test_unknown(self):
+        self.assertEqual(aqi_category(None), CATEGORY_UNKNOWN)
+        self.assertEqual(aqi_categories([np.nan, -1]).tolist(), [CATEGORY_UNKNOWN] * 2)
+
+    def test_batch_takes_the_highest_pollutant(self):
+        result = batch_aqi(pm25=[12.0, 350.5], pm10=[55, 0])
+        self.assertEqual(result["aqi"].tolist(), [51, 401])
+        self.assertEqual(result["category"].tolist(), [1, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
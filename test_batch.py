@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+    Unit tests of the NumPy batch decoder against PlantowerReading
+"""
+
+import random
+import unittest
+
+import numpy as np
+
+from plantower.plantower import PlantowerReading, PlantowerException, READING_FIELDS
+from plantower.batch import decode_frames, decode_columns
+from plantower.emulator import encode_frame
+
+
+def random_frames(count, seed=1):
+    rng = random.Random(seed)
+    return [encode_frame([rng.randrange(0x10000) for _ in READING_FIELDS])
+            for _ in range(count)]
+
+
+class BatchDecodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = random_frames(50)
+        self.timestamps = [1700000000 * 10**9 + i * 10**9 for i in range(50)]
+
+    def test_fields_match_reading(self):
+        decoded = decode_frames(b"".join(self.frames), self.timestamps)
+        for row, frame, timestamp_ns in zip(decoded, self.frames, self.timestamps):
+            reading = PlantowerReading(frame, timestamp_ns)
+            for name in READING_FIELDS:
+                self.assertEqual(int(row[name]), getattr(reading, name), name)
+            self.assertEqual(int(row["timestamp"].astype(np.int64)), reading.timestamp_ns)
+
+    def test_matrix_and_buffer_inputs_agree(self):
+        data = b"".join(self.frames)
+        matrix = np.frombuffer(data, dtype=np.uint8).reshape(-1, 32)
+        np.testing.assert_array_equal(
+            decode_frames(data, self.timestamps), decode_frames(matrix, self.timestamps))
+
+    def test_datetime64_timestamps(self):
+        timestamps = np.array(self.timestamps, dtype="datetime64[ns]")
+        decoded = decode_frames(b"".join(self.frames), timestamps)
+        np.testing.assert_array_equal(decoded["timestamp"], timestamps)
+
+    def test_columns_match_frames(self):
+        data = b"".join(self.frames)
+        rows = decode_frames(data, self.timestamps)
+        columns = decode_columns(data, self.timestamps)
+        for name in ("timestamp",) + READING_FIELDS:
+            np.testing.assert_array_equal(columns[name], rows[name])
+
+    def test_no_timestamps_gives_nat(self):
+        decoded = decode_frames(self.frames[0])
+        self.assertTrue(np.isnat(decoded["timestamp"][0]))
+
+    def test_partial_frame_is_rejected(self):
+        with self.assertRaises(PlantowerException):
+            decode_frames(b"".join(self.frames)[:-1])
+
+    def test_timestamp_count_is_checked(self):
+        with self.assertRaises(PlantowerException):
+            decode_frames(b"".join(self.frames), self.timestamps[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+    Unit tests of the scalar and vectorised checksum checks
+"""
+
+import random
+import unittest
+
+import numpy as np
+
+from plantower.plantower import checksum_ok, READING_FIELDS
+from plantower.batch import verify_frames, decode_valid_frames
+from plantower.emulator import encode_frame
+
+
+class ChecksumTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(2)
+        self.frames = []
+        self.valid = []
+        for i in range(200):
+            frame = bytearray(encode_frame(
+                [rng.randrange(0x10000) for _ in READING_FIELDS]))
+            if i % 3 == 1:
+                frame[rng.randrange(2, 30)] ^= 1 << rng.randrange(8) # Data bit
+            elif i % 3 == 2 and i % 2:
+                frame[-2] ^= 0x80 # High byte of the checksum
+            self.frames.append(bytes(frame))
+            self.valid.append(i % 3 == 0 or (i % 3 == 2 and not i % 2))
+
+    def test_scalar_check(self):
+        self.assertEqual([checksum_ok(frame) for frame in self.frames], self.valid)
+
+    def test_mask_matches_scalar_check(self):
+        mask = verify_frames(b"".join(self.frames))
+        self.assertEqual(mask.dtype, np.bool_)
+        self.assertEqual(mask.tolist(), self.valid)
+
+    def test_largest_sum_does_not_wrap(self):
+        # 30 bytes of 0xff sum to more than a byte or a 12 bit value holds
+        frame = encode_frame([0xffff] * len(READING_FIELDS), reserved=0xffff)
+        self.assertTrue(checksum_ok(frame))
+        self.assertTrue(verify_frames(frame)[0])
+
+    def test_checksum_bytes_are_big_endian(self):
+        frame = bytearray(encode_frame(list(range(12))))
+        frame[-2], frame[-1] = frame[-1], frame[-2]
+        self.assertFalse(checksum_ok(bytes(frame)))
+        self.assertFalse(verify_frames(bytes(frame))[0])
+
+    def test_valid_frames_keep_their_timestamps(self):
+        timestamps = np.arange(len(self.frames), dtype=np.int64) * 10**9
+        decoded, bad = decode_valid_frames(b"".join(self.frames), timestamps)
+        self.assertEqual(bad, self.valid.count(False))
+        np.testing.assert_array_equal(
+            decoded["timestamp"].astype(np.int64), timestamps[np.array(self.valid)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+    Unit tests of the incremental NowCast against a computation from scratch
+"""
+
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from nowcast import NowCastEngine
+from plantower.aqi import concentration_to_aqi
+
+WINDOW_SEC = 120 # Shorter than the live 10 minutes so it slides many times
+
+
+def from_scratch(samples, window_sec):
+    # Weighted average of the samples no older than the window before the
+    # last one, recomputed in full
+    last = samples[-1][0]
+    window = [(t, value) for t, value in samples
+              if last - t <= timedelta(seconds=window_sec)]
+    if len(window) < 2:
+        return None
+    high = max(value for _, value in window)
+    low = min(value for _, value in window)
+    weight_factor = max(1 - ((high - low) / high if high else 0), 0.5)
+    weights = [weight_factor ** ((last - t).total_seconds() / window_sec)
+               for t, _ in window]
+    return sum(w * value for w, (_, value) in zip(weights, window)) / sum(weights)
+
+
+def random_samples(count, seed, start=60, step=2):
+    rng = random.Random(seed)
+    t = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    value = start
+    samples = []
+    for _ in range(count):
+        t += timedelta(seconds=1, microseconds=rng.randrange(500000))
+        value = max(value + rng.randint(-step, step), 0)
+        samples.append((t, value))
+    return samples
+
+
+class NowCastTest(unittest.TestCase):
+
+    def check(self, samples, window_sec=WINDOW_SEC):
+        engine = NowCastEngine(window_sec)
+        oldest = 0 # Only bounds the work of from_scratch, which filters too
+        for i, (t, value) in enumerate(samples):
+            engine.add(t, value)
+            while t - samples[oldest][0] > timedelta(seconds=2 * window_sec):
+                oldest += 1
+            expected = from_scratch(samples[oldest:i + 1], window_sec)
+            result = engine.concentration()
+            if expected is None:
+                self.assertIsNone(result)
+                continue
+            self.assertAlmostEqual(result, expected, delta=1e-9 * max(expected, 1))
+            self.assertEqual(concentration_to_aqi(result), concentration_to_aqi(expected))
+
+    def test_random_walk(self):
+        # Long enough for the window to slide and the sums to be rebased
+        self.check(random_samples(1000, seed=1))
+
+    def test_live_window(self):
+        self.check(random_samples(900, seed=5), window_sec=600)
+
+    def test_steep_changes_hit_the_weight_floor(self):
+        self.check(random_samples(600, seed=2, start=5, step=40))
+
+    def test_zero_concentration(self):
+        t = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.check([(t + timedelta(seconds=i), 0) for i in range(30)])
+
+    def test_gap_longer_than_the_window(self):
+        samples = random_samples(300, seed=3)
+        later = samples[-1][0] + timedelta(seconds=3 * WINDOW_SEC)
+        samples += [(t - samples[0][0] + later, value) for t, value in samples]
+        self.check(samples)
+
+    def test_short_window(self):
+        self.check(random_samples(500, seed=4), window_sec=20)
+
+    def test_single_sample_has_no_concentration(self):
+        engine = NowCastEngine(WINDOW_SEC)
+        self.assertIsNone(engine.concentration())
+        engine.add(datetime(2024, 1, 1, tzinfo=timezone.utc), 12)
+        self.assertIsNone(engine.concentration())
+        self.assertEqual(len(engine), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+    Unit tests of the incremental frame parser, no sensor needed
+"""
+
+import struct
+import unittest
+
+from plantower.plantower import PlantowerFrameParser, FRAME_HEADER, FRAME_LENGTH
+from plantower.emulator import encode_frame
+
+
+def frame(base):
+    return encode_frame([base + i for i in range(12)])
+
+
+def bad_length_frame():
+    # Right header and checksum but a length field that is not 28
+    body = FRAME_HEADER + struct.pack(">H12HH", 100, *range(13))
+    return body + struct.pack(">H", sum(body))
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_frames_fed_one_byte_at_a_time(self):
+        frames = [frame(i) for i in range(3)]
+        parser = PlantowerFrameParser()
+        found = []
+        for byte in b"".join(frames):
+            parser.feed(bytes([byte]))
+            found.extend(parser.frames())
+        self.assertEqual(found, frames)
+        self.assertEqual(parser.frames_ok, 3)
+        self.assertEqual(parser.bytes_discarded, 0)
+
+    def test_resync_after_garbage(self):
+        garbage = b"\x00\x11\x42\x22\x4d\x33"
+        parser = PlantowerFrameParser()
+        parser.feed(garbage + frame(1) + garbage + frame(2))
+        self.assertEqual(list(parser.frames()), [frame(1), frame(2)])
+        self.assertEqual(parser.bytes_discarded, 2 * len(garbage))
+        self.assertEqual(parser.bad_checksums, 0)
+
+    def test_header_split_across_feeds(self):
+        data = frame(5)
+        parser = PlantowerFrameParser()
+        parser.feed(b"\x00" + data[:1])
+        self.assertIsNone(parser.next_frame())
+        parser.feed(data[1:])
+        self.assertEqual(parser.next_frame(), data)
+        self.assertEqual(parser.bytes_discarded, 1)
+
+    def test_false_header_overlapping_a_frame(self):
+        # A stray header whose 32 bytes run into the real frame is skipped
+        # and the real frame is still found
+        parser = PlantowerFrameParser()
+        parser.feed(FRAME_HEADER + b"\x00" * 10 + frame(7))
+        self.assertEqual(list(parser.frames()), [frame(7)])
+        self.assertEqual(parser.bad_checksums, 1)
+        self.assertEqual(parser.bytes_discarded, 12)
+
+    def test_bad_length_is_dropped(self):
+        parser = PlantowerFrameParser()
+        parser.feed(bad_length_frame() + frame(3))
+        self.assertEqual(list(parser.frames()), [frame(3)])
+        self.assertEqual(parser.bad_checksums, 1)
+        self.assertEqual(parser.frames_ok, 1)
+
+    def test_bad_checksum_is_dropped(self):
+        corrupt = bytearray(frame(4))
+        corrupt[-1] ^= 0xff
+        parser = PlantowerFrameParser()
+        parser.feed(bytes(corrupt) + frame(6))
+        self.assertEqual(list(parser.frames()), [frame(6)])
+        self.assertEqual(parser.bad_checksums, 1)
+
+    def test_partial_frame_waits_for_more(self):
+        data = frame(8)
+        parser = PlantowerFrameParser()
+        parser.feed(data[:20])
+        self.assertIsNone(parser.next_frame())
+        self.assertEqual(parser.bytes_needed(), FRAME_LENGTH - 20)
+        parser.feed(data[20:])
+        self.assertEqual(parser.next_frame(), data)
+
+    def test_reset_drops_partial_frame(self):
+        parser = PlantowerFrameParser()
+        parser.feed(frame(9)[:20])
+        parser.reset()
+        parser.feed(frame(10))
+        self.assertEqual(list(parser.frames()), [frame(10)])
+        self.assertEqual(parser.bytes_discarded, 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,8 +3,8 @@
     Basic test script to demonstrate passive mode of the plantower
 """
 from argparse import ArgumentParser
-import time
 import plantower
+from plantower.warmup import wait_until_ready
 from utils import find_serial_port
 
 
@@ -23,7 +23,7 @@ print("Setting sensor into passive mode. Please wait.")
 PLANTOWER.mode_change(plantower.PMS_PASSIVE_MODE) #change into passive mode
 
 PLANTOWER.set_to_wakeup() #spin up the fan
-time.sleep(30) #give the sensor a chance to settle
+wait_until_ready(PLANTOWER, passive=True) #give the sensor a chance to settle, at most 30s
 
 new_serial_port = find_serial_port()
 if new_serial_port != serial_port:
@@ -5,6 +5,7 @@
 import time
 from argparse import ArgumentParser
 import plantower
+from plantower.warmup import wait_until_ready
 
 
 PARSER = ArgumentParser(
@@ -23,8 +24,8 @@ time.sleep(15)
 print("Waking back up. Please wait")
 PLANTOWER.set_to_wakeup() # Start the fan in the sensor
 PLANTOWER.mode_change(plantower.PMS_PASSIVE_MODE)
-time.sleep(30) # Give the readings a chance to settle after fan spin up
-#30s is suggested in the datasheet
+wait_until_ready(PLANTOWER, passive=True) # Give the readings a chance to settle after fan spin up
+#30s is suggested in the datasheet and used as the upper bound
 
 RESULT = PLANTOWER.read_in_passive() # request data in passive mode
 PLANTOWER.set_to_sleep() # turn fan off again